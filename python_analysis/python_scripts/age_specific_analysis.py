@@ -5,37 +5,26 @@ import os
 import seaborn as sns
 from matplotlib.colors import LinearSegmentedColormap
 
-# Create directories for outputs
-os.makedirs('../figures', exist_ok=True)
-os.makedirs('../docs', exist_ok=True)
-
-# Load the summary data
-summary_df = pd.read_csv('../tables/readable_summary.csv')
-
-# Fix the diastolic blood pressure and glucose metabolism labels
-summary_df.loc[summary_df['Risk Factor'] == 'bp_di', 'Risk Factor'] = 'Diastolic Blood Pressure'
-summary_df.loc[summary_df['Risk Factor'] == 'glc_met', 'Risk Factor'] = 'Glucose Metabolism'
-
-# Remove rows with NaN coefficients
-summary_df = summary_df.dropna(subset=['Coefficient (95% CI)'])
-
-# Extract numeric coefficient from the string format
-def extract_coefficient(coef_str):
-    return float(coef_str.split(' ')[0])
+from factor_metadata import exposure_description, exposure_suffix, exposure_title, stratum_suffix
+from output_sink import flush_outputs, write_csv
+from paths import DOCS_DIR, FIGURES_DIR, TABLES_DIR
+from render import figure_selected, finalise_layout, save_figure
+from results_store import compare_exposures, load_summary
+from report_builder import render_age_specific_findings, write_report
+from shrinkage import coefficient_label
 
-summary_df['Coefficient'] = summary_df['Coefficient (95% CI)'].apply(extract_coefficient)
-
-# Extract p-value as numeric
-summary_df['P-value_numeric'] = summary_df['P-value'].astype(float)
+# Create directories for outputs
+os.makedirs(FIGURES_DIR, exist_ok=True)
+os.makedirs(DOCS_DIR, exist_ok=True)
 
-# Create significance indicator
-summary_df['Significant'] = summary_df['P-value_numeric'] < 0.05
+# Load the results dataset (numeric coefficients, p-values and significance indicator included)
+summary_df = load_summary()
 
-# Group data by age
-age_groups = summary_df.groupby('Age')
+# Group data by exposure and age
+age_groups = summary_df.groupby(['IQ_Var', 'Age'])
 
 # Function to analyse data by age
-def analyse_by_age(age, data):
+def analyse_by_age(iq_var, age, data):
     """Analyse the relationship between cognitive ability and cardiovascular risk factors at a specific age."""
     # Sort by absolute coefficient value to see strongest associations first
     sorted_data = data.sort_values(by='Coefficient', key=abs, ascending=False)
@@ -57,9 +46,13 @@ def analyse_by_age(age, data):
     # Identify strongest association
     strongest_idx = sorted_data['Coefficient'].abs().idxmax()
     strongest = sorted_data.loc[strongest_idx]
+
+    # Identify strongest association after empirical-Bayes shrinkage (noisy small-N cells pulled in)
+    strongest_eb = sorted_data.loc[sorted_data['Coefficient_EB'].abs().idxmax()]
     
     # Create summary
     summary = {
+        'IQ_Var': iq_var,
         'Age': age,
         'Total Factors Measured': total_count,
         'Significant Associations': sig_count,
@@ -69,16 +62,24 @@ def analyse_by_age(age, data):
         'Average Effect Size': avg_effect,
         'Strongest Association': strongest['Risk Factor'],
         'Strongest Coefficient': strongest['Coefficient'],
-        'Strongest P-value': strongest['P-value_numeric']
+        'Strongest P-value': strongest['P-value_numeric'],
+        'Strongest Association (EB)': strongest_eb['Risk Factor'],
+        'Strongest Coefficient (EB)': strongest_eb['Coefficient_EB']
     }
     
     return summary, sorted_data
 
-# Analyse each age group
+# Analyse each exposure and age group (kept for the reports so nothing is recomputed)
 age_analyses = []
-for age, data in age_groups:
-    summary, sorted_data = analyse_by_age(age, data)
+age_results = {}
+for (iq_var, age), data in age_groups:
+    summary, sorted_data = analyse_by_age(iq_var, age, data)
     age_analyses.append(summary)
+    age_results.setdefault(iq_var, []).append((summary, sorted_data))
+
+    # Skip the figure if an incremental re-run is restricted to other ages
+    if not figure_selected(ages=[age]):
+        continue
     
     # Create a bar plot for this age
     plt.figure(figsize=(12, 8))
@@ -95,9 +96,9 @@ for age, data in age_groups:
     plt.axvline(x=0, color='black', linestyle='-', alpha=0.3)
     
     # Add labels and title
-    plt.xlabel('Standardised Coefficient')
+    plt.xlabel(coefficient_label())
     plt.ylabel('Cardiovascular Risk Factor')
-    plt.title(f'Association Between Childhood IQ at Age 8 and Cardiovascular Risk Factors at Age {int(age)}')
+    plt.title(f'Association Between {exposure_title(iq_var)} and Cardiovascular Risk Factors at Age {int(age)}')
     
     # Add legend
     from matplotlib.patches import Patch
@@ -130,71 +131,46 @@ for age, data in age_groups:
                      va='center', ha='left', color=text_color, fontweight='bold')
     
     # Adjust layout and save
-    plt.tight_layout()
-    plt.savefig(f'../figures/age_{int(age)}_associations.png', dpi=300, bbox_inches='tight')
-    plt.close()
+    finalise_layout()
+    save_figure(f'{FIGURES_DIR}/age_{int(age)}_associations{exposure_suffix(iq_var)}.png', dpi=300, bbox_inches='tight')
 
 # Create a summary DataFrame for age analyses
 age_summary_df = pd.DataFrame(age_analyses)
-age_summary_df.to_csv('../tables/age_summary.csv', index=False)
+write_csv(age_summary_df, f'{TABLES_DIR}/age_summary{stratum_suffix()}.csv', index=False)
+
+# Compare the exposures side by side for every risk factor and age
+write_csv(compare_exposures(summary_df, ['Risk Factor', 'Age'], ['Coefficient', 'P-value_numeric', 'Significant']),
+          f'{TABLES_DIR}/exposure_comparison_by_age{stratum_suffix()}.csv', index=False)
 
-# Create a heatmap of all associations
-pivot_data = summary_df.pivot(index='Risk Factor', columns='Age', values='Coefficient')
+# Create a heatmap of all associations for each exposure
+pivot_data = summary_df.pivot(index=['IQ_Var', 'Risk Factor'], columns='Age', values='Coefficient')
 
 # Create a custom colormap (blue for negative, red for positive, white for zero)
 colors = ['#1a76c4', '#ffffff', '#e74c3c']  # blue, white, red
 cmap = LinearSegmentedColormap.from_list('custom_diverging', colors, N=256)
 
-plt.figure(figsize=(14, 10))
-ax = sns.heatmap(pivot_data, cmap=cmap, center=0, 
-                 annot=True, fmt='.4f', linewidths=.5, 
-                 cbar_kws={'label': 'Standardised Coefficient'})
+for iq_var, exposure_pivot in pivot_data.groupby(level='IQ_Var'):
+    exposure_pivot = exposure_pivot.droplevel('IQ_Var').dropna(axis=1, how='all')
 
-# Add title and labels
-plt.title('Heatmap of Associations Between Childhood IQ at Age 8 and Cardiovascular Risk Factors Across Ages', 
-          fontsize=14, pad=20)
-plt.xlabel('Age (years)', fontsize=12)
-plt.ylabel('Cardiovascular Risk Factor', fontsize=12)
+    plt.figure(figsize=(14, 10))
+    ax = sns.heatmap(exposure_pivot, cmap=cmap, center=0, 
+                     annot=True, fmt='.4f', linewidths=.5, 
+                     cbar_kws={'label': coefficient_label()})
 
-# Adjust layout and save
-plt.tight_layout()
-plt.savefig('../figures/all_ages_heatmap.png', dpi=300, bbox_inches='tight')
-plt.close()
+    # Add title and labels
+    plt.title(f'Heatmap of Associations Between {exposure_title(iq_var)} and Cardiovascular Risk Factors Across Ages', 
+              fontsize=14, pad=20)
+    plt.xlabel('Age (years)', fontsize=12)
+    plt.ylabel('Cardiovascular Risk Factor', fontsize=12)
 
-# Create a summary of findings by age
-with open('../docs/age_specific_findings.md', 'w') as f:
-    f.write('# Age-Specific Analysis of Childhood Cognitive Ability and Cardiovascular Risk Factors\n\n')
-    
-    for age, data in age_groups:
-        summary, sorted_data = analyse_by_age(age, data)
-        
-        f.write(f'## Age {int(age)} Analysis\n\n')
-        
-        # Overview
-        f.write(f"### Overview\n")
-        f.write(f"At age {int(age)}, {summary['Total Factors Measured']} cardiovascular risk factors were measured. ")
-        f.write(f"Of these, {summary['Significant Associations']} ({summary['Percent Significant']:.1f}%) ")
-        f.write(f"showed a statistically significant association with childhood IQ measured at age 8.\n\n")
-        
-        # Direction of associations
-        f.write(f"### Direction of Associations\n")
-        f.write(f"- Negative associations (higher IQ, lower risk factor): {summary['Negative Associations']}\n")
-        f.write(f"- Positive associations (higher IQ, higher risk factor): {summary['Positive Associations']}\n\n")
-        
-        # Strongest associations
-        f.write(f"### Strongest Associations\n")
-        f.write(f"The strongest association was with {summary['Strongest Association']} ")
-        f.write(f"(coefficient = {summary['Strongest Coefficient']:.4f}, p = {summary['Strongest P-value']:.4f}).\n\n")
-        
-        # Detailed findings
-        f.write(f"### Detailed Findings\n")
-        f.write("| Risk Factor | Coefficient | P-value | Significant |\n")
-        f.write("|-------------|-------------|---------|-------------|\n")
-        
-        for _, row in sorted_data.sort_values(by='Coefficient', key=abs, ascending=False).iterrows():
-            sig_mark = "Yes" if row['Significant'] else "No"
-            f.write(f"| {row['Risk Factor']} | {row['Coefficient']:.4f} | {row['P-value_numeric']:.4f} | {sig_mark} |\n")
-        
-        f.write("\n\n")
+    # Adjust layout and save
+    finalise_layout()
+    save_figure(f'{FIGURES_DIR}/all_ages_heatmap{exposure_suffix(iq_var)}.png', dpi=300, bbox_inches='tight')
+
+# Create a summary of findings by age for each exposure
+for iq_var, results in age_results.items():
+    write_report(f'{DOCS_DIR}/age_specific_findings{exposure_suffix(iq_var)}.md',
+                 render_age_specific_findings(results, exposure_description(iq_var)))
 
+flush_outputs()
 print("Age-specific analysis complete.")
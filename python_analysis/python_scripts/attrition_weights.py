@@ -0,0 +1,103 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy.special import expit
+
+from cohort_data import COHORT_FILE, load_cohort
+from factor_metadata import DEFAULT_IQ_VAR, outcome_ages
+from output_sink import flush_outputs, write_csv
+from paths import TABLES_DIR
+from regression_engine import FACTOR_COVARIATES, indicator_columns
+
+# Baseline characteristics predicting attendance at a clinic (categorical ones enter as indicators)
+RESPONSE_COVARIATES = (f'z_{DEFAULT_IQ_VAR}',) + tuple(FACTOR_COVARIATES)
+
+# Summary of the fitted response models
+WEIGHTS_SUMMARY_FILE = f'{TABLES_DIR}/attrition_weights_summary.csv'
+
+
+def fit_logistic(X, y, max_iter=50, tol=1e-10):
+    """Logistic regression by iteratively reweighted least squares; returns the coefficients."""
+    beta = np.zeros(X.shape[1])
+    for _ in range(max_iter):
+        p = expit(X @ beta)
+        step = np.linalg.solve(X.T @ (X * (p * (1 - p))[:, None]), X.T @ (y - p))
+        beta += step
+        if np.abs(step).max() < tol:
+            break
+    return beta
+
+
+class AttritionWeights:
+    """Stabilised inverse-probability-of-response weights, one response model per clinic wave.
+
+    A participant responded at a wave if their age at that clinic was recorded. The response
+    model depends only on the wave and the covariate set, so it is fitted once per
+    ``(wave, covariates)`` and the weights are shared by every outcome and exposure at that wave.
+    """
+
+    def __init__(self, cohort, covariates=RESPONSE_COVARIATES):
+        self.cohort = cohort
+        self.covariates = tuple(covariates)
+        self._cache = {}
+
+    def response_design(self, covariates):
+        """Design of the response model and the rows on which it is defined (complete covariates)."""
+        complete = self.cohort[list(covariates)].notna().all(axis=1).to_numpy()
+        sample = self.cohort.loc[complete]
+        columns = [np.ones(len(sample))]
+        for covariate in covariates:
+            values = sample[covariate].to_numpy()
+            if covariate in FACTOR_COVARIATES:
+                columns.extend(indicator_columns(values))
+            else:
+                columns.append(values.astype(float))
+        return np.column_stack(columns), complete
+
+    def fit(self, wave, covariates=None):
+        """Fitted response model of ``wave``: weights (NaN for non-responders) and a summary row."""
+        covariates = self.covariates if covariates is None else tuple(covariates)
+        key = (wave, covariates)
+        if key not in self._cache:
+            X, complete = self.response_design(covariates)
+            responded = self.cohort.loc[complete, f'age_{wave}'].notna().to_numpy()
+            p = expit(X @ fit_logistic(X, responded.astype(float)))
+
+            weights = pd.Series(np.nan, index=self.cohort.index)
+            weights[complete] = np.where(responded, responded.mean() / p, np.nan)
+            self._cache[key] = (weights, {
+                'Wave': wave,
+                'Covariates': ' '.join(covariates),
+                'N_Eligible': int(complete.sum()),
+                'N_Responded': int(responded.sum()),
+                'Response_Rate': responded.mean(),
+                'Min_Weight': weights.min(),
+                'Max_Weight': weights.max(),
+                # Kish effective sample size of the weighted responders
+                'Effective_N': weights.sum() ** 2 / (weights ** 2).sum(),
+            })
+        return self._cache[key]
+
+    def weights(self, wave, covariates=None):
+        """Stabilised weights of ``wave`` aligned with the cohort (NaN where no weight is defined)."""
+        return self.fit(wave, covariates)[0]
+
+    def summary(self):
+        """One row per fitted response model."""
+        return pd.DataFrame([row for _, row in self._cache.values()])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fit the attrition response model of every clinic wave.')
+    parser.add_argument('--data', default=COHORT_FILE, help='ALSPAC .dta extract (default: %(default)s)')
+    parser.add_argument('--covariates', nargs='+', default=list(RESPONSE_COVARIATES),
+                        help='predictors of response (default: %(default)s)')
+    args = parser.parse_args()
+
+    attrition = AttritionWeights(load_cohort(args.data), args.covariates)
+    for wave in sorted({age for ages in outcome_ages.values() for age in ages}):
+        attrition.fit(wave)
+    write_csv(attrition.summary(), WEIGHTS_SUMMARY_FILE, index=False)
+    flush_outputs()
+    print(attrition.summary().to_string(index=False))
@@ -0,0 +1,187 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from cohort_data import load_cohort
+from factor_metadata import DEFAULT_IQ_VAR, factor_category, outcome_ages, period_bins, period_labels, risk_categories
+from output_sink import flush_outputs, write_csv
+from paths import TABLES_DIR
+from regression_engine import FACTOR_COVARIATES
+from results_store import load_summary
+
+# Pooled effect of every exposure x risk category x developmental period, and the correlations
+# between the IQ coefficients of different outcomes estimated from the cohort (--data)
+POOLED_FILE = f'{TABLES_DIR}/pooled_category_effects.csv'
+CORRELATION_FILE = f'{TABLES_DIR}/estimate_correlations.csv'
+
+# Correlation assumed between two coefficients estimated on the same children when the cohort
+# has not been used to estimate it: outcomes measured at the same clinic, and at different clinics
+SAME_WAVE_CORRELATION = 0.3
+ACROSS_WAVE_CORRELATION = 0.1
+
+# Smallest eigenvalue kept when a correlation block has to be made positive definite
+EIGEN_FLOOR = 1e-6
+
+
+def developmental_period(ages):
+    """Developmental period of each measurement age."""
+    return pd.cut(ages, bins=period_bins, labels=period_labels)
+
+
+def estimate_correlations(cohort, iq_var=DEFAULT_IQ_VAR):
+    """Correlation between the IQ coefficients of every pair of outcomes (factor x age).
+
+    With the same regressors, two coefficients estimated on overlapping samples correlate by
+    about ``r_jk * n_jk / sqrt(n_j * n_k)``: the correlation of the outcomes net of IQ on the
+    ``n_jk`` children in both estimation samples, shrunk by the overlap. All pairwise correlations
+    and overlaps come from a handful of masked cross-products rather than one pass per pair.
+    """
+    outcomes = [(factor, age) for factor, ages in outcome_ages.items() for age in ages]
+    base = cohort[[f'z_{iq_var}'] + FACTOR_COVARIATES].notna().all(axis=1).to_numpy()
+    Z = np.column_stack([cohort[f'z_{factor}_{age}'].to_numpy(float) for factor, age in outcomes])
+    observed = ~np.isnan(Z) & base[:, None] & np.column_stack(
+        [cohort[f'age_{age}'].notna().to_numpy() for _, age in outcomes])
+    M = observed.astype(float)
+    Z = np.where(observed, Z, 0)
+
+    # Partial IQ out of every outcome (on its own sample): the estimates covary through the residuals
+    x = np.where(base, cohort[f'z_{iq_var}'].to_numpy(float), 0)
+    n_j, x_sum = M.sum(axis=0), x @ M
+    slope = ((x @ Z) - x_sum * Z.sum(axis=0) / n_j) / ((x ** 2) @ M - x_sum ** 2 / n_j)
+    Z = np.where(observed, Z - x[:, None] * slope, 0)
+
+    n = M.T @ M
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sums = Z.T @ M
+        squares = (Z ** 2).T @ M
+        cov = Z.T @ Z - sums * sums.T / n
+        var = squares - sums ** 2 / n
+        r = cov / np.sqrt(var * var.T)
+        overlap = n / np.sqrt(np.outer(np.diag(n), np.diag(n)))
+
+    j, k = np.triu_indices(len(outcomes), 1)
+    return pd.DataFrame({
+        'Factor_A': [outcomes[i][0] for i in j],
+        'Age_A': [outcomes[i][1] for i in j],
+        'Factor_B': [outcomes[i][0] for i in k],
+        'Age_B': [outcomes[i][1] for i in k],
+        'N_Overlap': n[j, k].astype(int),
+        'Outcome_Correlation': r[j, k],
+        'Estimate_Correlation': np.nan_to_num(r[j, k] * overlap[j, k]),
+    })
+
+
+def load_correlations(path=CORRELATION_FILE):
+    """Estimated coefficient correlations, or None to fall back on the assumed structure."""
+    return pd.read_csv(path) if os.path.exists(path) else None
+
+
+def outcome_correlation_matrix(factors, ages, correlations=None):
+    """Correlation matrix of the coefficients of the outcomes ``(factors[i], ages[i])``.
+
+    Pairs missing from ``correlations`` take the assumed same-clinic / across-clinic values.
+    """
+    factors, ages = np.asarray(factors), np.asarray(ages)
+    C = np.where(ages[:, None] == ages[None, :], SAME_WAVE_CORRELATION, ACROSS_WAVE_CORRELATION)
+    if correlations is not None:
+        m = len(factors)
+        lookup = correlations.set_index(['Factor_A', 'Age_A', 'Factor_B', 'Age_B'])['Estimate_Correlation']
+        pairs = pd.MultiIndex.from_arrays([factors.repeat(m), ages.repeat(m), np.tile(factors, m), np.tile(ages, m)])
+        estimated = lookup.reindex(pairs).to_numpy(float).reshape(m, m)
+        estimated = np.where(np.isnan(estimated), estimated.T, estimated)
+        C = np.where(np.isnan(estimated), C, estimated)
+    np.fill_diagonal(C, 1)
+    return C
+
+
+def positive_definite(R):
+    """Clip the eigenvalues of a stack of correlation matrices and restore their unit diagonal."""
+    w, U = np.linalg.eigh(R)
+    if (w >= EIGEN_FLOOR).all():
+        return R
+    R = U @ (np.maximum(w, EIGEN_FLOOR)[..., None] * np.swapaxes(U, -1, -2))
+    d = np.sqrt(np.diagonal(R, axis1=-2, axis2=-1))
+    return R / (d[..., :, None] * d[..., None, :])
+
+
+def pool_categories(summary_df, correlations=None):
+    """Pooled IQ effect of every exposure x risk category x developmental period by GLS.
+
+    The coefficients ``b`` of a group have covariance ``V = S R S``, with the standard errors
+    ``S`` behind their reported CIs and the between-outcome correlations ``R``. The pooled effect
+    is ``1'V^-1 b / 1'V^-1 1`` with variance ``1 / 1'V^-1 1``, and ``Q = (b - theta)'V^-1 (b - theta)``
+    tests whether the outcomes share one effect. Groups are padded to the largest one (identity
+    blocks, zero weight) so every group is solved in a single batched call.
+    """
+    df = summary_df[['IQ_Var', 'Factor', 'Age', 'Coefficient', 'CI_Lower', 'CI_Upper']].copy()
+    df['Risk_Category'] = pd.Categorical(df['Factor'].map(factor_category), categories=list(risk_categories),
+                                         ordered=True)
+    df['Developmental_Period'] = developmental_period(df['Age'])
+    df = df.dropna(subset=['Risk_Category', 'Developmental_Period'])
+    df['SE'] = (df['CI_Upper'] - df['CI_Lower']) / (2 * stats.norm.ppf(0.975))
+
+    keys = ['IQ_Var', 'Risk_Category', 'Developmental_Period']
+    df['Group'] = df.groupby(keys, observed=True, sort=True).ngroup()
+    df = df.sort_values(['Group', 'Factor', 'Age']).reset_index(drop=True)
+    group = df['Group'].to_numpy()
+    slot = df.groupby('Group').cumcount().to_numpy()
+    sizes = np.bincount(group)
+    G, K = len(sizes), sizes.max()
+
+    outcome_codes, outcomes = pd.MultiIndex.from_frame(df[['Factor', 'Age']]).factorize()
+    C = outcome_correlation_matrix(outcomes.get_level_values(0), outcomes.get_level_values(1), correlations)
+
+    b, se, index = np.zeros((G, K)), np.ones((G, K)), np.zeros((G, K), dtype=int)
+    used = np.zeros((G, K), dtype=bool)
+    b[group, slot] = df['Coefficient']
+    se[group, slot] = df['SE']
+    index[group, slot] = outcome_codes
+    used[group, slot] = True
+
+    pair = used[:, :, None] & used[:, None, :]
+    R = np.where(pair, C[index[:, :, None], index[:, None, :]], 0)
+    R[:, np.arange(K), np.arange(K)] = 1
+    V = positive_definite(R) * se[:, :, None] * se[:, None, :]
+
+    ones = used.astype(float)
+    solved = np.linalg.solve(V, np.stack([ones, b], axis=-1))
+    information = np.einsum('gk,gk->g', ones, solved[..., 0])
+    theta = np.einsum('gk,gk->g', ones, solved[..., 1]) / information
+    pooled_se = 1 / np.sqrt(information)
+    q = np.maximum(np.einsum('gk,gk->g', b, solved[..., 1]) - theta ** 2 * information, 0)
+    q_df = sizes - 1
+
+    pooled = df.groupby('Group')[keys].first()
+    z = stats.norm.ppf(0.975)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pooled['Pooled_Coefficient'] = theta
+        pooled['Pooled_SE'] = pooled_se
+        pooled['Pooled_CI_Lower'] = theta - z * pooled_se
+        pooled['Pooled_CI_Upper'] = theta + z * pooled_se
+        pooled['Pooled_P_value'] = 2 * stats.norm.sf(np.abs(theta / pooled_se))
+        pooled['Number_of_Measurements'] = sizes
+        pooled['Q'] = np.where(q_df > 0, q, np.nan)
+        pooled['Q_P_value'] = np.where(q_df > 0, stats.chi2.sf(q, np.maximum(q_df, 1)), np.nan)
+        pooled['I2'] = np.where(q_df > 0, np.clip((q - q_df) / q, 0, 1) * 100, np.nan)
+    return pooled.reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pool the IQ associations per risk category and developmental period.')
+    parser.add_argument('--data', help='ALSPAC .dta extract: estimate the between-outcome correlations '
+                                       f'(saved to {CORRELATION_FILE}) instead of assuming them')
+    args = parser.parse_args()
+
+    if args.data:
+        correlations = estimate_correlations(load_cohort(args.data))
+        write_csv(correlations, CORRELATION_FILE, index=False)
+    else:
+        correlations = load_correlations()
+    pooled_df = pool_categories(load_summary(), correlations)
+    write_csv(pooled_df, POOLED_FILE, index=False)
+    flush_outputs()
+    source = 'estimated' if correlations is not None else 'assumed'
+    print(f"Pooled {len(pooled_df)} category x period effects ({source} between-outcome correlations).")
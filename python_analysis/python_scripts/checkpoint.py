@@ -0,0 +1,138 @@
+import glob
+import hashlib
+import io
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+
+from output_sink import FSYNC_POLICY, write_file
+from paths import DOCS_DIR, FIGURES_DIR, TABLES_DIR
+
+# Directories the scripts write their outputs to, where interrupted writes may leave temp files
+OUTPUT_DIRS = [TABLES_DIR, FIGURES_DIR, DOCS_DIR]
+
+# Stages completed by run_pipeline.py (inputs fingerprint and outputs of each), and the model fits
+# saved as they complete by the long sweeps (one directory per run configuration)
+LEDGER_FILE = f'{TABLES_DIR}/.pipeline_checkpoint.json'
+FITS_DIR = f'{TABLES_DIR}/.fits'
+
+
+def clean_partial(dirs=OUTPUT_DIRS):
+    """Remove the temp files and directories left by writes that were killed before their rename, and
+    put back the directories a killed replace_directory had moved aside; returns their paths."""
+    removed = []
+    for directory in dirs:
+        for path in glob.glob(os.path.join(directory, '**', '.*.old'), recursive=True):
+            # .<name>.<pid>-<n>.old is the previous <name>, gone if the swap was killed half-way
+            live = os.path.join(os.path.dirname(path), os.path.basename(path)[1:].rsplit('.', 2)[0])
+            if os.path.exists(live):
+                shutil.rmtree(path)
+            else:
+                os.replace(path, live)
+            removed.append(path)
+        for path in glob.glob(os.path.join(directory, '**', '.*.tmp*'), recursive=True):
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            removed.append(path)
+    return removed
+
+
+def fingerprint(paths, extra=None):
+    """Stable digest of the sizes and modification times of ``paths`` (files or directories, which
+    are walked) and of the JSON-serialisable ``extra``; missing paths count as absent."""
+    digest = hashlib.sha256(json.dumps(extra, sort_keys=True, default=str).encode())
+    for path in sorted(paths):
+        files = [path] if os.path.isfile(path) else sorted(
+            os.path.join(directory, name) for directory, _, names in os.walk(path) for name in names)
+        for file in files:
+            stat = os.stat(file)
+            digest.update(f'{file}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode())
+        if not files:
+            digest.update(f'{path}\0absent\n'.encode())
+    return digest.hexdigest()
+
+
+def modified_since(start_ns, dirs=OUTPUT_DIRS):
+    """Output files written since ``start_ns`` (``time.time_ns()``), with their size and mtime."""
+    outputs = {}
+    for directory in dirs:
+        for current, subdirs, names in os.walk(directory):
+            subdirs[:] = [d for d in subdirs if not d.startswith('.')]
+            for name in names:
+                path = os.path.join(current, name)
+                stat = os.stat(path)
+                if not name.startswith('.') and stat.st_mtime_ns >= start_ns:
+                    outputs[path] = [stat.st_size, stat.st_mtime_ns]
+    return outputs
+
+
+class Ledger:
+    """Completed pipeline stages, saved (atomically) after each one so a killed run can resume."""
+
+    def __init__(self, path=LEDGER_FILE):
+        self.path = path
+        self.stages = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.stages = json.load(f)
+
+    def completed(self, stage, inputs):
+        """True if ``stage`` finished on the same inputs and its outputs are still as it wrote them."""
+        entry = self.stages.get(stage)
+        if entry is None or entry['inputs'] != inputs:
+            return False
+        for path, (size, mtime_ns) in entry['outputs'].items():
+            if not os.path.exists(path):
+                return False
+            stat = os.stat(path)
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                return False
+        return True
+
+    def record(self, stage, inputs, outputs):
+        self.stages[stage] = {'inputs': inputs, 'outputs': outputs, 'finished': time.time()}
+        self.save()
+
+    def reset(self):
+        self.stages = {}
+        self.save()
+
+    def save(self):
+        write_file(self.path, json.dumps(self.stages, indent=1, sort_keys=True).encode(), fsync=FSYNC_POLICY != 'none')
+
+
+class FitCheckpoint:
+    """Model fits of one sweep, one Parquet file per completed unit of work.
+
+    The directory is named after a digest of the sweep's configuration (``config``), so a resumed
+    sweep only reuses fits made with the same data, settings and seeds.
+    """
+
+    def __init__(self, sweep, config, root=FITS_DIR):
+        key = hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        self.directory = os.path.join(root, f'{sweep}-{key}')
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, unit):
+        return os.path.join(self.directory, f'{unit}.parquet')
+
+    def load(self, unit):
+        """The saved fit of ``unit``, or None if it has not completed."""
+        path = self.path(unit)
+        return pd.read_parquet(path) if os.path.exists(path) else None
+
+    def save(self, unit, df):
+        """Save a completed fit at once (not through the output sink), so it survives a crash right after."""
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False)
+        write_file(self.path(unit), buffer.getvalue())
+
+    def completed(self):
+        """Units with a saved fit."""
+        return sorted(os.path.splitext(name)[0] for name in os.listdir(self.directory)
+                      if name.endswith('.parquet') and not name.startswith('.'))
@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from factor_metadata import iq_vars, outcome_ages
+from paths import DATA_FILE
+
+# ALSPAC extract read by js_cfpwv.do (restricted access, not distributed with the repository)
+COHORT_FILE = os.environ.get('CFPWV_COHORT_DATA', DATA_FILE)
+
+# Raw ALSPAC variables used by the regressions -> names given to them in js_cfpwv.do
+RAW_RENAMES = {
+    # Descriptors
+    'f9003c': 'age_9',
+    'FJ003a': 'age_17',
+    'FKAR0010': 'age_24',
+    'kz021': 'sex',
+    # Cognitive ability
+    'f8ws110': 'verbal_iq_8',
+    'f8ws111': 'perf_iq_8',
+    'f8ws112': 'total_iq_8',
+    'f8ws115': 'cat_iq_8',
+    'fh6280': 'total_iq_15',
+    # Blood pressure
+    'f9sa021': 'bp_sys_9',
+    'f9sa022': 'bp_dia_9',
+    'FJAR015a': 'bp_sys_ra_r1_17',
+    'FJAR016a': 'bp_sys_ra_r2_17',
+    'FJAR015b': 'bp_dia_ra_r1_17',
+    'FJAR016b': 'bp_dia_ra_r2_17',
+    'FKBP1030': 'bp_sys_24',
+    'FKBP1031': 'bp_dia_24',
+    # Anthropometrics
+    'f9ms026a': 'bmi_9',
+    'FJMR022a': 'bmi_17',
+    'FKMS1040': 'bmi_24',
+    'f9ms018': 'wc_9',
+    'FKMS1052': 'wc_24_mm',
+    # Lipid profile
+    'CHOL_F9': 'chol_9',
+    'CHOL_TF4': 'chol_17',
+    'Chol_F24': 'chol_24',
+    'HDL_f9': 'hdl_9',
+    'HDL_TF4': 'hdl_17',
+    'HDL_F24': 'hdl_24',
+    'LDL_f9': 'ldl_9',
+    'LDL_TF4': 'ldl_17',
+    'LDL_F24': 'ldl_24',
+    'trig_f9': 'trig_9',
+    'TRIG_TF4': 'trig_17',
+    'Trig_F24': 'trig_24',
+    # Arterial stiffness
+    'FJAR083d': 'cfpwv_17',
+    'FKCV4200': 'cfpwv_24',
+    # Glucose metabolism
+    'Glc_F7': 'glc_meta_7',
+    'Glc_TF4': 'glc_meta_17',
+    'Glc_F24': 'glc_meta_24',
+    'insulin_F9': 'insul_9',
+    'insulin_TF4': 'insul_17',
+    'Insulin_F24': 'insul_24',
+    # Socioeconomic status
+    'c755': 'mother_soc',
+    'c765': 'father_soc',
+}
+
+
+def zscore(values):
+    """Standardise like Stata's ``zscore``: mean and (n-1) SD over the non-missing values."""
+    return (values - values.mean()) / values.std(ddof=1)
+
+
+def prepare_cohort(raw):
+    """Apply the js_cfpwv.do data preparation to a frame holding the raw ALSPAC variables.
+
+    ``raw`` may carry extra columns (e.g. a family or school identifier for clustering);
+    they are passed through untouched.
+    """
+    df = raw.rename(columns=RAW_RENAMES)
+    renamed = [name for name in RAW_RENAMES.values() if name in df.columns]
+    df[renamed] = df[renamed].apply(pd.to_numeric, errors='coerce')
+
+    # Negative values are ALSPAC missing-value codes (-9999, -10, -9, -1, ...)
+    df[renamed] = df[renamed].mask(df[renamed] < 0)
+
+    # Derived outcomes (egen rowmean ignores missing readings)
+    df['bp_sys_17'] = df[['bp_sys_ra_r1_17', 'bp_sys_ra_r2_17']].mean(axis=1)
+    df['bp_dia_17'] = df[['bp_dia_ra_r1_17', 'bp_dia_ra_r2_17']].mean(axis=1)
+    df['wc_24'] = df['wc_24_mm'] / 10
+    # use age 7 for age 9
+    df['glc_meta_9'] = df['glc_meta_7']
+
+    # SES is the highest social class (lowest value) of either parent, or the one that is known
+    df['ses'] = np.fmin(df['mother_soc'], df['father_soc'])
+
+    # Standardised exposures and outcomes (zscore in js_cfpwv.do)
+    for iq_var in iq_vars:
+        df[f'z_{iq_var}'] = zscore(df[iq_var])
+    for factor, ages in outcome_ages.items():
+        for age in ages:
+            df[f'z_{factor}_{age}'] = zscore(df[f'{factor}_{age}'])
+    return df
+
+
+def load_cohort(path=COHORT_FILE, extra_columns=()):
+    """Read the raw ALSPAC extract (only the variables used here) and prepare it."""
+    columns = list(RAW_RENAMES) + [col for col in extra_columns if col not in RAW_RENAMES]
+    raw = pd.read_stata(path, columns=columns, convert_categoricals=False)
+    return prepare_cohort(raw)
@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+from string import Template
+
+import numpy as np
+import pandas as pd
+
+from factor_metadata import risk_factors, risk_categories, period_bins, period_labels, DEFAULT_IQ_VAR, exposure_description
+from output_sink import flush_outputs, write_text
+from paths import FIGURES_DIR
+from results_store import load_summary
+from shrinkage import coefficient_label
+
+TEMPLATE_PATH = '../templates/dashboard.html.tmpl'
+
+
+def compact(values, digits=5):
+    """Round floats to a few significant digits and turn NaN into null to keep the JSON small."""
+    out = []
+    for value in values:
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            out.append(None)
+        else:
+            out.append(float(f'{value:.{digits}g}'))
+    return out
+
+
+def build_payload(summary_df):
+    """Pack the results (as loaded by load_summary, so with the CFPWV_SE and CFPWV_ESTIMATES
+    settings of the other steps) into the columnar JSON structure read by the dashboard."""
+    df = summary_df.dropna(subset=['Coefficient'])
+    factors = [factor for factor in risk_factors if factor in set(df['Factor'])]
+    factors += sorted(set(df['Factor']) - set(factors))
+    factor_index = {factor: i for i, factor in enumerate(factors)}
+    iq_vars = sorted(df['IQ_Var'].unique())
+    iq_index = {iq_var: i for i, iq_var in enumerate(iq_vars)}
+
+    return {
+        'factors': factors,
+        'labels': [risk_factors.get(factor, factor) for factor in factors],
+        'categories': {category: [factor_index[f] for f in members if f in factor_index]
+                       for category, members in risk_categories.items()},
+        'periods': {'bins': period_bins, 'labels': period_labels},
+        'iqVars': iq_vars,
+        'iqLabels': [exposure_description(iq_var) for iq_var in iq_vars],
+        'defaultIqVar': DEFAULT_IQ_VAR,
+        'coefficientLabel': coefficient_label(),
+        'rows': {
+            'f': [factor_index[f] for f in df['Factor']],
+            'x': [iq_index[v] for v in df['IQ_Var']],
+            'a': [int(age) for age in df['Age']],
+            'c': compact(df['Coefficient']),
+            'l': compact(df['CI_Lower']),
+            'u': compact(df['CI_Upper']),
+            'p': compact(df['P-value_numeric']),
+            'n': [None if pd.isna(n) else int(n) for n in df['Sample Size']],
+        },
+    }
+
+
+def write_dashboard(summary_df, path, template_path=TEMPLATE_PATH):
+    """Write a single self-contained HTML dashboard with the results embedded as JSON."""
+    payload = json.dumps(build_payload(summary_df), separators=(',', ':'))
+    # Keep the embedded JSON from closing the <script> element early
+    payload = payload.replace('</', '<\\/')
+    with open(template_path, 'r') as f:
+        template = Template(f.read())
+    write_text(path, template.substitute(data=payload))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write the interactive results dashboard.')
+    parser.add_argument('--output', default=f'{FIGURES_DIR}/dashboard.html',
+                        help='path of the HTML file (default: %(default)s)')
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    write_dashboard(load_summary(), args.output)
+    flush_outputs()
+    print(f"Dashboard written to {args.output}.")
@@ -0,0 +1,130 @@
+import argparse
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.lines import Line2D
+
+from factor_metadata import DEFAULT_IQ_VAR, exposure_suffix, exposure_title, factor_plot_styles, stratum_suffix
+from output_sink import flush_outputs
+from paths import FIGURES_DIR
+from render import figure_selected, finalise_layout, save_figure
+from results_store import load_summary
+from shared_results import SharedResults, group_slices, map_slices
+
+# Columns of the results the plots need (held in shared memory for the render workers)
+PLOT_COLUMNS = ['Factor', 'IQ_Var', 'Age', 'Coefficient', 'CI_Lower', 'CI_Upper']
+
+# Coefficient axis of the per-factor plots (widened if a CI does not fit), as in js_cfpwv.do
+FACTOR_PLOT_RANGE = (-0.15, 0.15)
+
+
+def age_plot_name(iq_var, age):
+    """File name (without extension) of an exposure's plot at one age, z_iq8_age<age>_... for the default exposure."""
+    prefix = 'iq8' if iq_var == DEFAULT_IQ_VAR else iq_var
+    return f'z_{prefix}_age{age}_exposures_plot_by_age_cfpwv{stratum_suffix()}'
+
+
+def factor_plot_name(iq_var, factor):
+    """File name (without extension) of an exposure's plot of one risk factor across ages."""
+    return f'js_cfpwv_{factor}{exposure_suffix(iq_var)}'
+
+
+def coefficient_errors(df):
+    """Distances from each coefficient to its CI bounds, as expected by ``errorbar``."""
+    return [df['Coefficient'] - df['CI_Lower'], df['CI_Upper'] - df['Coefficient']]
+
+
+def plot_exposures_at_age(df, iq_var, age):
+    """Coefficient and 95% CI of every risk factor at one age (js_exposures_plot_by_age.do)."""
+    # Positions, tick labels and legend all follow the order of factor_plot_styles
+    position = {factor: i + 1 for i, factor in enumerate(factor_plot_styles)}
+    fig, ax = plt.subplots(figsize=(10, 6))
+    for factor, (label, colour) in factor_plot_styles.items():
+        row = df[df['Factor'] == factor]
+        ax.errorbar(row['Coefficient'], np.full(len(row), position[factor]), xerr=coefficient_errors(row),
+                    fmt='D', color=colour, capsize=3)
+    max_position = max(position[factor] for factor in df['Factor'])
+    labels = [label for label, _ in factor_plot_styles.values()]
+    ax.set_yticks(range(1, max_position + 1), labels[:max_position], fontsize=8)
+    ax.axvline(x=0, color='black', linestyle='--')
+    ax.grid(True, linestyle='--', alpha=0.3)
+    ax.set_xlabel('Regression Coefficient (95% CI)', fontsize=12)
+    ax.set_ylabel('Dependent Variable', fontsize=12)
+    ax.set_title(f'Association of {exposure_title(iq_var)} with Outcomes at Age {age}', fontsize=14)
+    # Every risk factor is listed, whether or not it was measured at this age
+    handles = [Line2D([], [], marker='D', linestyle='', color=colour, label=label)
+               for label, colour in factor_plot_styles.values()]
+    ax.legend(handles=handles, loc='center left', bbox_to_anchor=(1.02, 0.5), frameon=False)
+    finalise_layout()
+    save_figure(f'{FIGURES_DIR}/{age_plot_name(iq_var, age)}.png', dpi=300, bbox_inches='tight')
+
+
+def plot_factor_across_ages(df, iq_var, factor):
+    """Coefficient and 95% CI of one risk factor at every age (the figure of js_cfpwv.do)."""
+    df = df.sort_values('Age')
+    positions = np.arange(1, len(df) + 1)
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.errorbar(df['Coefficient'], positions, xerr=coefficient_errors(df), fmt='none', ecolor='#90353b', capsize=3)
+    ax.scatter(df['Coefficient'], positions, marker='D', color='#1a476f', zorder=3)
+    ax.set_yticks(positions, [str(int(age)) for age in df['Age']])
+    lower = min(FACTOR_PLOT_RANGE[0], df['CI_Lower'].min())
+    upper = max(FACTOR_PLOT_RANGE[1], df['CI_Upper'].max())
+    ax.set_xlim(lower - 0.005, upper + 0.005)
+    ax.set_xticks(np.arange(-0.15, 0.151, 0.05))
+    ax.axvline(x=0, color='black', linestyle='--')
+    ax.grid(True, linestyle='--', alpha=0.3)
+    ax.set_xlabel('Regression Coefficient (95% CI)', fontsize=12)
+    ax.set_ylabel('Age', fontsize=12)
+    label = factor_plot_styles[factor][0]
+    fig.suptitle(f'Combined Association: {exposure_title(iq_var)} and {label} Across Ages', fontsize=14)
+    ax.set_title('Adjusted for Age, Sex and SES', fontsize=10)
+    finalise_layout()
+    save_figure(f'{FIGURES_DIR}/{factor_plot_name(iq_var, factor)}.png', dpi=300, bbox_inches='tight')
+
+
+def render_figure(shared, key, rows):
+    """Render one figure from the shared results; ``rows`` is the slice of the figure's exposure."""
+    kind, iq_var, value = key
+    df = shared.frame(rows)
+    if kind == 'age':
+        plot_exposures_at_age(df[df['Age'] == value], iq_var, value)
+        return age_plot_name(iq_var, value)
+    plot_factor_across_ages(df[df['Factor'] == value], iq_var, value)
+    return factor_plot_name(iq_var, value)
+
+
+def figure_tasks(results_df):
+    """Sort the results by exposure and list every selected figure with the rows of its exposure."""
+    sorted_df, slices = group_slices(results_df[PLOT_COLUMNS], 'IQ_Var')
+    tasks = {}
+    for iq_var, rows in slices.items():
+        exposure_df = sorted_df.iloc[rows]
+        for age in sorted(exposure_df['Age'].unique()):
+            if figure_selected(ages=[age]):
+                tasks[('age', iq_var, int(age))] = rows
+        for factor in factor_plot_styles:
+            if factor in set(exposure_df['Factor']) and figure_selected(factors=[factor]):
+                tasks[('factor', iq_var, factor)] = rows
+    return sorted_df, tasks
+
+
+def render_exposure_plots(results_df, max_workers=None):
+    """Render every exposure plot, one figure per task in a process pool sharing the results."""
+    sorted_df, tasks = figure_tasks(results_df)
+    with SharedResults.create(sorted_df) as shared:
+        if max_workers == 1:
+            return {key: render_figure(shared, key, rows) for key, rows in tasks.items()}
+        return map_slices(render_figure, shared, tasks, max_workers)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Draw the Stata coefficient plots of js_cfpwv.do and '
+                                                 'js_exposures_plot_by_age.do from the results dataset.')
+    parser.add_argument('--workers', type=int, help='render processes (default: one per CPU)')
+    args = parser.parse_args()
+
+    os.makedirs(FIGURES_DIR, exist_ok=True)
+    figures = render_exposure_plots(load_summary(), args.workers)
+    flush_outputs()
+    print(f"Rendered {len(figures)} exposure plots.")
@@ -5,31 +5,21 @@ import seaborn as sns
 from scipy import stats
 import os
 
-# Create directories for outputs if they don't exist
-os.makedirs('../figures', exist_ok=True)
-os.makedirs('../tables', exist_ok=True)
-
-# Load the summary data from the previous analysis
-summary_df = pd.read_csv('../tables/readable_summary.csv')
-
-# Fix the diastolic blood pressure and glucose metabolism labels
-summary_df.loc[summary_df['Risk Factor'] == 'bp_di', 'Risk Factor'] = 'Diastolic Blood Pressure'
-summary_df.loc[summary_df['Risk Factor'] == 'glc_met', 'Risk Factor'] = 'Glucose Metabolism'
-
-# Remove rows with NaN coefficients
-summary_df = summary_df.dropna(subset=['Coefficient (95% CI)'])
-
-# Extract numeric coefficient from the string format
-def extract_coefficient(coef_str):
-    return float(coef_str.split(' ')[0])
+from category_pooling import developmental_period, load_correlations, pool_categories
+from factor_metadata import (exposure_description, exposure_suffix, exposure_title, factor_category,
+                             risk_categories, risk_factors, stratum_suffix)
+from output_sink import flush_outputs, write_csv
+from paths import DOCS_DIR, FIGURES_DIR, TABLES_DIR
+from render import figure_selected, finalise_layout, save_figure
+from results_store import compare_exposures, load_summary
+from report_builder import render_extended_analysis_summary, write_report
 
-summary_df['Coefficient'] = summary_df['Coefficient (95% CI)'].apply(extract_coefficient)
-
-# Extract p-value as numeric
-summary_df['P-value_numeric'] = summary_df['P-value'].astype(float)
+# Create directories for outputs if they don't exist
+os.makedirs(FIGURES_DIR, exist_ok=True)
+os.makedirs(TABLES_DIR, exist_ok=True)
 
-# Create significance indicator
-summary_df['Significant'] = summary_df['P-value_numeric'] < 0.05
+# Load the results dataset (numeric coefficients, p-values and significance indicator included)
+summary_df = load_summary()
 
 # Create significance level indicator
 summary_df['Significance_Level'] = 'ns'
@@ -38,14 +28,13 @@ summary_df.loc[summary_df['P-value_numeric'] < 0.01, 'Significance_Level'] = '**
 summary_df.loc[summary_df['P-value_numeric'] < 0.001, 'Significance_Level'] = '***'
 
 # Group data into developmental periods
-summary_df['Developmental_Period'] = pd.cut(
-    summary_df['Age'], 
-    bins=[8, 12, 16, 25], 
-    labels=['Childhood (9-12)', 'Adolescence (13-16)', 'Early Adulthood (17-24)']
-)
+summary_df['Developmental_Period'] = developmental_period(summary_df['Age'])
+
+# Exposures present in the results (every table below is keyed by exposure, figures are drawn per exposure)
+exposures = summary_df['IQ_Var'].unique()
 
-# Create a table of participant characteristics by developmental period
-period_characteristics = summary_df.groupby('Developmental_Period', observed=True).agg({
+# Create a table of participant characteristics by exposure and developmental period
+period_characteristics = summary_df.groupby(['IQ_Var', 'Developmental_Period'], observed=True).agg({
     'Sample Size': ['mean', 'min', 'max', 'count'],
     'R²': ['mean', 'min', 'max'],
     'Significant': 'mean',
@@ -60,10 +49,10 @@ period_characteristics.rename(columns={
 period_characteristics['Proportion_Significant'] = period_characteristics['Proportion_Significant'] * 100
 
 # Save the table
-period_characteristics.to_csv('../tables/participant_characteristics_by_period.csv')
+write_csv(period_characteristics, f'{TABLES_DIR}/participant_characteristics_by_period{stratum_suffix()}.csv')
 
-# Create a more detailed table of results by risk factor and developmental period
-risk_period_summary = summary_df.groupby(['Risk Factor', 'Developmental_Period'], observed=True).agg({
+# Create a more detailed table of results by exposure, risk factor and developmental period
+risk_period_summary = summary_df.groupby(['IQ_Var', 'Risk Factor', 'Developmental_Period'], observed=True).agg({
     'Coefficient': ['mean', 'std', 'count'],
     'P-value_numeric': 'mean',
     'Significant': 'mean',
@@ -73,6 +62,7 @@ risk_period_summary = summary_df.groupby(['Risk Factor', 'Developmental_Period']
 
 risk_period_summary.columns = ['_'.join(col).strip() for col in risk_period_summary.columns.values]
 risk_period_summary.rename(columns={
+    'IQ_Var_': 'IQ_Var',
     'Risk Factor_': 'Risk_Factor',
     'Developmental_Period_': 'Developmental_Period',
     'Coefficient_mean': 'Mean_Coefficient',
@@ -86,204 +76,159 @@ risk_period_summary.rename(columns={
 risk_period_summary['Proportion_Significant'] = risk_period_summary['Proportion_Significant'] * 100
 
 # Save the table
-risk_period_summary.to_csv('../tables/risk_factor_by_developmental_period.csv')
-
-# Create a visualisation of effect sizes by developmental period
-plt.figure(figsize=(14, 10))
-sns.boxplot(x='Developmental_Period', y='Coefficient', hue='Developmental_Period',
-            data=summary_df, palette='viridis', legend=False)
-plt.axhline(y=0, color='r', linestyle='-', alpha=0.3)
-plt.title('Distribution of Effect Sizes by Developmental Period', fontsize=16)
-plt.xlabel('Developmental Period', fontsize=14)
-plt.ylabel('Standardised Coefficient', fontsize=14)
-plt.grid(axis='y', alpha=0.3)
-plt.tight_layout()
-plt.savefig('../figures/effect_sizes_by_period.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-# Create a visualisation of proportion of significant associations by developmental period
-sig_by_period = summary_df.groupby('Developmental_Period', observed=True)['Significant'].mean() * 100
-plt.figure(figsize=(10, 6))
-bars = plt.bar(sig_by_period.index, sig_by_period.values, color='skyblue')
-plt.title('Proportion of Significant Associations by Developmental Period', fontsize=16)
-plt.xlabel('Developmental Period', fontsize=14)
-plt.ylabel('Percentage of Significant Associations (%)', fontsize=14)
-plt.ylim(0, 100)
-plt.grid(axis='y', alpha=0.3)
-
-# Add percentage labels on top of bars
-for i, bar in enumerate(bars):
-    plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + 2, 
-             f"{sig_by_period.values[i]:.1f}%", 
-             ha='center', va='bottom', fontsize=12)
-
-plt.tight_layout()
-plt.savefig('../figures/significant_by_period.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-# Create a heatmap of effect sizes by risk factor and developmental period
+write_csv(risk_period_summary, f'{TABLES_DIR}/risk_factor_by_developmental_period{stratum_suffix()}.csv')
+
+# Compare the exposures side by side for every risk factor and developmental period
+write_csv(compare_exposures(risk_period_summary, ['Risk_Factor', 'Developmental_Period'],
+                            ['Mean_Coefficient', 'Proportion_Significant']),
+          f'{TABLES_DIR}/exposure_comparison_by_period{stratum_suffix()}.csv', index=False)
+
+# Proportion of significant associations and mean effect sizes by exposure and developmental period
+sig_by_period = summary_df.groupby(['IQ_Var', 'Developmental_Period'], observed=True)['Significant'].mean() * 100
 pivot_data = summary_df.pivot_table(
-    index='Risk Factor', 
+    index=['IQ_Var', 'Risk Factor'], 
     columns='Developmental_Period', 
     values='Coefficient',
     aggfunc='mean',
     observed=True
 )
 
-plt.figure(figsize=(12, 10))
-sns.heatmap(pivot_data, cmap='RdBu_r', center=0, annot=True, fmt='.4f', linewidths=.5)
-plt.title('Mean Effect Size by Risk Factor and Developmental Period', fontsize=16)
-plt.tight_layout()
-plt.savefig('../figures/heatmap_by_period.png', dpi=300, bbox_inches='tight')
-plt.close()
+for iq_var in exposures:
+    exposure_df = summary_df[summary_df['IQ_Var'] == iq_var]
+    suffix = exposure_suffix(iq_var)
+
+    # Create a visualisation of effect sizes by developmental period
+    plt.figure(figsize=(14, 10))
+    sns.boxplot(x='Developmental_Period', y='Coefficient', hue='Developmental_Period',
+                data=exposure_df, palette='viridis', legend=False)
+    plt.axhline(y=0, color='r', linestyle='-', alpha=0.3)
+    plt.title(f'Distribution of Effect Sizes by Developmental Period ({exposure_title(iq_var)})', fontsize=16)
+    plt.xlabel('Developmental Period', fontsize=14)
+    plt.ylabel('Standardised Coefficient', fontsize=14)
+    plt.grid(axis='y', alpha=0.3)
+    finalise_layout()
+    save_figure(f'{FIGURES_DIR}/effect_sizes_by_period{suffix}.png', dpi=300, bbox_inches='tight')
+
+    # Create a visualisation of proportion of significant associations by developmental period
+    exposure_sig = sig_by_period.loc[iq_var]
+    plt.figure(figsize=(10, 6))
+    bars = plt.bar(exposure_sig.index, exposure_sig.values, color='skyblue')
+    plt.title(f'Proportion of Significant Associations by Developmental Period ({exposure_title(iq_var)})', fontsize=16)
+    plt.xlabel('Developmental Period', fontsize=14)
+    plt.ylabel('Percentage of Significant Associations (%)', fontsize=14)
+    plt.ylim(0, 100)
+    plt.grid(axis='y', alpha=0.3)
+
+    # Add percentage labels on top of bars
+    for i, bar in enumerate(bars):
+        plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + 2, 
+                 f"{exposure_sig.values[i]:.1f}%", 
+                 ha='center', va='bottom', fontsize=12)
+
+    finalise_layout()
+    save_figure(f'{FIGURES_DIR}/significant_by_period{suffix}.png', dpi=300, bbox_inches='tight')
+
+    # Create a heatmap of effect sizes by risk factor and developmental period
+    plt.figure(figsize=(12, 10))
+    sns.heatmap(pivot_data.loc[iq_var].dropna(axis=1, how='all'), cmap='RdBu_r', center=0, annot=True, fmt='.4f', linewidths=.5)
+    plt.title(f'Mean Effect Size by Risk Factor and Developmental Period ({exposure_title(iq_var)})', fontsize=16)
+    finalise_layout()
+    save_figure(f'{FIGURES_DIR}/heatmap_by_period{suffix}.png', dpi=300, bbox_inches='tight')
 
 # Create a visualisation of effect sizes by risk factor category
-# Group risk factors into categories
-risk_categories = {
-    'Anthropometric': ['Body Mass Index', 'Waist Circumference'],
-    'Blood Pressure': ['Systolic Blood Pressure', 'Diastolic Blood Pressure'],
-    'Lipid Profile': ['Total Cholesterol', 'High-Density Lipoprotein', 'Low-Density Lipoprotein', 'Triglycerides'],
-    'Glucose Metabolism': ['Glucose Metabolism', 'Insulin'],
-    'Arterials Stiffness': ['Carotid Femoral PWV']
-}
-
-# Add category column to dataframe
-summary_df['Risk_Category'] = 'Other'
-for category, factors in risk_categories.items():
-    summary_df.loc[summary_df['Risk Factor'].isin(factors), 'Risk_Category'] = category
-
-# Define the desired category order
-category_order = [
-    'Anthropometric',
-    'Blood Pressure',
-    'Lipid Profile',
-    'Glucose Metabolism',
-    'Arterials Stiffness'
-]
-
-# Convert to categorical type with specified order
+# Group risk factors into categories (in display order)
+category_order = list(risk_categories)
 summary_df['Risk_Category'] = pd.Categorical(
-    summary_df['Risk_Category'],
+    summary_df['Factor'].map(factor_category),
     categories=category_order,
     ordered=True
 )
 
-# Create boxplot of effect sizes by risk category
-plt.figure(figsize=(14, 8))
-# Fix the seaborn boxplot warning by adding hue parameter
-sns.boxplot(x='Risk_Category', y='Coefficient', hue='Risk_Category', 
-            data=summary_df, palette='viridis', legend=False)
-plt.axhline(y=0, color='r', linestyle='-', alpha=0.3)
-plt.title('Distribution of Effect Sizes by Risk Factor Category', fontsize=16)
-plt.xlabel('Risk Factor Category', fontsize=14)
-plt.ylabel('Standardised Coefficient', fontsize=14)
-plt.grid(axis='y', alpha=0.3)
-plt.tight_layout()
-plt.savefig('../figures/effect_sizes_by_category.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-# Create a visualisation of proportion of significant associations by risk category
-sig_by_category = summary_df.groupby('Risk_Category', observed=True)['Significant'].mean() * 100
-plt.figure(figsize=(10, 6))
-bars = plt.bar(
-    x=sig_by_category.index,
-    height=sig_by_category.values,
-    color='skyblue'
-)
-plt.title('Proportion of Significant Associations by Risk Factor Category', fontsize=16)
-plt.xlabel('Risk Factor Category', fontsize=14)
-plt.ylabel('Percentage of Significant Associations (%)', fontsize=14)
-plt.ylim(0, 100)
-plt.grid(axis='y', alpha=0.3)
-
-# Add percentage labels on top of bars
-for i, bar in enumerate(bars):
-    plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + 2, 
-             f"{sig_by_category.values[i]:.1f}%", 
-             ha='center', va='bottom', fontsize=12)
-
-plt.tight_layout()
-plt.savefig('../figures/significant_by_category.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-# Create a heatmap of effect sizes by risk category and developmental period
-category_period_pivot = summary_df.pivot_table(
-    index='Risk_Category', 
+# Proportion of significant associations by exposure and risk category, and the effect of every
+# exposure, risk category and developmental period pooled by GLS over its correlated outcomes
+sig_by_category = summary_df.groupby(['IQ_Var', 'Risk_Category'], observed=True)['Significant'].mean() * 100
+pooled_df = pool_categories(summary_df, load_correlations())
+category_period_pivot = pooled_df.pivot_table(
+    index=['IQ_Var', 'Risk_Category'], 
     columns='Developmental_Period', 
-    values='Coefficient',
-    aggfunc='mean',
+    values='Pooled_Coefficient',
     observed=True
 )
 
-# Reindex to ensure correct order
-category_period_pivot = category_period_pivot.reindex(category_order)
-
-plt.figure(figsize=(12, 8))
-sns.heatmap(
-    category_period_pivot,
-    cmap='RdBu_r',
-    center=0,
-    annot=True,
-    fmt='.4f',
-    linewidths=.5
-)
-plt.title('Mean Effect Size by Risk Factor Category and Developmental Period', fontsize=16)
-plt.tight_layout()
-plt.savefig('../figures/heatmap_category_by_period.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-# Create a table of effect sizes by risk category and developmental period
-category_period_summary = summary_df.groupby(['Risk_Category', 'Developmental_Period'], observed=True).agg({
-    'Coefficient': ['mean', 'std', 'count'],
-    'P-value_numeric': 'mean',
-    'Significant': 'mean',
-    'Sample Size': 'mean',
-    'R²': 'mean'
-}).reset_index()
-
-category_period_summary.columns = ['_'.join(col).strip() for col in category_period_summary.columns.values]
-category_period_summary.rename(columns={
-    'Risk_Category_': 'Risk_Category',
-    'Developmental_Period_': 'Developmental_Period',
-    'Coefficient_mean': 'Mean_Coefficient',
-    'Coefficient_std': 'SD_Coefficient',
-    'Coefficient_count': 'Number_of_Measurements',
-    'P-value_numeric_mean': 'Mean_P_value',
-    'Significant_mean': 'Proportion_Significant',
-    'Sample Size_mean': 'Mean_Sample_Size',
-    'R²_mean': 'Mean_R_Squared'
-}, inplace=True)
+for iq_var in exposures:
+    exposure_df = summary_df[summary_df['IQ_Var'] == iq_var]
+    suffix = exposure_suffix(iq_var)
+
+    # Create boxplot of effect sizes by risk category
+    plt.figure(figsize=(14, 8))
+    # Fix the seaborn boxplot warning by adding hue parameter
+    sns.boxplot(x='Risk_Category', y='Coefficient', hue='Risk_Category', 
+                data=exposure_df, palette='viridis', legend=False)
+    plt.axhline(y=0, color='r', linestyle='-', alpha=0.3)
+    plt.title(f'Distribution of Effect Sizes by Risk Factor Category ({exposure_title(iq_var)})', fontsize=16)
+    plt.xlabel('Risk Factor Category', fontsize=14)
+    plt.ylabel('Standardised Coefficient', fontsize=14)
+    plt.grid(axis='y', alpha=0.3)
+    finalise_layout()
+    save_figure(f'{FIGURES_DIR}/effect_sizes_by_category{suffix}.png', dpi=300, bbox_inches='tight')
+
+    # Create a visualisation of proportion of significant associations by risk category
+    exposure_sig = sig_by_category.loc[iq_var]
+    plt.figure(figsize=(10, 6))
+    bars = plt.bar(
+        x=exposure_sig.index,
+        height=exposure_sig.values,
+        color='skyblue'
+    )
+    plt.title(f'Proportion of Significant Associations by Risk Factor Category ({exposure_title(iq_var)})', fontsize=16)
+    plt.xlabel('Risk Factor Category', fontsize=14)
+    plt.ylabel('Percentage of Significant Associations (%)', fontsize=14)
+    plt.ylim(0, 100)
+    plt.grid(axis='y', alpha=0.3)
+
+    # Add percentage labels on top of bars
+    for i, bar in enumerate(bars):
+        plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + 2, 
+                 f"{exposure_sig.values[i]:.1f}%", 
+                 ha='center', va='bottom', fontsize=12)
+
+    finalise_layout()
+    save_figure(f'{FIGURES_DIR}/significant_by_category{suffix}.png', dpi=300, bbox_inches='tight')
+
+    # Create a heatmap of effect sizes by risk category and developmental period
+    # (reindexed to ensure correct order)
+    plt.figure(figsize=(12, 8))
+    sns.heatmap(
+        category_period_pivot.loc[iq_var].reindex(category_order),
+        cmap='RdBu_r',
+        center=0,
+        annot=True,
+        fmt='.4f',
+        linewidths=.5
+    )
+    plt.title(f'Pooled Effect Size by Risk Factor Category and Developmental Period ({exposure_title(iq_var)})', fontsize=16)
+    finalise_layout()
+    save_figure(f'{FIGURES_DIR}/heatmap_category_by_period{suffix}.png', dpi=300, bbox_inches='tight')
+
+# Create a table of effect sizes by exposure, risk category and developmental period
+# (Risk_Category is ordered, so Lipid Profile already comes before Glucose Metabolism)
+category_period_summary = summary_df.groupby(['IQ_Var', 'Risk_Category', 'Developmental_Period'], observed=True).agg(
+    Mean_P_value=('P-value_numeric', 'mean'),
+    Proportion_Significant=('Significant', 'mean'),
+    Mean_Sample_Size=('Sample Size', 'mean'),
+    Mean_R_Squared=('R²', 'mean')
+).reset_index()
 category_period_summary['Proportion_Significant'] = category_period_summary['Proportion_Significant'] * 100
+category_period_summary = pooled_df.merge(category_period_summary, on=['IQ_Var', 'Risk_Category', 'Developmental_Period'])
 
 # Save the table
-category_period_summary.to_csv('../tables/risk_category_by_developmental_period.csv')
-
-# just quickly change the order of the risk categories so that Lipid is before Glucose
-# Read the generated CSV file
-file_path = '../tables/risk_category_by_developmental_period.csv'
-df = pd.read_csv(file_path)
-
-# Function to adjust the index numbers
-def adjust_index(x):
-    if 6 <= x <= 8:
-        return x + 3  # 6→9, 7→10, 8→11
-    elif 9 <= x <= 11:
-        return x - 3  # 9→6, 10→7, 11→8
-    return x
-
-# Apply the index adjustment
-df['Unnamed: 0'] = df['Unnamed: 0'].apply(adjust_index)
-
-# Sort by the adjusted index and drop the temporary column
-df = df.sort_values('Unnamed: 0')
-
-# Save back to the same file
-df.to_csv(file_path, index=False)
+write_csv(category_period_summary, f'{TABLES_DIR}/risk_category_by_developmental_period{stratum_suffix()}.csv')
 
 # Create a visualisation of the trajectory of effect sizes across ages for each risk factor category
 # Modified trajectory plotting section
 
 # Modified trajectory plotting with 3 significant figures
+from itertools import product
 from scipy import stats
 import warnings
 
@@ -291,12 +236,17 @@ import warnings
 Y_MIN = -0.1
 Y_MAX = 0.05
 
-# Create individual trajectory plots for each risk category
-for category, factors in risk_categories.items():
-    plt.figure(figsize=(12, 8))
-    
+# Create individual trajectory plots for each exposure and risk category
+for iq_var, (category, factors) in product(exposures, risk_categories.items()):
     # Get all data for this category
-    category_data = summary_df[summary_df['Risk_Category'] == category].dropna(subset=['Age', 'Coefficient'])
+    category_data = summary_df[(summary_df['IQ_Var'] == iq_var) & (summary_df['Risk_Category'] == category)
+                               ].dropna(subset=['Age', 'Coefficient'])
+
+    # Skip the figure if an incremental re-run is restricted to other risk factors
+    if not figure_selected(factors=category_data['Factor'].unique()):
+        continue
+
+    plt.figure(figsize=(12, 8))
     
     # Skip categories with no valid data
     if len(category_data) < 2:
@@ -315,12 +265,12 @@ for category, factors in risk_categories.items():
     
     # Plot individual risk factors with colored points
     for i, factor in enumerate(factors):
-        factor_points = category_data[category_data['Risk Factor'] == factor]
+        factor_points = category_data[category_data['Factor'] == factor]
         plt.scatter(
             x=factor_points['Age'], 
             y=factor_points['Coefficient'],
             color=palette[i],
-            label=factor,
+            label=risk_factors[factor],
             alpha=0.7,
             s=80,
             edgecolor='w',
@@ -368,7 +318,7 @@ for category, factors in risk_categories.items():
     
     # Add plot elements
     plt.axhline(y=0, color='#7f7f7f', linestyle='--', alpha=0.6)
-    plt.title(f'{category} Trajectory (Overall Trend)', fontsize=16)
+    plt.title(f'{category} Trajectory (Overall Trend, {exposure_title(iq_var)})', fontsize=16)
     plt.xlabel('Age (years)', fontsize=14)
     plt.ylabel('Standardised Coefficient', fontsize=14)
     
@@ -400,75 +350,17 @@ for category, factors in risk_categories.items():
     )
     
     plt.grid(alpha=0.15, linestyle='--')
-    plt.tight_layout()
+    finalise_layout()
     
     # Save with category-specific filename
-    fname = f'trajectory_{category.lower().replace(" ", "_")}_annotated.png'
-    plt.savefig(f'../figures/{fname}', 
+    fname = f'trajectory_{category.lower().replace(" ", "_")}_annotated{exposure_suffix(iq_var)}.png'
+    save_figure(f'{FIGURES_DIR}/{fname}', 
                 dpi=300, bbox_inches='tight')
-    plt.close()
 
-# Create a summary of the extended analysis
-with open('../docs/extended_analysis_summary.md', 'w') as f:
-    f.write('# Extended Analysis of Childhood Cognitive Ability and Cardiovascular Risk Factors\n\n')
-    
-    f.write('## Overview\n\n')
-    f.write('This extended analysis builds upon the previous work by examining the relationship between childhood cognitive ability and cardiovascular risk factors across different developmental periods and risk factor categories. The analysis aims to provide a more nuanced understanding of how these relationships evolve across development and vary by type of cardiovascular risk factor.\n\n')
-    
-    f.write('## Developmental Periods\n\n')
-    f.write('The analysis categorises ages into three developmental periods:\n\n')
-    f.write('1. **Childhood (9-12 years)**: Early development period\n')
-    f.write('2. **Adolescence (13-16 years)**: Period of pubertal development and increasing autonomy\n')
-    f.write('3. **Early Adulthood (17-24 years)**: Transition to adulthood and establishment of adult health behaviors\n\n')
-    
-    f.write('## Risk Factor Categories\n\n')
-    f.write('Cardiovascular risk factors are grouped into four main categories:\n\n')
-    f.write('1. **Anthropometric Measures**: Body Mass Index (BMI) and Waist Circumference\n')
-    f.write('2. **Blood Pressure**: Systolic and Diastolic Blood Pressure\n')
-    f.write('3. **Lipid Profile**: Total Cholesterol, High-Density Lipoprotein (HDL), Low-Density Lipoprotein (LDL), and Triglycerides\n')
-    f.write('4. **Glucose Metabolism**: Glucose levels and Insulin\n\n')
-    
-    f.write('## Key Findings\n\n')
-    
-    # Calculate some summary statistics for the key findings
-    early_adulthood = summary_df[summary_df['Developmental_Period'] == 'Early Adulthood (17-24)']
-    childhood = summary_df[summary_df['Developmental_Period'] == 'Childhood (9-12)']
-    
-    early_sig_pct = early_adulthood['Significant'].mean() * 100
-    child_sig_pct = childhood['Significant'].mean() * 100
-    
-    anthro_data = summary_df[summary_df['Risk_Category'] == 'Anthropometric']
-    bp_data = summary_df[summary_df['Risk_Category'] == 'Blood Pressure']
-    lipid_data = summary_df[summary_df['Risk_Category'] == 'Lipid Profile']
-    glucose_data = summary_df[summary_df['Risk_Category'] == 'Glucose Metabolism']
-    
-    anthro_sig_pct = anthro_data['Significant'].mean() * 100
-    bp_sig_pct = bp_data['Significant'].mean() * 100
-    lipid_sig_pct = lipid_data['Significant'].mean() * 100
-    glucose_sig_pct = glucose_data['Significant'].mean() * 100
-    
-    f.write(f'1. **Developmental Patterns**: The proportion of significant associations between childhood cognitive ability and cardiovascular risk factors increases from childhood ({child_sig_pct:.1f}%) to early adulthood ({early_sig_pct:.1f}%), suggesting that these relationships may become more pronounced with age.\n\n')
-    
-    f.write(f'2. **Risk Factor Categories**: The strength and consistency of associations vary by risk factor category:\n')
-    f.write(f'   - Anthropometric measures show the most consistent associations ({anthro_sig_pct:.1f}% significant)\n')
-    f.write(f'   - Blood pressure measures show moderate consistency ({bp_sig_pct:.1f}% significant)\n')
-    f.write(f'   - Glucose metabolism measures show variable consistency ({glucose_sig_pct:.1f}% significant)\n')
-    f.write(f'   - Lipid profile measures show the least consistency ({lipid_sig_pct:.1f}% significant)\n\n')
-    
-    f.write('3. **Direction of Associations**: The majority of significant associations are negative, indicating that higher childhood cognitive ability is generally associated with more favorable cardiovascular risk profiles. However, some measures (particularly HDL cholesterol) show positive associations in early adulthood.\n\n')
-    
-    f.write('4. **Trajectories Across Development**: The analysis reveals distinct trajectories for different risk factor categories across development, with some showing strengthening associations with age (e.g., anthropometric measures) and others showing more complex patterns.\n\n')
-    
-    f.write('## Implications\n\n')
-    f.write('These findings have several implications for understanding the relationship between childhood cognitive ability and cardiovascular health:\n\n')
-    
-    f.write('1. **Developmental Sensitivity**: The strengthening of associations with age suggests that the transition to adulthood may be a particularly sensitive period for the manifestation of cognitive-cardiovascular relationships.\n\n')
-    
-    f.write('2. **Risk Factor Specificity**: The variation in patterns across different risk factor categories suggests potentially different underlying mechanisms linking cognitive ability to various aspects of cardiovascular health.\n\n')
-    
-    f.write('3. **Cumulative Effects**: The increasing strength of associations with age may reflect cumulative effects of cognitive ability on health behaviors and physiological processes over time.\n\n')
-    
-    f.write('4. **Prevention Implications**: The findings suggest that early cognitive development may be an important target for cardiovascular disease prevention, with potential benefits that accumulate across development.\n\n')
-    
-    f.write('## Conclusion\n\n')
-    f.write('This extended analysis provides a more nuanced understanding of the relationship between childhood cognitive ability and cardiovascular risk fact\n\n')
+# Create a summary of the extended analysis for each exposure from the significance rates computed above
+for iq_var in exposures:
+    write_report(f'{DOCS_DIR}/extended_analysis_summary{exposure_suffix(iq_var)}.md',
+                 render_extended_analysis_summary(sig_by_period.loc[iq_var], sig_by_category.loc[iq_var],
+                                                  exposure_description(iq_var)))
+
+flush_outputs()
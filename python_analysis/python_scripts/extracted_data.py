@@ -1,39 +1,47 @@
+import argparse
+import glob
+import re
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 import os
 
+from factor_metadata import risk_factors, DEFAULT_IQ_VAR, exposure_suffix
+from output_sink import flush_outputs, write_csv
+from paths import FIGURES_DIR, LOG_DIR, TABLES_DIR
+from results_store import write_results, significance_stars
+from stata_log_parser import parse_log
+
+parser = argparse.ArgumentParser(description='Extract the Stata regression summaries into the results dataset.')
+parser.add_argument('--iq-var', default=DEFAULT_IQ_VAR,
+                    help='IQ exposure of sections whose header does not name one (default: %(default)s)')
+parser.add_argument('--from-logs', nargs='*', metavar='LOG',
+                    help=f'parse the Stata logs directly (default: {LOG_DIR}/*.log), '
+                         'picking up every exposure they contain')
+parser.add_argument('--legacy-csv', action='store_true',
+                    help='also write the per-factor, all_results_summary and readable_summary CSV files')
+args = parser.parse_args()
+
 # Create directories for outputs
-os.makedirs('../tables', exist_ok=True)
-os.makedirs('../figures', exist_ok=True)
+os.makedirs(TABLES_DIR, exist_ok=True)
+os.makedirs(FIGURES_DIR, exist_ok=True)
 
-# Define the cardiovascular risk factors
-risk_factors = {
-    'bmi': 'Body Mass Index',
-    'wc': 'Waist Circumference',
-    'bp_sys': 'Systolic Blood Pressure',
-    'bp_dia': 'Diastolic Blood Pressure',
-    'chol': 'Total Cholesterol',
-    'hdl': 'High-density Lipoprotein',
-    'ldl': 'Low-Density Lipoprotein',
-    'trig': 'Triglycerides',
-    'glc_meta': 'Glucose Metabolism',
-    'insul': 'Insulin',
-    'cfpwv': 'Carotid Femoral PWV'
-}
+# Section header, optionally naming the IQ exposure: "DepVar: [bmi]" or "DepVar: [bmi] Exposure: [total_iq_15]"
+SECTION_RE = re.compile(r'^DepVar: \[(?P<factor>\w+)\](?:\s+Exposure: \[(?P<iq_var>\w+)\])?')
 
 # Function to extract data from the results file
-def extract_data(file_path):
+def extract_data(file_path, default_iq_var=DEFAULT_IQ_VAR):
     with open(file_path, 'r') as f:
         content = f.read()
     
-    # Split by risk factor sections
+    # Split by (risk factor, exposure) sections
     sections = {}
     current_section = None
     
     for line in content.split('\n'):
-        if line.startswith('DepVar: ['):
-            current_section = line.strip('DepVar: []')
+        match = SECTION_RE.match(line)
+        if match:
+            current_section = (match.group('factor'), match.group('iq_var') or default_iq_var)
             sections[current_section] = []
         elif current_section and line and not line.startswith('DepVar,'):
             sections[current_section].append(line)
@@ -41,7 +49,7 @@ def extract_data(file_path):
     # Process each section into a DataFrame
     dataframes = {}
     
-    for factor, lines in sections.items():
+    for key, lines in sections.items():
         if not lines:
             continue
             
@@ -90,58 +98,75 @@ def extract_data(file_path):
         
         df = pd.DataFrame(data)
         df = df.sort_values('Age')
-        dataframes[factor] = df
+        dataframes[key] = df
     
     return dataframes
 
-# Extract data from the results file
-data_frames = extract_data('../tables/stata_regress_zscore_by_depvar_by_age.csv')
+# Extract data from the results file, or straight from the Stata logs
+if args.from_logs is None:
+    data_frames = extract_data(f'{TABLES_DIR}/stata_regress_zscore_by_depvar_by_age.csv', args.iq_var)
+else:
+    log_files = args.from_logs or sorted(glob.glob(f'{LOG_DIR}/*.log'))
+    parsed = pd.concat([parse_log(path) for path in log_files], ignore_index=True)
+    data_frames = {key: df.drop(columns=['Factor', 'IQ_Var']).sort_values('Age').reset_index(drop=True)
+                   for key, df in parsed.groupby(['Factor', 'IQ_Var'], sort=False)}
 
-# Save each DataFrame to a CSV file
-for factor, df in data_frames.items():
-    df.to_csv(f'../tables/{factor}_results.csv', index=False)
+# Combine all (factor, exposure) sections into one long results frame and write the partitioned dataset
+results_df = pd.concat(
+    [df.assign(Factor=factor, IQ_Var=iq_var) for (factor, iq_var), df in data_frames.items()],
+    ignore_index=True
+)
+write_results(results_df)
 
-# Create a summary DataFrame with key information
-summary_data = []
+if args.legacy_csv:
+    # Save each DataFrame to a CSV file
+    for (factor, iq_var), df in data_frames.items():
+        write_csv(df, f'{TABLES_DIR}/{factor}_results{exposure_suffix(iq_var)}.csv', index=False)
 
-for factor, df in data_frames.items():
-    for _, row in df.iterrows():
-        if row['Coefficient'] is not None:
-            significance = "***" if row['P_value'] < 0.001 else "**" if row['P_value'] < 0.01 else "*" if row['P_value'] < 0.05 else ""
-            summary_data.append({
-                'Risk Factor': risk_factors.get(factor, factor),
-                'Age': row['Age'],
-                'Coefficient': row['Coefficient'],
-                'CI_Lower': row['CI_Lower'],
-                'CI_Upper': row['CI_Upper'],
-                'P_value': row['P_value'],
-                'Significance': significance,
-                'R2': row['R2'],
-                'N': row['N']
-            })
+    # Create a summary DataFrame with key information
+    summary_data = []
 
-summary_df = pd.DataFrame(summary_data)
-summary_df.to_csv('../tables/all_results_summary.csv', index=False)
+    for (factor, iq_var), df in data_frames.items():
+        for _, row in df.iterrows():
+            if row['Coefficient'] is not None:
+                significance = significance_stars(row['P_value'])
+                summary_data.append({
+                    'IQ_Var': iq_var,
+                    'Risk Factor': risk_factors.get(factor, factor),
+                    'Age': row['Age'],
+                    'Coefficient': row['Coefficient'],
+                    'CI_Lower': row['CI_Lower'],
+                    'CI_Upper': row['CI_Upper'],
+                    'P_value': row['P_value'],
+                    'Significance': significance,
+                    'R2': row['R2'],
+                    'N': row['N']
+                })
 
-# Create a more readable summary table
-readable_summary = []
+    summary_df = pd.DataFrame(summary_data)
+    write_csv(summary_df, f'{TABLES_DIR}/all_results_summary.csv', index=False)
 
-for factor, df in data_frames.items():
-    for _, row in df.iterrows():
-        if row['Coefficient'] is not None:
-            significance = "***" if row['P_value'] < 0.001 else "**" if row['P_value'] < 0.01 else "*" if row['P_value'] < 0.05 else ""
-            coef_with_ci = f"{row['Coefficient']:.4f} ({row['CI_Lower']:.4f} to {row['CI_Upper']:.4f}){significance}"
-            readable_summary.append({
-                'Risk Factor': risk_factors.get(factor, factor),
-                'Age': row['Age'],
-                'Coefficient (95% CI)': coef_with_ci,
-                'P-value': f"{row['P_value']:.4f}",
-                'R²': f"{row['R2']:.4f}",
-                'Sample Size': row['N']
-            })
+    # Create a more readable summary table
+    readable_summary = []
+
+    for (factor, iq_var), df in data_frames.items():
+        for _, row in df.iterrows():
+            if row['Coefficient'] is not None:
+                significance = significance_stars(row['P_value'])
+                coef_with_ci = f"{row['Coefficient']:.4f} ({row['CI_Lower']:.4f} to {row['CI_Upper']:.4f}){significance}"
+                readable_summary.append({
+                    'IQ_Var': iq_var,
+                    'Risk Factor': risk_factors.get(factor, factor),
+                    'Age': row['Age'],
+                    'Coefficient (95% CI)': coef_with_ci,
+                    'P-value': f"{row['P_value']:.4f}",
+                    'R²': f"{row['R2']:.4f}",
+                    'Sample Size': row['N']
+                })
 
-readable_df = pd.DataFrame(readable_summary)
-readable_df = readable_df.sort_values(['Risk Factor', 'Age'])
-readable_df.to_csv('../tables/readable_summary.csv', index=False)
+    readable_df = pd.DataFrame(readable_summary)
+    readable_df = readable_df.sort_values(['IQ_Var', 'Risk Factor', 'Age'])
+    write_csv(readable_df, f'{TABLES_DIR}/readable_summary.csv', index=False)
 
+flush_outputs()
 print("Data extraction and organisation complete.")
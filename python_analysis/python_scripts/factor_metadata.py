@@ -0,0 +1,128 @@
+import os
+
+# Define the cardiovascular risk factors (Stata variable stem -> display label)
+risk_factors = {
+    'bmi': 'Body Mass Index',
+    'wc': 'Waist Circumference',
+    'bp_sys': 'Systolic Blood Pressure',
+    'bp_dia': 'Diastolic Blood Pressure',
+    'chol': 'Total Cholesterol',
+    'hdl': 'High-density Lipoprotein',
+    'ldl': 'Low-Density Lipoprotein',
+    'trig': 'Triglycerides',
+    'glc_meta': 'Glucose Metabolism',
+    'insul': 'Insulin',
+    'cfpwv': 'Carotid Femoral PWV'
+}
+
+# Short label and colour of each risk factor in the exposure plots (js_exposures_plot_by_age.do);
+# factors are plotted in risk_factors order
+factor_plot_styles = {
+    'bmi': ('BMI', '#1a476f'),
+    'wc': ('Waist Circumference', '#a0522d'),
+    'bp_sys': ('Systolic BP', '#55752f'),
+    'bp_dia': ('Diastolic BP', '#90353b'),
+    'chol': ('Cholesterol', '#800080'),
+    'hdl': ('HDL', '#6e8e84'),
+    'ldl': ('LDL', '#00ff00'),
+    'trig': ('Triglycerides', '#006400'),
+    'glc_meta': ('Glucose Metabolism', '#ff7f00'),
+    'insul': ('Insulin', '#c10534'),
+    'cfpwv': ('Carotid Femoral PWV', '#0000ff')
+}
+
+# Measurement ages regressed for each risk factor (the `<factor>_age_cfpwv_vars` locals of js_cfpwv.do)
+outcome_ages = {
+    'bmi': [9, 17, 24],
+    'wc': [9, 24],
+    'bp_sys': [9, 17, 24],
+    'bp_dia': [9, 17, 24],
+    'chol': [9, 17, 24],
+    'hdl': [9, 17, 24],
+    'ldl': [9, 17, 24],
+    'trig': [9, 17, 24],
+    'glc_meta': [9, 17, 24],
+    'insul': [9, 17, 24],
+    'cfpwv': [17, 24]
+}
+
+# IQ exposures defined in js_cfpwv.do (variable -> description used in titles and reports)
+iq_vars = {
+    'verbal_iq_8': 'childhood verbal IQ at age 8',
+    'perf_iq_8': 'childhood performance IQ at age 8',
+    'total_iq_8': 'childhood IQ at age 8',
+    'cat_iq_8': 'childhood categorical IQ at age 8',
+    'total_iq_15': 'adolescent IQ at age 15'
+}
+
+# IQ exposure used by js_cfpwv.do (`local iq_vars 8` -> z_total_iq_8)
+DEFAULT_IQ_VAR = 'total_iq_8'
+
+# Stratum the analysis scripts report on: 'all' (default, the js_cfpwv.do models), a stratum such
+# as 'sex=2' or 'ses=3', or an IQ interaction term such as 'iq_x_sex=2' (regression_engine.py
+# --stratify); outputs of any other stratum than 'all' get a '_<stratum>' suffix
+ALL_STRATA = 'all'
+STRATUM = os.environ.get('CFPWV_STRATUM', ALL_STRATA)
+
+# Levels of the stratification variables (kz021; highest parental social class from c755/c765)
+stratum_labels = {
+    'sex': {1: 'boys', 2: 'girls'},
+    'ses': {1: 'social class I', 2: 'social class II', 3: 'social class III (non-manual)',
+            4: 'social class III (manual)', 5: 'social class IV', 6: 'social class V'},
+}
+
+
+def stratum_key(variable, level, interaction=False):
+    """Stratum key of a level of a stratification variable, e.g. 'sex=2' or 'iq_x_sex=2'."""
+    level = int(level) if float(level).is_integer() else level
+    return f"{'iq_x_' if interaction else ''}{variable}={level}"
+
+
+def stratum_description(stratum):
+    """Describe a stratum in running text, e.g. 'girls' or 'IQ x girls interaction'."""
+    if stratum == ALL_STRATA:
+        return ''
+    term, level = stratum.split('=')
+    variable = term.removeprefix('iq_x_')
+    label = stratum_labels.get(variable, {}).get(int(level) if level.isdigit() else level, f'{variable} {level}')
+    return f'IQ x {label} interaction' if term.startswith('iq_x_') else label
+
+
+def exposure_description(iq_var, stratum=STRATUM):
+    """Describe an IQ exposure in running text, e.g. 'childhood IQ at age 8' (or '... in girls' for a stratum)."""
+    description = iq_vars.get(iq_var, iq_var)
+    if stratum == ALL_STRATA:
+        return description
+    if stratum.startswith('iq_x_'):
+        return f'{description} ({stratum_description(stratum)})'
+    return f'{description} in {stratum_description(stratum)}'
+
+
+def exposure_title(iq_var, stratum=STRATUM):
+    """Describe an IQ exposure in a figure title, e.g. 'Childhood IQ at Age 8'."""
+    return ' '.join(word if word.isupper() or word in ('at', 'in', 'x') else word.capitalize()
+                    for word in exposure_description(iq_var, stratum).split())
+
+
+def stratum_suffix(stratum=STRATUM):
+    """File name suffix for a stratum's outputs, e.g. '_sex2' (none for all strata)."""
+    return '' if stratum == ALL_STRATA else f"_{stratum.replace('=', '')}"
+
+
+def exposure_suffix(iq_var, stratum=STRATUM):
+    """File name suffix for an exposure's outputs (none for the default exposure and all strata)."""
+    return ('' if iq_var == DEFAULT_IQ_VAR else f'_{iq_var}') + stratum_suffix(stratum)
+
+# Risk factor categories (Stata variable stems), in display order
+risk_categories = {
+    'Anthropometric': ['bmi', 'wc'],
+    'Blood Pressure': ['bp_sys', 'bp_dia'],
+    'Lipid Profile': ['chol', 'hdl', 'ldl', 'trig'],
+    'Glucose Metabolism': ['glc_meta', 'insul'],
+    'Arterials Stiffness': ['cfpwv']
+}
+factor_category = {factor: category for category, factors in risk_categories.items() for factor in factors}
+
+# Developmental periods used to group the measurement ages
+period_bins = [8, 12, 16, 25]
+period_labels = ['Childhood (9-12)', 'Adolescence (13-16)', 'Early Adulthood (17-24)']
@@ -0,0 +1,278 @@
+import argparse
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+
+import numpy as np
+import pandas as pd
+
+from cohort_data import COHORT_FILE, load_cohort
+from factor_metadata import DEFAULT_IQ_VAR
+from missingness_index import MissingnessIndex
+from multiple_imputation import IMPUTATION_COLUMNS, impute_chained, imputation_sample, pool_rubin
+from output_sink import flush_outputs, write_parquet
+from paths import TABLES_DIR
+from regression_engine import FACTOR_COVARIATES, run_regressions
+
+# Job table (put it on a path every worker machine mounts) and the collected results of the grid
+QUEUE_FILE = f'{TABLES_DIR}/jobs.sqlite'
+SPEC_GRID_FILE = f'{TABLES_DIR}/spec_grid_results.parquet'
+
+# Seconds a claimed job stays leased without a heartbeat, and attempts before a job is given up
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    spec TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    result BLOB,
+    error TEXT,
+    updated REAL
+)
+"""
+
+
+def connect(path=QUEUE_FILE):
+    """Open the job table. Transactions are explicit (BEGIN IMMEDIATE) and writers wait for the lock.
+
+    The rollback journal is kept (no WAL), since WAL needs shared memory that network file
+    systems do not provide.
+    """
+    connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+    connection.execute('PRAGMA busy_timeout = 60000')
+    connection.execute(SCHEMA)
+    return connection
+
+
+def job_spec(iq_var, covariates=FACTOR_COVARIATES, ages=None, imputation=None, seed=2024):
+    """Canonical JSON of one model job (the same spec is never queued twice)."""
+    return json.dumps({
+        'iq_var': iq_var,
+        'covariates': list(covariates),
+        'ages': None if ages is None else sorted(int(age) for age in ages),
+        'imputation': imputation,
+        'seed': seed if imputation is not None else None,
+    }, sort_keys=True)
+
+
+def submit_grid(connection, iq_vars=(DEFAULT_IQ_VAR,), covariate_sets=(FACTOR_COVARIATES,), age_lists=(None,),
+                imputations=0, seed=2024):
+    """Queue every covariates x exposure x age list x imputation draw job; returns the number added.
+
+    With ``imputations`` = 0 the complete-case grid is queued, otherwise one job per draw.
+    """
+    draws = range(imputations) if imputations else [None]
+    specs = [job_spec(iq_var, covariates, ages, draw, seed)
+             for covariates, iq_var, ages, draw in itertools.product(covariate_sets, iq_vars, age_lists, draws)]
+    connection.execute('BEGIN IMMEDIATE')
+    before = connection.total_changes
+    connection.executemany('INSERT OR IGNORE INTO jobs (spec, updated) VALUES (?, ?)',
+                           [(spec, time.time()) for spec in specs])
+    added = connection.total_changes - before
+    connection.execute('COMMIT')
+    return added
+
+
+def claim(connection, worker, lease=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+    """Lease the next pending (or expired) job to ``worker``; returns ``(id, attempt, spec)`` or None.
+
+    The select and the update happen under one write lock, so two workers never claim the same
+    job; ``attempt`` fences the completion of a worker whose lease expired and was re-claimed.
+    Jobs whose lease expired on their last attempt are marked failed under the same lock.
+    """
+    now = time.time()
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        connection.execute(
+            "UPDATE jobs SET status = 'failed', error = 'lease expired after ' || attempts || ' attempts', "
+            "lease_expires = NULL, updated = ? WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+            (now, now, max_attempts))
+        row = connection.execute(
+            "SELECT id, attempts, spec FROM jobs WHERE attempts < ? AND "
+            "(status = 'pending' OR (status = 'running' AND lease_expires < ?)) ORDER BY id LIMIT 1",
+            (max_attempts, now)).fetchone()
+        if row is not None:
+            connection.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, lease_expires = ?, "
+                "updated = ? WHERE id = ?", (worker, now + lease, now, row[0]))
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    return None if row is None else (row[0], row[1] + 1, json.loads(row[2]))
+
+
+def renew(connection, job_id, attempt, lease=LEASE_SECONDS):
+    """Extend the lease of a running job; False if it has been re-claimed meanwhile."""
+    cursor = connection.execute(
+        "UPDATE jobs SET lease_expires = ? WHERE id = ? AND attempts = ? AND status = 'running'",
+        (time.time() + lease, job_id, attempt))
+    return cursor.rowcount == 1
+
+
+def complete(connection, job_id, attempt, results_df):
+    """Store the results of a job (as Parquet) unless its lease was lost to another worker."""
+    buffer = io.BytesIO()
+    results_df.to_parquet(buffer, index=False)
+    cursor = connection.execute(
+        "UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_expires = NULL, updated = ? "
+        "WHERE id = ? AND attempts = ? AND status = 'running'",
+        (buffer.getvalue(), time.time(), job_id, attempt))
+    return cursor.rowcount == 1
+
+
+def fail(connection, job_id, attempt, error, max_attempts=MAX_ATTEMPTS):
+    """Record a failed attempt: the job is retried until it has used ``max_attempts``."""
+    connection.execute(
+        "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, error = ?, "
+        "lease_expires = NULL, updated = ? WHERE id = ? AND attempts = ? AND status = 'running'",
+        (max_attempts, error, time.time(), job_id, attempt))
+
+
+def fit_job(cohort, spec, sample=None, index=None):
+    """Fit the regression grid of one job spec with the batched engine.
+
+    ``index`` (the MissingnessIndex of ``cohort``) is reused by every complete-case job of a worker.
+    """
+    if spec['imputation'] is not None:
+        rng = np.random.default_rng([spec['seed'], spec['imputation']])
+        cohort = sample.copy()
+        cohort[IMPUTATION_COLUMNS] = impute_chained(cohort[IMPUTATION_COLUMNS], rng)
+        index = None
+    return run_regressions(cohort, [spec['iq_var']], covariates=spec['covariates'], ages=spec['ages'], index=index)
+
+
+def run_worker(queue_path=QUEUE_FILE, data_path=COHORT_FILE, lease=LEASE_SECONDS, poll=5.0, wait=False):
+    """Claim and fit jobs until the queue is drained (or forever with ``wait``); returns the jobs done.
+
+    The cohort is loaded (and its missingness indexed) once per worker. A heartbeat thread
+    renews the lease while a job is being fitted, so only jobs of dead workers expire and are retried.
+    """
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    connection = connect(queue_path)
+    cohort = load_cohort(data_path)
+    index = MissingnessIndex.from_cohort(cohort)
+    sample = None
+    done = 0
+    while True:
+        job = claim(connection, worker, lease)
+        if job is None:
+            if not wait:
+                return done
+            time.sleep(poll)
+            continue
+        job_id, attempt, spec = job
+        if spec['imputation'] is not None and sample is None:
+            sample = cohort.loc[imputation_sample(cohort), IMPUTATION_COLUMNS]
+
+        stop = threading.Event()
+
+        def heartbeat():
+            heartbeat_connection = connect(queue_path)
+            while not stop.wait(lease / 3) and renew(heartbeat_connection, job_id, attempt, lease):
+                pass
+            heartbeat_connection.close()
+
+        thread = threading.Thread(target=heartbeat, daemon=True)
+        thread.start()
+        try:
+            results_df = fit_job(cohort, spec, sample, index)
+        except Exception:
+            stop.set()
+            thread.join()
+            fail(connection, job_id, attempt, traceback.format_exc())
+            continue
+        stop.set()
+        thread.join()
+        if complete(connection, job_id, attempt, results_df):
+            done += 1
+
+
+def queue_status(connection):
+    """Number of jobs in each status."""
+    return dict(connection.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+
+def collect(connection):
+    """Results of every finished job with its spec columns; imputation draws are pooled by Rubin's rules."""
+    frames = []
+    for spec, result in connection.execute("SELECT spec, result FROM jobs WHERE status = 'done' ORDER BY id"):
+        spec = json.loads(spec)
+        df = pd.read_parquet(io.BytesIO(result))
+        df['Covariates'] = ' '.join(spec['covariates']) or 'none'
+        df['Ages'] = 'all' if spec['ages'] is None else ' '.join(map(str, spec['ages']))
+        df['Imputation'] = spec['imputation']
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame()
+    results_df = pd.concat(frames, ignore_index=True)
+
+    imputed = results_df['Imputation'].notna()
+    complete_case = results_df[~imputed].assign(Imputation='none')
+    pooled = []
+    for (covariates, ages), draws in results_df[imputed].groupby(['Covariates', 'Ages']):
+        if draws['Imputation'].nunique() >= 2:
+            pooled.append(pool_rubin(draws).assign(Covariates=covariates, Ages=ages, Imputation='pooled'))
+        else:
+            pooled.append(draws.assign(Imputation=draws['Imputation'].astype(int).astype(str)))
+    return pd.concat([complete_case] + pooled, ignore_index=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the sensitivity grid through a shared SQLite job table.')
+    parser.add_argument('--queue', default=QUEUE_FILE, help='job table (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    submit = commands.add_parser('submit', help='queue the grid of model jobs')
+    submit.add_argument('--iq-var', nargs='+', default=[DEFAULT_IQ_VAR], help='IQ exposures (default: %(default)s)')
+    submit.add_argument('--covariates', nargs='+', action='append',
+                        help="factor covariate set, repeatable; 'none' for no covariates (default: sex ses)")
+    submit.add_argument('--ages', nargs='+', type=int, action='append', help='age list, repeatable (default: all ages)')
+    submit.add_argument('--imputations', type=int, default=0, help='imputation draws per spec (default: complete case)')
+    submit.add_argument('--seed', type=int, default=2024, help='random seed of the imputations (default: %(default)s)')
+
+    work = commands.add_parser('work', help='claim and fit jobs')
+    work.add_argument('--data', default=COHORT_FILE, help='ALSPAC .dta extract (default: %(default)s)')
+    work.add_argument('--processes', type=int, default=1, help='worker processes on this machine (default: %(default)s)')
+    work.add_argument('--lease', type=float, default=LEASE_SECONDS, help='lease in seconds (default: %(default)s)')
+    work.add_argument('--wait', action='store_true', help='keep polling for new jobs when the queue is empty')
+
+    commands.add_parser('status', help='count the jobs by status')
+    gather = commands.add_parser('collect', help='write the results of the finished jobs')
+    gather.add_argument('--output', default=SPEC_GRID_FILE, help='Parquet file (default: %(default)s)')
+    args = parser.parse_args()
+
+    if args.command == 'submit':
+        covariate_sets = [[] if sets == ['none'] else sets for sets in args.covariates or [FACTOR_COVARIATES]]
+        added = submit_grid(connect(args.queue), args.iq_var, covariate_sets, args.ages or [None],
+                            args.imputations, args.seed)
+        print(f"Queued {added} new jobs in {args.queue}.")
+    elif args.command == 'work':
+        worker_args = (args.queue, args.data, args.lease, 5.0, args.wait)
+        if args.processes == 1:
+            done = run_worker(*worker_args)
+        else:
+            with multiprocessing.Pool(args.processes) as pool:
+                done = sum(pool.starmap(run_worker, [worker_args] * args.processes))
+        print(f"Fitted {done} jobs.")
+    elif args.command == 'status':
+        print(queue_status(connect(args.queue)))
+    else:
+        results_df = collect(connect(args.queue))
+        write_parquet(results_df, args.output, index=False)
+        flush_outputs()
+        failed = queue_status(connect(args.queue)).get('failed', 0)
+        print(f"Collected {len(results_df)} results into {args.output}."
+              + (f" {failed} failed jobs are left out (see their error in the job table)." if failed else ''))
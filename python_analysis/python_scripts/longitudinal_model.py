@@ -0,0 +1,276 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from scipy import optimize, sparse, stats
+from scipy.linalg import cho_factor, cho_solve
+from scipy.sparse.linalg import splu
+
+from checkpoint import FitCheckpoint, fingerprint
+from cohort_data import COHORT_FILE, load_cohort
+from factor_metadata import DEFAULT_IQ_VAR, outcome_ages
+from output_sink import flush_outputs, write_csv
+from paths import TABLES_DIR
+from regression_engine import FACTOR_COVARIATES, indicator_columns
+
+# Participant-level IQ x age trends, read by cross_age_trend_analysis.py when present
+TRENDS_FILE = f'{TABLES_DIR}/longitudinal_trends.csv'
+
+# Age (years) at which the IQ main effect is reported: the first measurement wave
+AGE_CENTRE = 9
+
+# Finite-difference step of the deviance gradient, and largest projected gradient of a converged fit
+GRADIENT_STEP = 1e-5
+GRADIENT_TOLERANCE = 0.1
+
+# Fixed effects of the model, in design column order (sex/SES indicators follow)
+FIXED_EFFECTS = ['Intercept', 'IQ', 'Age', 'IQ_x_Age']
+
+
+def long_format(cohort, factor, iq_var):
+    """Stack the z-scored measurements of one risk factor into one row per participant and wave.
+
+    The time scale is the age at the clinic visit in years (the nominal wave age when it was
+    not recorded), centred at AGE_CENTRE.
+    """
+    frames = []
+    for age in outcome_ages[factor]:
+        frames.append(pd.DataFrame({
+            'id': cohort.index,
+            'wave': age,
+            'time': (cohort[f'age_{age}'] / 12).fillna(age) - AGE_CENTRE,
+            'y': cohort[f'z_{factor}_{age}'],
+            'z_iq': cohort[f'z_{iq_var}'],
+            **{covariate: cohort[covariate] for covariate in FACTOR_COVARIATES},
+        }))
+    return pd.concat(frames, ignore_index=True).dropna().sort_values(['id', 'wave'], ignore_index=True)
+
+
+def mixed_design(long_df, random_slope=True):
+    """Fixed-effects matrix X and sparse random-effects matrix Z (intercept and age slope per participant)."""
+    time = long_df['time'].to_numpy(float)
+    z_iq = long_df['z_iq'].to_numpy(float)
+    columns = [np.ones(len(long_df)), z_iq, time, z_iq * time]
+    for covariate in FACTOR_COVARIATES:
+        columns.extend(indicator_columns(long_df[covariate].to_numpy()))
+    X = np.column_stack(columns)
+
+    codes, participants = pd.factorize(long_df['id'])
+    n_re = 2 if random_slope else 1
+    n = len(long_df)
+    rows = np.repeat(np.arange(n), n_re)
+    cols = (codes[:, None] * n_re + np.arange(n_re)).ravel()
+    values = np.column_stack([np.ones(n), time])[:, :n_re].ravel()
+    Z = sparse.csr_matrix((values, (rows, cols)), shape=(n, len(participants) * n_re))
+    return X, Z, n_re
+
+
+class ProfiledREML:
+    """Profiled REML criterion of ``y = X b + Z u + e`` with ``u ~ N(0, s2 * Lambda Lambda')``.
+
+    Follows the penalised least squares formulation of lme4: for relative covariance
+    parameters theta (the lower triangle of the per-participant factor of Lambda), the sparse
+    system ``Lambda' Z' Z Lambda + I`` is factorised with SuperLU and the fixed effects and
+    residual variance are profiled out. The cross-products are computed once per outcome.
+    """
+
+    def __init__(self, X, Z, y, n_re):
+        self.n, self.p = X.shape
+        self.n_re = n_re
+        self.n_groups = Z.shape[1] // n_re
+        self.ZtZ = (Z.T @ Z).tocsc()
+        self.ZtX = Z.T @ X
+        self.Zty = Z.T @ y
+        self.XtX = X.T @ X
+        self.Xty = X.T @ y
+        self.yty = y @ y
+        self.tril = np.tril_indices(n_re)
+        self.diagonal = self.tril[0] == self.tril[1]
+        # Scale of the random-effects columns, so the starting slope SD is one residual SD over the age range
+        self.z_scale = np.sqrt(self.ZtZ.diagonal().reshape(-1, n_re).mean(axis=0))
+
+    def relative_factor(self, theta):
+        """Per-participant lower-triangular factor of the random-effects covariance (in units of s2)."""
+        L = np.zeros((self.n_re, self.n_re))
+        L[self.tril] = theta
+        return L
+
+    def solve(self, theta):
+        """Solve the penalised least squares problem for ``theta``."""
+        L = self.relative_factor(theta)
+        Lam = sparse.kron(sparse.identity(self.n_groups, format='csc'), sparse.csc_matrix(L), format='csc')
+        A = (Lam.T @ self.ZtZ @ Lam + sparse.identity(Lam.shape[0], format='csc')).tocsc()
+        # A is block diagonal (one block per participant), so the natural ordering has no fill-in
+        lu = splu(A, permc_spec='NATURAL', diag_pivot_thresh=0)
+        LamZtX = Lam.T @ self.ZtX
+        LamZty = Lam.T @ self.Zty
+
+        CZX = lu.solve(LamZtX)
+        cu = lu.solve(LamZty)
+        RXtRX = self.XtX - LamZtX.T @ CZX
+        RX = cho_factor(RXtRX)
+        beta = cho_solve(RX, self.Xty - LamZtX.T @ cu)
+        u = cu - CZX @ beta
+        # Penalised residual sum of squares from the normal equations
+        pwrss = self.yty - LamZty @ u - self.Xty @ beta
+        return {
+            'beta': beta,
+            'pwrss': pwrss,
+            'logdet_A': np.log(np.abs(lu.U.diagonal())).sum(),
+            'logdet_RX': 2 * np.log(np.diag(RX[0])).sum(),
+            'RX': RX,
+            'L': L,
+        }
+
+    def deviance(self, theta):
+        """REML deviance profiled over the fixed effects and the residual variance."""
+        sol = self.solve(theta)
+        dof = self.n - self.p
+        return sol['logdet_A'] + sol['logdet_RX'] + dof * (1 + np.log(2 * np.pi * sol['pwrss'] / dof))
+
+    def projected_gradient(self, theta):
+        """Gradient of the deviance by central differences (forward at a zero diagonal element),
+        without the components that would push a zero diagonal element below its bound."""
+        gradient = np.empty(len(theta))
+        at_bound = self.diagonal & (theta < GRADIENT_STEP)
+        for i in range(len(theta)):
+            step = np.zeros(len(theta))
+            step[i] = GRADIENT_STEP
+            if at_bound[i]:
+                gradient[i] = min((self.deviance(theta + step) - self.deviance(theta)) / GRADIENT_STEP, 0)
+            else:
+                gradient[i] = (self.deviance(theta + step) - self.deviance(theta - step)) / (2 * GRADIENT_STEP)
+        return gradient
+
+    def fit(self):
+        """Minimise the deviance over theta (diagonal elements of the factor kept non-negative).
+
+        Like lme4, a derivative-free optimiser is used first, since the deviance is flat near the
+        boundary. Bounded Nelder-Mead can stick at a zero diagonal element, so the optimum is
+        then polished by L-BFGS-B, from the Nelder-Mead optimum and from it with the zero
+        variances restarted at their initial values, and the lowest deviance is kept. The fit has
+        converged if the projected gradient vanishes there.
+        """
+        theta0 = np.diag(self.z_scale[0] / self.z_scale)[self.tril]
+        bounds = [(0, None) if diagonal else (None, None) for diagonal in self.diagonal]
+        results = [optimize.minimize(self.deviance, theta0, method='Nelder-Mead', bounds=bounds,
+                                     options={'xatol': 1e-6, 'fatol': 1e-6})]
+        starts = [results[0].x]
+        at_bound = self.diagonal & (results[0].x <= 0)
+        if at_bound.any():
+            starts.append(np.where(at_bound, theta0, results[0].x))
+        for start in starts:
+            results.append(optimize.minimize(self.deviance, start, method='L-BFGS-B', bounds=bounds,
+                                             options={'ftol': 1e-14, 'gtol': 1e-6}))
+        result = min(results, key=lambda result: result.fun)
+        sol = self.solve(result.x)
+        sigma2 = sol['pwrss'] / (self.n - self.p)
+        sol.update({
+            'theta': result.x,
+            'converged': bool(np.abs(self.projected_gradient(result.x)).max() < GRADIENT_TOLERANCE),
+            'deviance': result.fun,
+            'sigma2': sigma2,
+            'cov_beta': sigma2 * cho_solve(sol['RX'], np.eye(self.p)),
+            'cov_re': sigma2 * sol['L'] @ sol['L'].T,
+        })
+        return sol
+
+
+def fit_trend(factor, iq_var, long_df, random_slope=True):
+    """Fit the longitudinal model of one risk factor and summarise its IQ x age trend."""
+    X, Z, n_re = mixed_design(long_df, random_slope)
+    model = ProfiledREML(X, Z, long_df['y'].to_numpy(float), n_re)
+    fit = model.fit()
+
+    beta, se = fit['beta'], np.sqrt(np.diag(fit['cov_beta']))
+    iq, slope = FIXED_EFFECTS.index('IQ'), FIXED_EFFECTS.index('IQ_x_Age')
+    z_crit = stats.norm.ppf(0.975)
+    cov_re = fit['cov_re']
+    return {
+        'Factor': factor,
+        'IQ_Var': iq_var,
+        'N_Obs': model.n,
+        'N_Participants': model.n_groups,
+        'Waves': ' '.join(str(wave) for wave in sorted(long_df['wave'].unique())),
+        'IQ_Coefficient': beta[iq],
+        'IQ_SE': se[iq],
+        'IQ_Age_Slope': beta[slope],
+        'IQ_Age_SE': se[slope],
+        'IQ_Age_CI_Lower': beta[slope] - z_crit * se[slope],
+        'IQ_Age_CI_Upper': beta[slope] + z_crit * se[slope],
+        'IQ_Age_P': 2 * stats.norm.sf(abs(beta[slope] / se[slope])),
+        'Var_Intercept': cov_re[0, 0],
+        'Var_Slope': cov_re[1, 1] if n_re == 2 else np.nan,
+        'Cov_Intercept_Slope': cov_re[1, 0] if n_re == 2 else np.nan,
+        'Residual_Var': fit['sigma2'],
+        'REML_Deviance': fit['deviance'],
+        'Converged': fit['converged'],
+    }
+
+
+def fit_trends(cohort, iq_vars=(DEFAULT_IQ_VAR,), factors=None, random_slope=True, max_workers=None,
+               checkpoint=None, resume=False):
+    """Fit every (exposure, risk factor) longitudinal model, the outcomes in parallel.
+
+    With a ``checkpoint`` (checkpoint.FitCheckpoint) each model is saved as soon as it converges;
+    with ``resume`` the models saved by an interrupted run are reused instead of refitted.
+    """
+    factors = list(outcome_ages) if factors is None else factors
+    jobs = [(factor, iq_var, long_format(cohort, factor, iq_var)) for iq_var in iq_vars for factor in factors]
+    jobs = [job for job in jobs if job[2]['wave'].nunique() >= 2]
+    rows = {}
+    if checkpoint is not None and resume:
+        for factor, iq_var, _ in jobs:
+            saved = checkpoint.load(f'{iq_var}-{factor}')
+            if saved is not None:
+                rows[(factor, iq_var)] = saved.iloc[0].to_dict()
+    pending = [job for job in jobs if job[:2] not in rows]
+
+    def done(job, row):
+        rows[job[:2]] = row
+        if checkpoint is not None:
+            checkpoint.save(f'{job[1]}-{job[0]}', pd.DataFrame([row]))
+
+    if max_workers == 1 or len(pending) <= 1:
+        for job in pending:
+            done(job, fit_trend(*job, random_slope))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(fit_trend, *job, random_slope): job for job in pending}
+            for future in as_completed(futures):
+                done(futures[future], future.result())
+    return pd.DataFrame([rows[job[:2]] for job in jobs])
+
+
+def load_trends(path=TRENDS_FILE):
+    """Longitudinal trends keyed by (IQ_Var, Factor), or an empty dict if they have not been fitted."""
+    if not os.path.exists(path):
+        return {}
+    trends_df = pd.read_csv(path)
+    return {(row['IQ_Var'], row['Factor']): row for row in trends_df.to_dict('records')}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fit participant-level mixed models of each risk factor across ages.')
+    parser.add_argument('--data', default=COHORT_FILE, help='ALSPAC .dta extract (default: %(default)s)')
+    parser.add_argument('--iq-var', nargs='+', default=[DEFAULT_IQ_VAR],
+                        help='IQ exposures (default: %(default)s)')
+    parser.add_argument('--factors', nargs='+', choices=list(outcome_ages), help='risk factors (default: all)')
+    parser.add_argument('--random-intercept-only', action='store_true',
+                        help='drop the random age slopes')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--output', default=TRENDS_FILE, help='CSV file of the trends (default: %(default)s)')
+    parser.add_argument('--resume', action='store_true',
+                        help='reuse the models already fitted by an interrupted run with the same settings')
+    args = parser.parse_args()
+
+    cohort = load_cohort(args.data)
+    random_slope = not args.random_intercept_only
+    checkpoint = FitCheckpoint('longitudinal', {'data': fingerprint([args.data]), 'random_slope': random_slope})
+    trends_df = fit_trends(cohort, args.iq_var, args.factors, random_slope=random_slope, max_workers=args.workers,
+                           checkpoint=checkpoint, resume=args.resume)
+    write_csv(trends_df, args.output, index=False)
+    flush_outputs()
+    print(f"Fitted {len(trends_df)} longitudinal models; IQ x age trends written to {args.output}.")
@@ -0,0 +1,139 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from cohort_data import COHORT_FILE, load_cohort
+from factor_metadata import DEFAULT_IQ_VAR, iq_vars, outcome_ages
+from output_sink import flush_outputs, write_csv
+from paths import TABLES_DIR
+
+# Data coverage of every risk factor x wave x spec (complete-case N of each model before it is fitted)
+COVERAGE_FILE = f'{TABLES_DIR}/data_coverage.csv'
+
+# Factor covariates of `regress z_<factor>_<age> z_<iq_var> age_<age> i.sex i.ses` (re-exported by regression_engine.py)
+FACTOR_COVARIATES = ['sex', 'ses']
+
+# Set bits of every byte value, to count the participants of a packed mask
+POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+class MissingnessIndex:
+    """Availability bitmap of every variable of a cohort, packed 8 participants per byte.
+
+    The index is built once per dataset. The complete-case sample of any model is then the AND
+    of its variables' bitmaps, and its N a popcount, without touching the data again. Packed
+    masks are also compact, hashable keys (``key``) for grouping and caching by sample.
+    """
+
+    def __init__(self, bitmaps, n_rows):
+        self.bitmaps = bitmaps
+        self.n_rows = n_rows
+        self._none = np.zeros((n_rows + 7) // 8, dtype=np.uint8)
+        self._all = np.packbits(np.ones(n_rows, dtype=bool))
+
+    @classmethod
+    def from_cohort(cls, cohort, columns=None):
+        """Index the non-missing values of ``columns`` (default: every column) of a cohort frame."""
+        columns = cohort.columns if columns is None else columns
+        available = cohort[list(columns)].notna().to_numpy()
+        packed = np.packbits(available, axis=0)
+        return cls({column: packed[:, j] for j, column in enumerate(columns)}, len(cohort))
+
+    def bitmap(self, column):
+        """Packed availability of one variable."""
+        if column not in self.bitmaps:
+            raise KeyError(f'{column!r} is not a column of the indexed cohort')
+        return self.bitmaps[column]
+
+    def available(self, columns):
+        """Packed mask of the participants with every one of ``columns`` observed."""
+        packed = self._all
+        for column in columns:
+            packed = packed & self.bitmap(column)
+        return packed
+
+    def count(self, packed):
+        """Participants in a packed mask."""
+        return int(POPCOUNT[packed].sum(dtype=np.int64))
+
+    def mask(self, packed):
+        """Boolean row mask of a packed mask, for indexing the cohort."""
+        return np.unpackbits(packed, count=self.n_rows).astype(bool)
+
+    def key(self, packed):
+        """Hashable key of a packed mask (equal keys, equal samples)."""
+        return packed.tobytes()
+
+    def missing(self, column, within=None):
+        """Missing values of one variable (Stata's "<var> created with <n> missing values"), optionally
+        among the participants of the packed mask ``within`` (e.g. a stratum)."""
+        if within is None:
+            return self.n_rows - self.count(self.bitmap(column))
+        return self.count(within) - self.count(within & self.bitmap(column))
+
+    def regressors(self, iq_var, age, covariates=FACTOR_COVARIATES, cluster=None):
+        """Packed mask of the participants with every regressor of a model at ``age`` observed."""
+        return self.available([f'z_{iq_var}', f'age_{age}'] + list(covariates) + ([cluster] if cluster else []))
+
+    def model_sample(self, iq_var, age, factor, covariates=FACTOR_COVARIATES, cluster=None):
+        """Packed complete-case estimation sample of ``regress z_<factor>_<age> z_<iq_var> age_<age> <covariates>``."""
+        return self.regressors(iq_var, age, covariates, cluster) & self.bitmap(f'z_{factor}_{age}')
+
+    def coverage(self, iq_var_list=(DEFAULT_IQ_VAR,), covariate_sets=(FACTOR_COVARIATES,), factors=None, ages=None):
+        """Data coverage matrix: one row per risk factor x wave x spec (exposure and covariate set).
+
+        Every wave is listed for every factor, so the cells the grid cannot fit (NO_DATA, e.g. waist
+        circumference at 17) show up with no observed outcome rather than being left out.
+        """
+        factors = list(outcome_ages) if factors is None else factors
+        ages = sorted({age for ages in outcome_ages.values() for age in ages}) if ages is None else ages
+        rows = []
+        for iq_var in iq_var_list:
+            for covariates in covariate_sets:
+                for age in ages:
+                    regressors = self.regressors(iq_var, age, covariates)
+                    for factor in factors:
+                        outcome = self.bitmaps.get(f'z_{factor}_{age}', self._none)
+                        n_outcome = self.count(outcome)
+                        rows.append({
+                            'Factor': factor,
+                            'Age': age,
+                            'IQ_Var': iq_var,
+                            'Covariates': ' '.join(covariates) or 'none',
+                            'In_Grid': age in outcome_ages.get(factor, []),
+                            'N_Outcome': n_outcome,
+                            'Missing': self.n_rows - n_outcome,
+                            'N_Regressors': self.count(regressors),
+                            'N': self.count(regressors & outcome),
+                        })
+        coverage_df = pd.DataFrame(rows)
+        coverage_df['Coverage'] = coverage_df['N'] / self.n_rows
+        return coverage_df
+
+
+def cohort_index(cohort, index=None):
+    """``index`` if given, else the index of every column of ``cohort``."""
+    return index if index is not None else MissingnessIndex.from_cohort(cohort)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Index the missingness of the cohort and write its data coverage.')
+    parser.add_argument('--data', default=COHORT_FILE, help='ALSPAC .dta extract (default: %(default)s)')
+    parser.add_argument('--iq-var', nargs='+', default=list(iq_vars), help='IQ exposures (default: all)')
+    parser.add_argument('--covariates', nargs='+', action='append',
+                        help="factor covariate set, repeatable; 'none' for no covariates (default: sex ses)")
+    parser.add_argument('--output', default=COVERAGE_FILE, help='CSV file (default: %(default)s)')
+    args = parser.parse_args()
+
+    index = MissingnessIndex.from_cohort(load_cohort(args.data))
+    covariate_sets = [[] if sets == ['none'] else sets for sets in args.covariates or [FACTOR_COVARIATES]]
+    coverage_df = index.coverage(args.iq_var, covariate_sets)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    write_csv(coverage_df, args.output, index=False)
+    flush_outputs()
+    no_data = coverage_df[coverage_df['N'] == 0][['Factor', 'Age']].drop_duplicates()
+    print(f"Indexed {len(index.bitmaps)} variables over {index.n_rows} participants; coverage of "
+          f"{len(coverage_df)} factor x wave x spec cells written to {args.output} "
+          f"({len(no_data)} factor x wave cells with no data).")
@@ -0,0 +1,222 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.linalg import cho_factor, cho_solve, solve_triangular
+
+from checkpoint import FitCheckpoint, fingerprint
+from cohort_data import COHORT_FILE, load_cohort
+from factor_metadata import DEFAULT_IQ_VAR, iq_vars, outcome_ages
+from paths import TABLES_DIR
+from regression_engine import FACTOR_COVARIATES, run_regressions
+from results_store import SE_COLUMNS, write_results
+
+# Pooled results dataset (report on it by setting CFPWV_RESULTS_DIR to this path)
+MI_RESULTS_DIR = f'{TABLES_DIR}/results_mi'
+
+# Variables of js_cfpwv.do imputed together: exposures, ages at the clinics, sex, SES and outcomes
+EXPOSURE_COLUMNS = [f'z_{iq_var}' for iq_var in iq_vars]
+AGE_COLUMNS = [f'age_{age}' for age in sorted({age for ages in outcome_ages.values() for age in ages})]
+OUTCOME_COLUMNS = [f'z_{factor}_{age}' for factor, ages in outcome_ages.items() for age in ages]
+IMPUTATION_COLUMNS = EXPOSURE_COLUMNS + AGE_COLUMNS + FACTOR_COVARIATES + OUTCOME_COLUMNS
+
+# Ridge added to the predictor cross-products (relative to their diagonal), as in mice
+RIDGE = 1e-5
+
+# Cohort shared with the imputation workers (set once per process by init_worker)
+_cohort = None
+
+
+def imputation_sample(cohort):
+    """Participants with at least one IQ score and one outcome measurement (the others carry no information)."""
+    return cohort[EXPOSURE_COLUMNS].notna().any(axis=1) & cohort[OUTCOME_COLUMNS].notna().any(axis=1)
+
+
+def pmm_draw(X_obs, y_obs, X_mis, rng, donors=5):
+    """Predictive mean matching for one variable.
+
+    The regression coefficients are drawn from their posterior (normal linear model, flat prior),
+    the missing rows are predicted with the drawn coefficients and the observed rows with the
+    fitted ones, and each missing value is taken from one of its ``donors`` closest observed rows.
+    The nearest donors come from a window around the sorted observed predictions, so matching
+    costs O(n log n) rather than O(n_obs * n_mis).
+    """
+    n_obs, p = X_obs.shape
+    XtX = X_obs.T @ X_obs
+    XtX[np.diag_indices(p)] *= 1 + RIDGE
+    chol = cho_factor(XtX, lower=True)
+    beta = cho_solve(chol, X_obs.T @ y_obs)
+    resid = y_obs - X_obs @ beta
+    sigma = np.sqrt(resid @ resid / rng.chisquare(n_obs - p))
+    beta_draw = beta + sigma * solve_triangular(chol[0], rng.standard_normal(p), lower=True, trans='T')
+
+    pred_obs = X_obs @ beta
+    pred_mis = X_mis @ beta_draw
+    order = np.argsort(pred_obs)
+    sorted_pred = pred_obs[order]
+    window = np.clip(np.searchsorted(sorted_pred, pred_mis)[:, None] + np.arange(-donors, donors),
+                     0, n_obs - 1)
+    distance = np.abs(sorted_pred[window] - pred_mis[:, None])
+    nearest = np.argpartition(distance, donors - 1, axis=1)[:, :donors]
+    rows = np.arange(len(pred_mis))
+    chosen = window[rows, nearest[rows, rng.integers(donors, size=len(pred_mis))]]
+    return y_obs[order[chosen]]
+
+
+def impute_chained(data, rng, iterations=10, donors=5):
+    """One imputation of ``data`` by chained equations with predictive mean matching.
+
+    Every variable is imputed from all the others; categorical variables (sex, SES) enter the
+    other equations as indicators and, being matched to donors, keep their observed codes.
+    Variables are visited from the least to the most missing, as in mice's monotone sequence.
+    """
+    values = data.to_numpy(float, copy=True)
+    missing = np.isnan(values)
+    n, k = values.shape
+    categorical = [data.columns.get_loc(covariate) for covariate in FACTOR_COVARIATES]
+    levels = {j: np.unique(values[~missing[:, j], j])[1:] for j in categorical}
+
+    # Start from random draws of the observed values
+    for j in np.flatnonzero(missing.any(axis=0)):
+        values[missing[:, j], j] = rng.choice(values[~missing[:, j], j], missing[:, j].sum())
+
+    # Predictor matrix: constant, then one block of columns per variable
+    blocks, start = [], 1
+    for j in range(k):
+        width = len(levels[j]) if j in levels else 1
+        blocks.append(slice(start, start + width))
+        start += width
+    predictors = np.empty((n, start))
+    predictors[:, 0] = 1
+
+    def update_block(j):
+        if j in levels:
+            predictors[:, blocks[j]] = values[:, [j]] == levels[j][None, :]
+        else:
+            predictors[:, blocks[j]] = values[:, [j]]
+
+    for j in range(k):
+        update_block(j)
+
+    sequence = [j for j in np.argsort(missing.sum(axis=0), kind='stable') if missing[:, j].any()]
+    for _ in range(iterations):
+        for j in sequence:
+            keep = np.ones(start, dtype=bool)
+            keep[blocks[j]] = False
+            X = predictors[:, keep]
+            mis = missing[:, j]
+            values[mis, j] = pmm_draw(X[~mis], values[~mis, j], X[mis], rng, donors)
+            update_block(j)
+    return pd.DataFrame(values, index=data.index, columns=data.columns)
+
+
+def init_worker(cohort):
+    """Keep the cohort in the worker so that it is sent once per process, not once per imputation."""
+    global _cohort
+    _cohort = cohort
+
+
+def impute_and_fit(seed, iq_var_list, iterations, donors, cluster):
+    """Impute the shared cohort once and fit the whole regression grid on it."""
+    rng = np.random.default_rng(seed)
+    cohort = _cohort.copy()
+    cohort[IMPUTATION_COLUMNS] = impute_chained(cohort[IMPUTATION_COLUMNS], rng, iterations, donors)
+    return run_regressions(cohort, iq_var_list, cluster=cluster)
+
+
+def pool_rubin(results_df):
+    """Pool per-imputation results (one row per model and imputation) with Rubin's rules.
+
+    Degrees of freedom follow Barnard and Rubin (1999) with the complete-data DF of each model,
+    and FMI is the fraction of missing information of the coefficient.
+    """
+    keys = ['Factor', 'IQ_Var', 'Age'] + (['Stratum'] if 'Stratum' in results_df else [])
+    grouped = results_df.groupby(keys, sort=False)
+    m = grouped.size()
+    pooled = grouped[['Coefficient', 'R2', 'N', 'DF', 'N_Clusters']].mean()
+
+    between = grouped['Coefficient'].var(ddof=1)
+    for se_column in SE_COLUMNS.values():
+        within = (results_df[se_column] ** 2).groupby([results_df[key] for key in keys], sort=False).mean()
+        pooled[se_column] = np.sqrt(within + (1 + 1 / m) * between)
+
+    total = pooled['SE'] ** 2
+    lam = (1 + 1 / m) * between / total
+    df_com = pooled['DF']
+    df_old = (m - 1) / lam ** 2
+    df_obs = (df_com + 1) / (df_com + 3) * df_com * (1 - lam)
+    dof = 1 / (1 / df_old + 1 / df_obs)
+    t_crit = stats.t.ppf(0.975, dof)
+
+    pooled['CI_Lower'] = pooled['Coefficient'] - t_crit * pooled['SE']
+    pooled['CI_Upper'] = pooled['Coefficient'] + t_crit * pooled['SE']
+    pooled['P_value'] = 2 * stats.t.sf((pooled['Coefficient'] / pooled['SE']).abs(), dof)
+    pooled['DF'] = dof.round()
+    pooled['FMI'] = (lam + 2 / (dof + 3)) / (1 + 2 / (dof + 3))
+    return pooled.reset_index()
+
+
+def run_imputations(cohort, iq_var_list=(DEFAULT_IQ_VAR,), imputations=50, iterations=10, donors=5,
+                    seed=2024, cluster=None, max_workers=None, checkpoint=None, resume=False):
+    """Fit the regression grid on ``imputations`` imputed datasets in a process pool and pool the results.
+
+    With a ``checkpoint`` (checkpoint.FitCheckpoint) every draw's fit is saved as soon as it
+    completes; with ``resume`` the draws saved by an interrupted run are reused instead of refitted.
+    Draw ``i`` always gets the ``i``-th spawned seed, so a resumed run pools the same fits.
+    """
+    if imputations < 2:
+        raise ValueError("Rubin's rules need at least 2 imputations")
+    columns = IMPUTATION_COLUMNS + ([cluster] if cluster else [])
+    sample = cohort.loc[imputation_sample(cohort), columns]
+    seeds = np.random.SeedSequence(seed).spawn(imputations)
+    fits = {}
+    if checkpoint is not None and resume:
+        fits = {draw: checkpoint.load(f'draw_{draw:04d}') for draw in range(imputations)}
+        fits = {draw: fit for draw, fit in fits.items() if fit is not None}
+    pending = [draw for draw in range(imputations) if draw not in fits]
+    if pending:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(sample,)) as executor:
+            fit = partial(impute_and_fit, iq_var_list=list(iq_var_list), iterations=iterations, donors=donors,
+                          cluster=cluster)
+            futures = {executor.submit(fit, seeds[draw]): draw for draw in pending}
+            for future in as_completed(futures):
+                draw = futures[future]
+                fits[draw] = future.result()
+                if checkpoint is not None:
+                    checkpoint.save(f'draw_{draw:04d}', fits[draw])
+
+    pooled = pool_rubin(pd.concat([fits[draw] for draw in range(imputations)], ignore_index=True))
+    # Missing counts the values that were imputed (complete-case missingness within the sample)
+    pooled['Missing'] = [int(sample[f'z_{factor}_{age}'].isna().sum())
+                         for factor, age in zip(pooled['Factor'], pooled['Age'])]
+    return pooled
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the js_cfpwv.do regressions on multiply imputed data.')
+    parser.add_argument('--data', default=COHORT_FILE, help='ALSPAC .dta extract (default: %(default)s)')
+    parser.add_argument('--iq-var', nargs='+', default=[DEFAULT_IQ_VAR],
+                        help='IQ exposures to regress on (default: %(default)s)')
+    parser.add_argument('--imputations', type=int, default=50, help='number of imputed datasets (default: %(default)s)')
+    parser.add_argument('--iterations', type=int, default=10, help='chained-equation cycles (default: %(default)s)')
+    parser.add_argument('--donors', type=int, default=5, help='PMM donor pool size (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=2024, help='random seed (default: %(default)s)')
+    parser.add_argument('--cluster', help='column of the extract identifying clusters (not imputed)')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--output', default=MI_RESULTS_DIR, help='pooled results dataset (default: %(default)s)')
+    parser.add_argument('--resume', action='store_true',
+                        help='reuse the draws already fitted by an interrupted run with the same settings')
+    args = parser.parse_args()
+
+    cohort = load_cohort(args.data, extra_columns=[args.cluster] if args.cluster else [])
+    checkpoint = FitCheckpoint('imputations', {
+        'data': fingerprint([args.data]), 'iq_vars': args.iq_var, 'iterations': args.iterations,
+        'donors': args.donors, 'seed': args.seed, 'cluster': args.cluster,
+    })
+    pooled_df = run_imputations(cohort, args.iq_var, args.imputations, args.iterations, args.donors,
+                                args.seed, args.cluster, args.workers, checkpoint, args.resume)
+    write_results(pooled_df, args.output)
+    print(f"Pooled {len(pooled_df)} regression results over {args.imputations} imputations into {args.output}.")
@@ -0,0 +1,211 @@
+import atexit
+import io
+import itertools
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+# When written files are forced to disk: 'none' (default, leave it to the OS), 'stage' (every file
+# written by a script is fsynced when the script flushes its outputs) or 'always' (each file is
+# fsynced before it is renamed into place, the safest and slowest on network storage)
+FSYNC_POLICY = os.environ.get('CFPWV_FSYNC', 'none').lower()
+if FSYNC_POLICY not in ('none', 'stage', 'always'):
+    raise ValueError(f"CFPWV_FSYNC must be 'none', 'stage' or 'always', not {FSYNC_POLICY!r}")
+
+# Background writer threads, and serialised outputs allowed to wait for them before a write blocks
+WRITER_THREADS = int(os.environ.get('CFPWV_WRITER_THREADS', '4'))
+MAX_PENDING = int(os.environ.get('CFPWV_WRITER_QUEUE', '16'))
+
+_temp_ids = itertools.count()
+
+
+def temp_path(path):
+    """Hidden temp file next to ``path``, keeping its extension so writers infer the same format."""
+    directory, name = os.path.split(path)
+    stem, ext = os.path.splitext(name)
+    return os.path.join(directory, f'.{stem}.{os.getpid()}-{next(_temp_ids)}.tmp{ext}')
+
+
+@contextmanager
+def atomic_path(path):
+    """Yield a temp path to write to; it replaces ``path`` only once the write has completed.
+
+    ``os.replace`` within one directory is atomic, so readers (and a resumed run) see either the
+    previous file or the new one, never a truncated one. A failed write leaves ``path`` untouched.
+    """
+    tmp = temp_path(path)
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def fsync_path(path):
+    """Force a file (or a directory entry list) to disk."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_file(path, data, fsync=False):
+    """Write ``data`` (bytes) to ``path`` through a temp file, fsyncing the file and its directory if asked."""
+    with atomic_path(path) as tmp:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+    if fsync:
+        fsync_path(os.path.dirname(path) or '.')
+
+
+def replace_directory(staged, path, fsync=False):
+    """Move the directory ``staged`` to ``path`` (same file system), replacing the directory there if any.
+
+    A non-empty directory cannot be replaced in one rename, so the old one is first renamed to a
+    hidden ``.<name>.<id>.old`` sibling and removed once the new one is in place. A run killed
+    between the two renames leaves it for checkpoint.clean_partial to put back.
+    """
+    directory, name = os.path.split(path)
+    old = os.path.join(directory, f'.{name}.{os.getpid()}-{next(_temp_ids)}.old')
+    os.makedirs(directory or '.', exist_ok=True)
+    if os.path.exists(path):
+        os.replace(path, old)
+    os.replace(staged, path)
+    if fsync:
+        fsync_path(directory or '.')
+    shutil.rmtree(old, ignore_errors=True)
+
+
+class OutputSink:
+    """Writes serialised outputs (CSV, Parquet, PNG, markdown) on background threads.
+
+    The caller serialises an output to bytes and hands it over; the disk write, fsync and rename
+    happen on one of ``threads`` writers while the script carries on computing. At most
+    ``max_pending`` outputs wait for a writer: beyond that ``write`` blocks until one is written,
+    so a fast producer cannot fill memory with encoded figures. Writes to the same path keep
+    their order. ``flush`` waits for every write, applies the 'stage' fsync policy and raises the
+    first write error; each script calls it (through ``flush_outputs``) once its outputs are queued.
+    With ``threads`` = 0 every write happens in the caller.
+    """
+
+    def __init__(self, threads=WRITER_THREADS, max_pending=MAX_PENDING, fsync=FSYNC_POLICY):
+        self.fsync = fsync
+        self._executor = ThreadPoolExecutor(threads, thread_name_prefix='output-sink') if threads > 0 else None
+        self._slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._written = []
+        self._errors = []
+
+    def write(self, path, data):
+        """Queue ``data`` (bytes) to be written to ``path``."""
+        if self._executor is None:
+            self._write(path, data)
+            return
+        self._raise_errors()
+        with self._lock:
+            previous = self._pending.get(path)
+        if previous is not None:
+            previous.result()
+        self._slots.acquire()
+        future = self._executor.submit(self._write, path, data)
+        with self._lock:
+            self._pending[path] = future
+        future.add_done_callback(lambda done: self._finished(path, done))
+
+    def _write(self, path, data):
+        write_file(path, data, fsync=self.fsync == 'always')
+        if self.fsync == 'stage':
+            with self._lock:
+                self._written.append(path)
+
+    def _finished(self, path, future):
+        self._slots.release()
+        with self._lock:
+            if self._pending.get(path) is future:
+                del self._pending[path]
+            if future.exception() is not None:
+                self._errors.append(future.exception())
+
+    def _raise_errors(self):
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def flush(self):
+        """Wait for every queued write, fsync them under the 'stage' policy and raise the first error."""
+        with self._lock:
+            pending = list(self._pending.values())
+        wait(pending)
+        with self._lock:
+            written, self._written = self._written, []
+        for path in written:
+            fsync_path(path)
+        for directory in {os.path.dirname(path) or '.' for path in written}:
+            fsync_path(directory)
+        self._raise_errors()
+
+
+_sink = None
+
+
+def get_sink():
+    """The output sink of this process (created on first use).
+
+    Worker processes (e.g. the render pools) write synchronously: they run in parallel already
+    and exit without running the flush at interpreter exit.
+    """
+    global _sink
+    if _sink is None or _sink.pid != os.getpid():
+        in_worker = multiprocessing.parent_process() is not None
+        _sink = OutputSink(threads=0 if in_worker else WRITER_THREADS)
+        _sink.pid = os.getpid()
+    return _sink
+
+
+def flush_outputs():
+    """Wait until every output queued by this process is on disk (called at the end of each stage)."""
+    if _sink is not None and _sink.pid == os.getpid():
+        _sink.flush()
+
+
+# Outputs still queued when a script ends (e.g. on an exception) are written before exit
+atexit.register(flush_outputs)
+
+
+def write_bytes(path, data):
+    """Queue already serialised bytes for ``path``."""
+    get_sink().write(path, data)
+
+
+def write_csv(df, path, **kwargs):
+    """``df.to_csv(path, **kwargs)``: serialised now, written in the background."""
+    write_bytes(path, df.to_csv(**kwargs).encode())
+
+
+def write_parquet(df, path, **kwargs):
+    """``df.to_parquet(path, **kwargs)``: serialised now, written in the background."""
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, **kwargs)
+    write_bytes(path, buffer.getvalue())
+
+
+def write_text(path, text):
+    """Write a text file (report, HTML): queued as one buffer, written in the background."""
+    write_bytes(path, text.encode())
+
+
+def write_figure(fig, path, **kwargs):
+    """``fig.savefig(path, **kwargs)``: encoded now (format from the extension), written in the background."""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=os.path.splitext(path)[1][1:] or None, **kwargs)
+    write_bytes(path, buffer.getvalue())
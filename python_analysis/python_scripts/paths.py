@@ -0,0 +1,58 @@
+import os
+import re
+
+# Cohort (shard) the scripts run on. Unset, they use the single-cohort layout of the repository:
+# outputs in ../tables, ../figures and ../docs, the B3665 extract and the Stata logs in stata/log_files.
+# Set (run_cohorts.py sets it for every shard), a cohort's inputs and outputs live under
+# COHORTS_DIR/<cohort>/ (data/, stata/log_files/, tables/, figures/, docs/)
+COHORT = os.environ.get('CFPWV_COHORT', '')
+COHORTS_DIR = os.environ.get('CFPWV_COHORTS_DIR', '../cohorts')
+
+# Inputs of the single-cohort layout
+DEFAULT_DATA_FILE = '../../data/B3665_Chiesa_04Oct2024.dta'
+DEFAULT_LOG_DIR = '../../stata/log_files'
+
+# Cohort names double as directory names
+COHORT_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]*$')
+
+
+def check_cohort(cohort):
+    """Return ``cohort`` if it is a valid cohort name, else raise ValueError."""
+    if not COHORT_NAME.match(cohort):
+        raise ValueError(f'{cohort!r} is not a valid cohort name (letters, digits, _ . - only)')
+    return cohort
+
+
+def cohort_root(cohort=COHORT):
+    """Directory holding a cohort's namespaces ('..' for the single-cohort layout)."""
+    return os.path.join(COHORTS_DIR, check_cohort(cohort)) if cohort else '..'
+
+
+def tables_dir(cohort=COHORT):
+    return os.path.join(cohort_root(cohort), 'tables')
+
+
+def figures_dir(cohort=COHORT):
+    return os.path.join(cohort_root(cohort), 'figures')
+
+
+def docs_dir(cohort=COHORT):
+    return os.path.join(cohort_root(cohort), 'docs')
+
+
+def data_file(cohort=COHORT):
+    """Default extract of a cohort: data/<cohort>.dta in its namespace."""
+    return os.path.join(cohort_root(cohort), 'data', f'{cohort}.dta') if cohort else DEFAULT_DATA_FILE
+
+
+def log_dir(cohort=COHORT):
+    """Stata logs of a cohort: stata/log_files in its namespace."""
+    return os.path.join(cohort_root(cohort), 'stata', 'log_files') if cohort else DEFAULT_LOG_DIR
+
+
+# Namespaces of the current cohort, used by every script for its inputs and outputs
+TABLES_DIR = tables_dir()
+FIGURES_DIR = figures_dir()
+DOCS_DIR = docs_dir()
+DATA_FILE = data_file()
+LOG_DIR = log_dir()
@@ -0,0 +1,212 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from cohort_data import load_cohort
+from factor_metadata import ALL_STRATA, exposure_suffix, exposure_title, risk_factors
+from missingness_index import MissingnessIndex
+from output_sink import flush_outputs, write_csv
+from paths import FIGURES_DIR, TABLES_DIR
+from regression_engine import design_matrix
+from render import finalise_layout, save_figure
+from results_store import read_results
+
+# Power curves (one row per cell and true effect) and per-cell summary
+POWER_CURVES_FILE = f'{TABLES_DIR}/power_curves.csv'
+POWER_SUMMARY_FILE = f'{TABLES_DIR}/power_summary.csv'
+
+# True IQ coefficients simulated (SD of the outcome per SD of IQ) and the target power of the MDE
+DEFAULT_EFFECTS = np.round(np.linspace(0, 0.15, 31), 3)
+TARGET_POWER = 0.8
+ALPHA = 0.05
+
+# Smallest IQ coefficient of interest, fixed before looking at the results: a non-significant cell
+# whose MDE is at most this is a credible null, otherwise it is underpowered
+EFFECT_OF_INTEREST = 0.05
+
+# Replicates solved per array operation (bounds the n x replicates error matrix to ~32 MB)
+CHUNK_ELEMENTS = 4_000_000
+
+
+def synthetic_design(n, rng, ses_levels=5):
+    """Regressors of a cell when only its sample size is known: IQ, age, sex and SES indicators, constant.
+
+    IQ is independent of the covariates here, so precision lost to their correlation with IQ is not
+    reflected; pass the cohort (--data) to simulate on the real estimation samples instead.
+    """
+    ses = rng.integers(ses_levels, size=n)
+    return np.column_stack([
+        rng.standard_normal(n),
+        rng.standard_normal(n),
+        rng.integers(2, size=n),
+        *[(ses == level).astype(float) for level in range(1, ses_levels)],
+        np.ones(n),
+    ])
+
+
+def simulate_power(X, sigma, effects, replicates, rng, residuals=None):
+    """Monte Carlo power of the t-test of the first coefficient of ``X`` for every true effect.
+
+    With a fixed design the OLS estimate is ``b = beta + A e`` (``A = (X'X)^-1 X'``) and the residual
+    sum of squares is ``e'e - |Q'e|^2``, so the outcomes never have to be formed or refitted:
+    each chunk of replicates is one error matrix ``E`` and two matrix products, and every true
+    effect reuses the same draws (only the IQ estimate shifts by the effect). Errors are normal
+    with SD ``sigma``, or resampled from ``residuals`` (e.g. those of the observed fit).
+    """
+    n, p = X.shape
+    Q, R = np.linalg.qr(X)
+    a = np.linalg.solve(R, Q.T)[0]
+    c00 = a @ a
+    df = n - p
+    t_crit = stats.t.ppf(1 - ALPHA / 2, df)
+
+    rejections = np.zeros(len(effects))
+    chunk = max(1, CHUNK_ELEMENTS // n)
+    for start in range(0, replicates, chunk):
+        size = min(chunk, replicates - start)
+        if residuals is None:
+            E = sigma * rng.standard_normal((n, size))
+        else:
+            E = rng.choice(residuals, size=(n, size))
+        noise = a @ E
+        ssr = (E ** 2).sum(axis=0) - ((Q.T @ E) ** 2).sum(axis=0)
+        se = np.sqrt(ssr / df * c00)
+        rejections += (np.abs(effects[:, None] + noise[None, :]) > t_crit * se[None, :]).sum(axis=1)
+    power = rejections / replicates
+
+    # Exact power under normal errors (noncentral t), as a check on the simulation
+    noncentrality = effects / (sigma * np.sqrt(c00))
+    analytic = stats.nct.sf(t_crit, df, noncentrality) + stats.nct.cdf(-t_crit, df, noncentrality)
+    return power, analytic
+
+
+def minimum_detectable_effect(effects, power, target=TARGET_POWER):
+    """Smallest effect reaching ``target`` power, interpolated on the effect grid (NaN if never reached)."""
+    power = np.maximum.accumulate(power)
+    if power[-1] < target:
+        return np.nan
+    return np.interp(target, power, effects) if power[0] < target else effects[0]
+
+
+def power_verdict(p_value, mde, effect_of_interest=EFFECT_OF_INTEREST):
+    """'significant', 'null' (non-significant with MDE <= the effect of interest) or 'underpowered'."""
+    if p_value < ALPHA:
+        return 'significant'
+    return 'null' if mde <= effect_of_interest else 'underpowered'
+
+
+def simulate_cell(cell, effects, replicates, seed, effect_of_interest=EFFECT_OF_INTEREST):
+    """Power curve and summary of one factor x exposure x age cell of the results."""
+    rng = np.random.default_rng(seed)
+    X = cell['X'] if cell.get('X') is not None else synthetic_design(int(cell['N']), rng)
+    # Outcomes are z-scores, so the residual variance is what the covariates leave unexplained
+    sigma = np.sqrt(max(1 - cell['R2'], 0))
+    power, analytic = simulate_power(X, sigma, effects, replicates, rng, cell.get('residuals'))
+
+    keys = {key: cell[key] for key in ('Factor', 'IQ_Var', 'Age')}
+    curve = pd.DataFrame({**keys, 'Effect': effects, 'Power': power,
+                          'Power_MC_SE': np.sqrt(power * (1 - power) / replicates),
+                          'Power_Analytic': analytic})
+    mde = minimum_detectable_effect(effects, power)
+    summary = {
+        **keys,
+        'N': len(X),
+        'Missing': cell['Missing'],
+        'R2': cell['R2'],
+        'Coefficient': cell['Coefficient'],
+        'P_value': cell['P_value'],
+        'Power_At_Interest': np.interp(effect_of_interest, effects, power),
+        'MDE': mde,
+        'MDE_Analytic': minimum_detectable_effect(effects, analytic),
+        # Precision scales with sqrt(N), so without missing outcomes the MDE would shrink accordingly
+        'MDE_No_Missing': mde * np.sqrt(len(X) / (len(X) + cell['Missing'])) if pd.notna(cell['Missing']) else np.nan,
+        'Verdict': power_verdict(cell['P_value'], mde, effect_of_interest),
+    }
+    return curve, summary
+
+
+def cohort_cells(cohort, cells):
+    """Attach the real estimation-sample design and observed residuals to every cell."""
+    index = MissingnessIndex.from_cohort(cohort)
+    for cell in cells:
+        iq_var, age, outcome = cell['IQ_Var'], cell['Age'], f"z_{cell['Factor']}_{cell['Age']}"
+        sample = index.mask(index.model_sample(iq_var, age, cell['Factor']))
+        X = design_matrix(cohort, iq_var, age, sample)
+        y = cohort.loc[sample, outcome].to_numpy(float)
+        cell['X'] = X
+        cell['residuals'] = y - X @ np.linalg.lstsq(X, y, rcond=None)[0]
+    return cells
+
+
+def plot_power_curves(curves_df, iq_var):
+    """Power curves of every risk factor, one panel per age."""
+    ages = sorted(curves_df['Age'].unique())
+    fig, axes = plt.subplots(1, len(ages), figsize=(6 * len(ages), 6), sharey=True, squeeze=False)
+    for ax, age in zip(axes[0], ages):
+        for factor, curve in curves_df[curves_df['Age'] == age].groupby('Factor'):
+            ax.plot(curve['Effect'], curve['Power'], label=risk_factors.get(factor, factor))
+        ax.axhline(TARGET_POWER, color='black', linestyle='--', alpha=0.5)
+        ax.set_title(f'Age {age}', fontsize=14)
+        ax.set_xlabel('True Standardised Coefficient', fontsize=12)
+        ax.grid(True, alpha=0.3)
+    axes[0][0].set_ylabel('Power', fontsize=12)
+    axes[0][-1].legend(loc='lower right', fontsize=9)
+    fig.suptitle(f'Power to Detect Associations with {exposure_title(iq_var)}', fontsize=16)
+    finalise_layout()
+    save_figure(f'{FIGURES_DIR}/power_curves{exposure_suffix(iq_var)}.png', dpi=300, bbox_inches='tight')
+
+
+def run_power_grid(results_df, effects=DEFAULT_EFFECTS, replicates=10_000, seed=2024, cohort=None,
+                   max_workers=1, effect_of_interest=EFFECT_OF_INTEREST):
+    """Simulate every cell of the results, in a process pool if ``max_workers`` > 1."""
+    cells = results_df.dropna(subset=['Coefficient']).to_dict('records')
+    if cohort is not None:
+        cells = cohort_cells(cohort, cells)
+    seeds = np.random.SeedSequence(seed).spawn(len(cells))
+    args = (cells, [effects] * len(cells), [replicates] * len(cells), seeds, [effect_of_interest] * len(cells))
+    if max_workers == 1:
+        outputs = list(map(simulate_cell, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            outputs = list(executor.map(simulate_cell, *args))
+    curves, summaries = zip(*outputs)
+    return pd.concat(curves, ignore_index=True), pd.DataFrame(summaries)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Monte Carlo power and minimum detectable effects for the results grid.')
+    parser.add_argument('--replicates', type=int, default=10_000, help='replicates per cell (default: %(default)s)')
+    parser.add_argument('--max-effect', type=float, default=DEFAULT_EFFECTS[-1],
+                        help='largest true coefficient simulated (default: %(default)s)')
+    parser.add_argument('--steps', type=int, default=len(DEFAULT_EFFECTS), help='effect grid size (default: %(default)s)')
+    parser.add_argument('--effect-of-interest', type=float, default=EFFECT_OF_INTEREST,
+                        help='smallest IQ coefficient of interest, set in advance (default: %(default)s)')
+    parser.add_argument('--data', help='ALSPAC .dta extract: simulate on the real designs and residuals')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=2024, help='random seed (default: %(default)s)')
+    args = parser.parse_args()
+
+    if not 0 < args.effect_of_interest <= args.max_effect:
+        parser.error('--effect-of-interest must be positive and at most --max-effect')
+    os.makedirs(FIGURES_DIR, exist_ok=True)
+    cohort = None
+    if args.data:
+        cohort = load_cohort(args.data)
+    effects = np.round(np.linspace(0, args.max_effect, args.steps), 4)
+    curves_df, summary_df = run_power_grid(read_results(strata=[ALL_STRATA]), effects, args.replicates, args.seed, cohort,
+                                           args.workers, args.effect_of_interest)
+    write_csv(curves_df, POWER_CURVES_FILE, index=False)
+    write_csv(summary_df, POWER_SUMMARY_FILE, index=False)
+    for iq_var, exposure_curves in curves_df.groupby('IQ_Var'):
+        plot_power_curves(exposure_curves, iq_var)
+    flush_outputs()
+    verdicts = summary_df['Verdict'].value_counts()
+    print(f"Simulated {len(summary_df)} cells at {args.replicates} replicates; of the "
+          f"{verdicts.get('null', 0) + verdicts.get('underpowered', 0)} non-significant cells, {verdicts.get('null', 0)} "
+          f"had {TARGET_POWER:.0%} power for a coefficient of {args.effect_of_interest} (credible nulls) and "
+          f"{verdicts.get('underpowered', 0)} did not (underpowered).")
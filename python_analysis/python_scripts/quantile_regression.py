@@ -0,0 +1,327 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from cohort_data import COHORT_FILE, load_cohort
+from factor_metadata import ALL_STRATA, DEFAULT_IQ_VAR, exposure_suffix, exposure_title, outcome_ages, risk_factors
+from missingness_index import FACTOR_COVARIATES, MissingnessIndex
+from output_sink import flush_outputs
+from paths import FIGURES_DIR
+from regression_engine import batch_arrays, estimation_batches
+from render import finalise_layout, save_figure
+from results_store import read_results, upsert_results
+
+# Quantiles fitted by default (the deciles)
+DEFAULT_QUANTILES = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+
+# Frisch-Newton solver: duality gap at convergence, iteration cap and the step fraction that keeps
+# the iterates strictly inside the bounds (Portnoy and Koenker 1997)
+TOLERANCE = 1e-6
+MAX_ITERATIONS = 100
+STEP_FACTOR = 0.9995
+
+# Half-width, in multiples of sqrt(n p), of the band of observations kept around the previous
+# quantile's fit when solving the next quantile (the others are globbed into two rows)
+BAND = 3.0
+
+# Outcomes of a batch fitted together by one worker process
+OUTCOMES_PER_TASK = 4
+
+
+def step_length(v, dv):
+    """Longest step along ``dv`` keeping each row of ``v`` non-negative, per outcome."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(dv < 0, -v / dv, np.inf).min(axis=1)
+
+
+def newton_step(X, Xt, x, s, z, w):
+    """Predictor-corrector direction and primal/dual step lengths of one Frisch-Newton iteration, per outcome."""
+    n = X.shape[1]
+    # Affine scaling (predictor) step
+    q = 1 / (z / x + w / s)
+    r = z - w
+    M = (Xt * q[:, None, :]) @ X
+    rhs = q * r
+    dy = np.linalg.solve(M, Xt @ rhs[..., None])[..., 0]
+    dx = q * ((X @ dy[..., None])[..., 0] - r)
+    ds = -dx
+    dz = -z * (dx / x + 1)
+    dw = -w * (ds / s + 1)
+    fp = np.minimum(STEP_FACTOR * np.minimum(step_length(x, dx), step_length(s, ds)), 1)
+    fd = np.minimum(STEP_FACTOR * np.minimum(step_length(w, dw), step_length(z, dz)), 1)
+
+    # Centring (corrector) step for the outcomes whose full affine step is infeasible
+    corrected = np.minimum(fp, fd) < 1
+    if corrected.any():
+        mu = (z * x).sum(axis=1) + (w * s).sum(axis=1)
+        g = (((z + fd[:, None] * dz) * (x + fp[:, None] * dx)).sum(axis=1)
+             + ((w + fd[:, None] * dw) * (s + fp[:, None] * ds)).sum(axis=1))
+        mu = (mu * (g / mu) ** 3 / (2 * n))[:, None]
+        dxdz = dx * dz
+        dsdw = ds * dw
+        xi = mu * (1 / x - 1 / s)
+        rhs = rhs + q * (dxdz - dsdw - xi)
+        dy_c = np.linalg.solve(M, Xt @ rhs[..., None])[..., 0]
+        dx_c = q * ((X @ dy_c[..., None])[..., 0] + xi - r - dxdz + dsdw)
+        ds_c = -dx_c
+        dz_c = mu / x - z - z / x * dx_c - dxdz
+        dw_c = mu / s - w - w / s * ds_c - dsdw
+        fp_c = np.minimum(STEP_FACTOR * np.minimum(step_length(x, dx_c), step_length(s, ds_c)), 1)
+        fd_c = np.minimum(STEP_FACTOR * np.minimum(step_length(w, dw_c), step_length(z, dz_c)), 1)
+        rows = corrected[:, None]
+        dx, ds, dy, dz, dw = (np.where(rows, step_c, step) for step_c, step in
+                              ((dx_c, dx), (ds_c, ds), (dy_c, dy), (dz_c, dz), (dw_c, dw)))
+        fp, fd = np.where(corrected, fp_c, fp), np.where(corrected, fd_c, fd)
+    return dx, ds, dy, dz, dw, fp[:, None], fd[:, None]
+
+
+def frisch_newton(X, Y, tau, tol=TOLERANCE, max_iter=MAX_ITERATIONS):
+    """Solve the ``tau`` quantile regressions of ``Y[j]`` on ``X[j]`` (``(k, n)`` and ``(k, n, p)``) at once.
+
+    This is the Frisch-Newton interior-point method on the dual LP ``max y'a subject to
+    X'a = (1 - tau) X'1, 0 <= a <= 1`` with Mehrotra's predictor-corrector steps, as in
+    quantreg's ``rq.fit.fnb``. Each iteration stacks the ``(p, p)`` Newton systems of the
+    outcomes that have not converged yet into one solve. Returns the ``(k, p)`` coefficients
+    and the number of iterations.
+    """
+    k, n, p = X.shape
+    Xt = X.transpose(0, 2, 1)
+    c = -Y
+    b = (1 - tau) * X.sum(axis=1)
+    x = np.full((k, n), 1 - tau)
+    s = 1 - x
+    # Dual start at the least squares fit
+    dual = -np.linalg.solve(Xt @ X, Xt @ Y[..., None])[..., 0]
+    r = c - (X @ dual[..., None])[..., 0]
+    r = r + 0.001 * (r == 0)
+    z = np.where(r > 0, r, 0)
+    w = z - r
+    gap = (c * x).sum(axis=1) - (dual * b).sum(axis=1) + w.sum(axis=1)
+
+    iterations = 0
+    active = gap > tol
+    while active.any() and iterations < max_iter:
+        iterations += 1
+        rows = np.flatnonzero(active)
+        if len(rows) == k:
+            dx, ds, dy, dz, dw, fp, fd = newton_step(X, Xt, x, s, z, w)
+        else:
+            dx, ds, dy, dz, dw, fp, fd = newton_step(X[rows], Xt[rows], x[rows], s[rows], z[rows], w[rows])
+        x[rows] += fp * dx
+        s[rows] += fp * ds
+        dual[rows] += fd * dy
+        z[rows] += fd * dz
+        w[rows] += fd * dw
+        gap[rows] = (c[rows] * x[rows]).sum(axis=1) - (dual[rows] * b[rows]).sum(axis=1) + w[rows].sum(axis=1)
+        active = gap > tol
+    return -dual, iterations
+
+
+def warm_quantile(X, Y, tau, previous, band=BAND):
+    """The ``tau`` fits of the columns of ``Y`` on ``X``, warm-started from the fits ``previous`` (``(k, p)``)
+    at an adjacent quantile.
+
+    The previous fit predicts which observations lie far above or below the new one. Those are
+    globbed into one summed row each (their check-loss gradient is the same while their residuals
+    keep their sign), leaving a band of about ``2 band sqrt(n p)`` rows to solve (Portnoy and
+    Koenker 1997; Chernozhukov, Fernandez-Val and Melly 2022). An outcome whose globbed residuals
+    change sign is re-solved with a band twice as wide, and with the full sample at the latest.
+    Returns the ``(k, p)`` coefficients and the solver iterations.
+    """
+    n, p = X.shape
+    half = int(band * np.sqrt(n * p))
+    coef = np.empty_like(previous)
+    todo = np.arange(Y.shape[1])
+    iterations = 0
+    while len(todo):
+        outcomes = Y[:, todo].T
+        if 2 * half + 2 >= n:
+            coef[todo], solved = frisch_newton(np.broadcast_to(X, (len(todo), n, p)), outcomes, tau)
+            return coef, iterations + solved
+
+        # Rank the residuals of the previous fit; the new fit crosses them near rank tau n
+        order = np.argsort(outcomes - previous[todo] @ X.T, axis=1)
+        centre = int(tau * n)
+        lower, upper = max(centre - half, 0), min(centre + half, n)
+        below = np.zeros(outcomes.shape, dtype=bool)
+        above = np.zeros(outcomes.shape, dtype=bool)
+        np.put_along_axis(below, order[:, :lower], True, axis=1)
+        np.put_along_axis(above, order[:, upper:], True, axis=1)
+        kept = order[:, lower:upper]
+        X_band = np.concatenate([X[kept], np.stack([below @ X, above @ X], axis=1)], axis=1)
+        Y_band = np.concatenate([np.take_along_axis(outcomes, kept, axis=1),
+                                 np.stack([(below * outcomes).sum(axis=1), (above * outcomes).sum(axis=1)], axis=1)],
+                                axis=1)
+        band_coef, solved = frisch_newton(X_band, Y_band, tau)
+        iterations += solved
+
+        residuals = outcomes - band_coef @ X.T
+        valid = ~((below & (residuals > 0)) | (above & (residuals < 0))).any(axis=1)
+        coef[todo[valid]] = band_coef[valid]
+        todo = todo[~valid]
+        half *= 2
+    return coef, iterations
+
+
+def check_loss(residuals, tau):
+    """Quantile regression objective of every column of ``residuals``."""
+    return (residuals * (tau - (residuals < 0))).sum(axis=0)
+
+
+def quantile_inference(X, Y, coef, tau, alpha=0.05):
+    """Standard errors of the IQ coefficient (column 0) and Koenker-Machado pseudo R² of every outcome.
+
+    The standard errors are the Powell kernel sandwich with the Hall-Sheather bandwidth
+    (statsmodels' QuantReg default), robust to heteroskedasticity.
+    """
+    n, p = X.shape
+    residuals = Y - X @ coef.T
+    z = stats.norm.ppf(tau)
+    h = (n ** (-1 / 3) * stats.norm.ppf(1 - alpha / 2) ** (2 / 3)
+         * (1.5 * stats.norm.pdf(z) ** 2 / (2 * z ** 2 + 1)) ** (1 / 3))
+    iqr = np.subtract(*np.percentile(residuals, [75, 25], axis=0))
+    h = np.minimum(Y.std(axis=0), iqr / 1.34) * (stats.norm.ppf(tau + h) - stats.norm.ppf(tau - h))
+    u = residuals / h
+    density = (0.75 * (1 - u ** 2) * (np.abs(u) <= 1)).sum(axis=0) / (n * h)
+    weights = np.where(residuals > 0, tau, 1 - tau) ** 2 / density ** 2
+    # Row 0 of (X'X)^-1 X' D X (X'X)^-1 is that of the IQ coefficient
+    a = X @ np.linalg.solve(X.T @ X, np.eye(p)[0])
+    se = np.sqrt((a ** 2) @ weights)
+
+    null = check_loss(Y - np.quantile(Y, tau, axis=0), tau)
+    r2 = 1 - check_loss(residuals, tau) / null
+    return se, r2
+
+
+def fit_quantiles(X, Y, quantiles):
+    """Fit every quantile of every column of ``Y`` on ``X``, each quantile warm-started from the one before.
+
+    Returns ``(n_quantiles, k)`` arrays of the IQ coefficient, its standard error and the pseudo
+    R², and the total solver iterations.
+    """
+    n, k = Y.shape
+    coef, se, r2 = (np.empty((len(quantiles), k)) for _ in range(3))
+    previous = None
+    iterations = 0
+    for i, tau in enumerate(quantiles):
+        if previous is None:
+            fit, solved = frisch_newton(np.broadcast_to(X, (k,) + X.shape), Y.T, tau)
+        else:
+            fit, solved = warm_quantile(X, Y, tau, previous)
+        iterations += solved
+        coef[i] = fit[:, 0]
+        se[i], r2[i] = quantile_inference(X, Y, fit, tau)
+        previous = fit
+    return coef, se, r2, iterations
+
+
+def run_quantile_regressions(cohort, iq_vars=(DEFAULT_IQ_VAR,), quantiles=DEFAULT_QUANTILES, factors=None, ages=None,
+                             covariates=FACTOR_COVARIATES, max_workers=1, index=None):
+    """Fit the js_cfpwv.do design at every quantile of every outcome x age, one result row per quantile.
+
+    Outcomes sharing an estimation sample are solved together as in run_regressions, and the
+    quantiles of each are fitted in order so that each one warm-starts the next. With
+    ``max_workers`` > 1 the outcomes are fitted in a process pool, ``OUTCOMES_PER_TASK`` per task.
+    """
+    index = MissingnessIndex.from_cohort(cohort) if index is None else index
+    quantiles = sorted(quantiles)
+    tasks = []
+    for iq_var, age, sample, batch_factors in estimation_batches(cohort, iq_vars, factors, None, covariates, ages,
+                                                                 index):
+        X, Y = batch_arrays(cohort, iq_var, age, sample, batch_factors, covariates)
+        for start in range(0, len(batch_factors), OUTCOMES_PER_TASK):
+            chunk = slice(start, start + OUTCOMES_PER_TASK)
+            tasks.append((iq_var, age, batch_factors[chunk], X, Y[:, chunk]))
+
+    args = ([X for *_, X, _ in tasks], [Y for *_, Y in tasks], [quantiles] * len(tasks))
+    if max_workers == 1:
+        fits = list(map(fit_quantiles, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            fits = list(executor.map(fit_quantiles, *args))
+
+    rows = []
+    for (iq_var, age, task_factors, X, _), (coef, se, r2, _) in zip(tasks, fits):
+        n, p = X.shape
+        t_crit = stats.t.ppf(0.975, n - p)
+        for j, factor in enumerate(task_factors):
+            for i, tau in enumerate(quantiles):
+                rows.append({
+                    'Factor': factor,
+                    'IQ_Var': iq_var,
+                    'Age': age,
+                    'Stratum': ALL_STRATA,
+                    'Quantile': tau,
+                    'Coefficient': coef[i, j],
+                    'CI_Lower': coef[i, j] - t_crit * se[i, j],
+                    'CI_Upper': coef[i, j] + t_crit * se[i, j],
+                    'P_value': 2 * stats.t.sf(abs(coef[i, j] / se[i, j]), n - p),
+                    'R2': r2[i, j],
+                    'N': n,
+                    'Missing': index.missing(f'z_{factor}_{age}'),
+                    'SE': se[i, j],
+                    'DF': n - p,
+                })
+    return pd.DataFrame(rows)
+
+
+def plot_quantile_process(quantile_df, mean_df, iq_var):
+    """Quantile process of the IQ coefficient of every risk factor, one line per age, against the mean (OLS) effect."""
+    factors = [factor for factor in outcome_ages if factor in set(quantile_df['Factor'])]
+    n_cols = min(4, len(factors))
+    n_rows = -(-len(factors) // n_cols)
+    fig, axes = plt.subplots(n_rows, n_cols, figsize=(4.5 * n_cols, 3.5 * n_rows), sharex=True, squeeze=False)
+    colours = dict(zip(sorted(quantile_df['Age'].unique()), plt.rcParams['axes.prop_cycle'].by_key()['color']))
+    for ax, factor in zip(axes.flat, factors):
+        for age, process in quantile_df[quantile_df['Factor'] == factor].groupby('Age'):
+            process = process.sort_values('Quantile')
+            ax.plot(process['Quantile'], process['Coefficient'], marker='o', markersize=3, color=colours[age],
+                    label=f'Age {age}')
+            ax.fill_between(process['Quantile'], process['CI_Lower'], process['CI_Upper'], color=colours[age],
+                            alpha=0.15)
+            mean = mean_df[(mean_df['Factor'] == factor) & (mean_df['Age'] == age)]
+            if not mean.empty:
+                ax.axhline(mean['Coefficient'].iloc[0], color=colours[age], linestyle='--', alpha=0.7)
+        ax.axhline(0, color='black', linewidth=0.8)
+        ax.set_title(risk_factors.get(factor, factor), fontsize=11)
+        ax.grid(True, alpha=0.3)
+    for ax in axes.flat[len(factors):]:
+        ax.set_visible(False)
+    for ax in axes[-1]:
+        ax.set_xlabel('Quantile', fontsize=10)
+    for ax in axes[:, 0]:
+        ax.set_ylabel('Standardised Coefficient', fontsize=10)
+    axes[0][0].legend(fontsize=8)
+    fig.suptitle(f'Quantile Regression Coefficients of {exposure_title(iq_var)} (dashed: OLS)', fontsize=14)
+    finalise_layout()
+    save_figure(f'{FIGURES_DIR}/quantile_process{exposure_suffix(iq_var)}.png', dpi=300, bbox_inches='tight')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Quantile regressions of every outcome x age across the outcome distribution.')
+    parser.add_argument('--data', default=COHORT_FILE, help='ALSPAC .dta extract (default: %(default)s)')
+    parser.add_argument('--iq-var', nargs='+', default=[DEFAULT_IQ_VAR], help='IQ exposures (default: %(default)s)')
+    parser.add_argument('--quantiles', nargs='+', type=float, default=DEFAULT_QUANTILES,
+                        help='quantiles to fit (default: the deciles)')
+    parser.add_argument('--factors', nargs='+', choices=list(outcome_ages), help='risk factors (default: all)')
+    parser.add_argument('--ages', nargs='+', type=int, help='measurement ages (default: all)')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes (default: %(default)s)')
+    args = parser.parse_args()
+    if not all(0 < tau < 1 for tau in args.quantiles):
+        parser.error('quantiles must lie strictly between 0 and 1')
+
+    os.makedirs(FIGURES_DIR, exist_ok=True)
+    quantile_df = run_quantile_regressions(load_cohort(args.data), args.iq_var, args.quantiles, args.factors,
+                                           args.ages, max_workers=args.workers)
+    upsert_results(quantile_df)
+    mean_df = read_results(iq_vars=args.iq_var, strata=[ALL_STRATA])
+    for iq_var, exposure_df in quantile_df.groupby('IQ_Var'):
+        plot_quantile_process(exposure_df, mean_df[mean_df['IQ_Var'] == iq_var], iq_var)
+    flush_outputs()
+    print(f"Wrote {len(quantile_df)} quantile regression results "
+          f"({len(args.quantiles)} quantiles of {len(quantile_df) // len(args.quantiles)} models) to the results store.")
@@ -0,0 +1,409 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy import sparse, stats
+from scipy.linalg import solve_triangular
+
+from cohort_data import COHORT_FILE, load_cohort
+from factor_metadata import ALL_STRATA, DEFAULT_IQ_VAR, outcome_ages, stratum_key
+from missingness_index import FACTOR_COVARIATES, MissingnessIndex, cohort_index
+from output_sink import flush_outputs, write_csv, write_parquet
+from paths import TABLES_DIR
+from results_store import write_results
+
+# Variables stratified on by --stratify (each is dropped from the covariates within its strata), and
+# the smallest estimation sample fitted within a stratum
+STRATIFY_BY = FACTOR_COVARIATES
+MIN_STRATUM_N = 30
+
+# Influence diagnostics: one row per observation and model, and one summary row per model
+INFLUENCE_FILE = f'{TABLES_DIR}/influence_observations.parquet'
+INFLUENCE_SUMMARY_FILE = f'{TABLES_DIR}/influence_summary.csv'
+
+
+def indicator_columns(values):
+    """Indicators of a factor variable, omitting the lowest level present (Stata's base level)."""
+    levels = np.unique(values)
+    return [(values == level).astype(float) for level in levels[1:]]
+
+
+def design_matrix(cohort, iq_var, age, rows, covariates=FACTOR_COVARIATES):
+    """Regressors for the estimation sample ``rows``: IQ first, then age, sex and SES indicators, constant last."""
+    sample = cohort.loc[rows]
+    columns = [sample[f'z_{iq_var}'].to_numpy(float), sample[f'age_{age}'].to_numpy(float)]
+    for covariate in covariates:
+        columns.extend(indicator_columns(sample[covariate].to_numpy()))
+    columns.append(np.ones(len(sample)))
+    return np.column_stack(columns)
+
+
+def fit_batch(X, Y, clusters=None, weights=None):
+    """Fit every column of ``Y`` on the shared design ``X`` with a single QR factorisation.
+
+    Returns the coefficients and the OLS, HC1, HC3 and (if ``clusters`` is given) cluster-robust
+    standard errors as ``(n_params, n_outcomes)`` arrays, plus the adjusted R² per outcome.
+    The sandwich variances reuse the factorisation and the residual matrix: with
+    ``A = (X'X)^-1 X'``, the HC diagonals are ``(A**2) @ (E**2)`` for all outcomes at once.
+    With ``weights`` the fit is weighted least squares (rows scaled by the root weights), and
+    the robust standard errors match Stata's ``[pweight=...]``.
+    """
+    weights = np.ones(len(X)) if weights is None else weights
+    root_weights = np.sqrt(weights)[:, None]
+    y_mean = weights @ Y / weights.sum()
+    X, Y = X * root_weights, Y * root_weights
+    n, p = X.shape
+    Q, R = np.linalg.qr(X)
+    B = solve_triangular(R, Q.T @ Y)
+    E = Y - X @ B
+    df = n - p
+
+    R_inv = solve_triangular(R, np.eye(p))
+    A = R_inv @ Q.T
+    A2 = A ** 2
+    E2 = E ** 2
+    ssr = E2.sum(axis=0)
+
+    fit = {'coef': B, 'df': df, 'n': n, 'sigma2': ssr / df, 'xtx_inv': R_inv @ R_inv.T}
+    fit['se'] = np.sqrt((R_inv ** 2).sum(axis=1)[:, None] * (ssr / df)[None, :])
+    fit['se_hc1'] = np.sqrt(A2 @ E2 * (n / df))
+    leverage = (Q ** 2).sum(axis=1)
+    fit['se_hc3'] = np.sqrt(A2 @ (E2 / (1 - leverage)[:, None] ** 2))
+
+    if clusters is not None:
+        codes, uniques = pd.factorize(clusters)
+        n_clusters = len(uniques)
+        # Cluster-by-observation indicator, so each score sum is one sparse product
+        G = sparse.csr_matrix((np.ones(n), (codes, np.arange(n))), shape=(n_clusters, n))
+        var = np.empty_like(B)
+        for j in range(p):
+            var[j] = ((G @ (A[j][:, None] * E)) ** 2).sum(axis=0)
+        # Stata's finite-sample adjustment for vce(cluster)
+        scale = n_clusters / (n_clusters - 1) * (n - 1) / df
+        fit['se_cluster'] = np.sqrt(var * scale)
+        fit['n_clusters'] = n_clusters
+
+    sst = ((Y - root_weights * y_mean) ** 2).sum(axis=0)
+    fit['r2_adj'] = 1 - (ssr / df) / (sst / (n - 1))
+    return fit
+
+
+def influence_batch(X, Y):
+    """Influence diagnostics of every observation for all columns of ``Y`` on the shared design ``X``.
+
+    Everything follows from one QR factorisation through the leave-one-out identities
+    ``b - b(i) = A[:, i] e_i / (1 - h_i)`` and ``s(i)^2 = (SSR - e_i^2 / (1 - h_i)) / (df - 1)``,
+    so no model is refitted. Returns the leverage ``(n,)`` and, as ``(n, n_outcomes)`` arrays,
+    Cook's distance, the DFBETA and DFBETAS of the IQ coefficient and the exact leave-one-out
+    IQ coefficient.
+    """
+    n, p = X.shape
+    Q, R = np.linalg.qr(X)
+    B = solve_triangular(R, Q.T @ Y)
+    E = Y - X @ B
+    df = n - p
+    a = solve_triangular(R, Q.T)[0]
+    leverage = (Q ** 2).sum(axis=1)
+
+    ssr = (E ** 2).sum(axis=0)
+    scaled = E / (1 - leverage)[:, None]
+    dfbeta = a[:, None] * scaled
+    s2_loo = (ssr[None, :] - E * scaled) / (df - 1)
+    return {
+        'leverage': leverage,
+        'cooks_d': scaled ** 2 * leverage[:, None] / (p * ssr / df),
+        'dfbeta': dfbeta,
+        'dfbetas': dfbeta / np.sqrt(s2_loo * (a @ a)),
+        'loo_coef': B[0] - dfbeta,
+    }
+
+
+def estimation_batches(cohort, iq_vars=(DEFAULT_IQ_VAR,), factors=None, cluster=None, covariates=FACTOR_COVARIATES,
+                       ages=None, index=None, within=None):
+    """Yield ``(iq_var, age, sample, factors)`` for every group of outcomes sharing a design and estimation sample.
+
+    For each exposure and age the regressors are the same for every risk factor, so the outcomes
+    whose estimation samples coincide (e.g. the lipids measured on the same blood sample) can be
+    fitted together. ``covariates`` are the factor covariates of the design and ``ages``
+    restricts the grid to some measurement ages. The samples are ANDs of the packed
+    availability bitmaps of ``index`` (a MissingnessIndex of the cohort, built if not given),
+    restricted to the packed mask ``within`` (e.g. a stratum) if given.
+    """
+    index = cohort_index(cohort, index)
+    factors = list(outcome_ages) if factors is None else factors
+    grid_ages = sorted({age for factor in factors for age in outcome_ages[factor]})
+    for iq_var in iq_vars:
+        for age in grid_ages:
+            if ages is not None and age not in ages:
+                continue
+            complete = index.regressors(iq_var, age, covariates, cluster)
+            if within is not None:
+                complete = complete & within
+
+            # Group the outcomes at this age by estimation sample
+            batches = {}
+            for factor in factors:
+                if age not in outcome_ages[factor]:
+                    continue
+                sample = complete & index.bitmap(f'z_{factor}_{age}')
+                batches.setdefault(index.key(sample), (sample, []))[1].append(factor)
+
+            for sample, batch_factors in batches.values():
+                yield iq_var, age, index.mask(sample), batch_factors
+
+
+def interaction_design(cohort, iq_var, age, rows, by, covariates=FACTOR_COVARIATES):
+    """Design of the IQ x ``by`` model: IQ, IQ x each non-base level of ``by``, then the columns of design_matrix.
+
+    ``covariates`` must include ``by`` (its main effect). Returns the design and the interacted levels.
+    """
+    X = design_matrix(cohort, iq_var, age, rows, covariates)
+    values = cohort.loc[rows, by].to_numpy()
+    levels = np.unique(values)[1:]
+    interactions = [X[:, 0] * (values == level) for level in levels]
+    return np.column_stack([X[:, :1]] + interactions + [X[:, 1:]]), levels
+
+
+def batch_arrays(cohort, iq_var, age, sample, batch_factors, covariates=FACTOR_COVARIATES):
+    """Design matrix and outcome matrix (one column per factor) of an estimation batch."""
+    X = design_matrix(cohort, iq_var, age, sample, covariates)
+    Y = cohort.loc[sample, [f'z_{factor}_{age}' for factor in batch_factors]].to_numpy(float)
+    return X, Y
+
+
+def run_regressions(cohort, iq_vars=(DEFAULT_IQ_VAR,), factors=None, cluster=None, attrition=None,
+                    covariates=FACTOR_COVARIATES, ages=None, index=None, within=None, stratum=ALL_STRATA):
+    """Run the js_cfpwv.do regression grid, one batched fit per shared design and estimation sample.
+
+    With ``attrition`` (an ``AttritionWeights``) every batch is also fitted by weighted least
+    squares with the weights of its wave, reported in the ``*_IPW`` columns with robust (or,
+    with ``cluster``, cluster-robust) standard errors. ``covariates`` and ``ages`` select a
+    sensitivity spec (default: the js_cfpwv.do model at every age). ``index`` is the
+    MissingnessIndex of the cohort, built here if not given. ``within`` (a packed mask of the
+    index) restricts every model to one stratum, whose key is stored in the ``Stratum`` column.
+    """
+    index = cohort_index(cohort, index)
+
+    def fit_sample(iq_var, age, sample, batch_factors, weights=None):
+        X, Y = batch_arrays(cohort, iq_var, age, sample, batch_factors, covariates)
+        clusters = cohort.loc[sample, cluster].to_numpy() if cluster else None
+        return fit_batch(X, Y, clusters, weights)
+
+    rows = []
+    batches = estimation_batches(cohort, iq_vars, factors, cluster, covariates, ages, index, within)
+    for iq_var, age, sample, batch_factors in batches:
+        if within is not None and sample.sum() < MIN_STRATUM_N:
+            continue
+        wave_weights = attrition.weights(age).to_numpy() if attrition is not None else None
+        fit = fit_sample(iq_var, age, sample, batch_factors)
+        t_crit = stats.t.ppf(0.975, fit['df'])
+
+        if wave_weights is not None:
+            # Responders without a weight (incomplete response-model covariates) drop out
+            weighted = sample & ~np.isnan(wave_weights)
+            ipw_fit = fit_sample(iq_var, age, weighted, batch_factors, wave_weights[weighted])
+            ipw_se = ipw_fit['se_cluster'] if cluster else ipw_fit['se_hc1']
+            ipw_df = ipw_fit['n_clusters'] - 1 if cluster else ipw_fit['df']
+            ipw_t_crit = stats.t.ppf(0.975, ipw_df)
+
+        for j, factor in enumerate(batch_factors):
+            coef, se = fit['coef'][0, j], fit['se'][0, j]
+            row = {
+                'Factor': factor,
+                'IQ_Var': iq_var,
+                'Age': age,
+                'Stratum': stratum,
+                'Coefficient': coef,
+                'CI_Lower': coef - t_crit * se,
+                'CI_Upper': coef + t_crit * se,
+                'P_value': 2 * stats.t.sf(abs(coef / se), fit['df']),
+                'R2': fit['r2_adj'][j],
+                'N': fit['n'],
+                'Missing': index.missing(f'z_{factor}_{age}', within),
+                'SE': se,
+                'SE_HC1': fit['se_hc1'][0, j],
+                'SE_HC3': fit['se_hc3'][0, j],
+                'SE_Cluster': fit['se_cluster'][0, j] if cluster else np.nan,
+                'DF': fit['df'],
+                'N_Clusters': fit.get('n_clusters'),
+            }
+            if wave_weights is not None:
+                coef, se = ipw_fit['coef'][0, j], ipw_se[0, j]
+                row.update({
+                    'Coefficient_IPW': coef,
+                    'SE_IPW': se,
+                    'CI_Lower_IPW': coef - ipw_t_crit * se,
+                    'CI_Upper_IPW': coef + ipw_t_crit * se,
+                    'P_value_IPW': 2 * stats.t.sf(abs(coef / se), ipw_df),
+                    'N_IPW': ipw_fit['n'],
+                })
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def run_interactions(cohort, by, iq_vars=(DEFAULT_IQ_VAR,), factors=None, cluster=None,
+                     covariates=FACTOR_COVARIATES, index=None):
+    """Fit the IQ x ``by`` interaction model of every grid outcome, one factorisation per shared design.
+
+    Each model gives one row per non-base level of ``by``, keyed ``iq_x_<by>=<level>`` in the
+    ``Stratum`` column: the coefficient is the difference between the IQ slope at that level and
+    at the base (lowest) level, and ``P_value_Joint`` is the F-test of all the model's IQ x ``by``
+    terms (whether the IQ association differs by ``by`` at all).
+    """
+    index = cohort_index(cohort, index)
+    covariates = list(covariates) + ([by] if by not in covariates else [])
+    rows = []
+    for iq_var, age, sample, batch_factors in estimation_batches(cohort, iq_vars, factors, cluster, covariates,
+                                                                 index=index):
+        X, levels = interaction_design(cohort, iq_var, age, sample, by, covariates)
+        if not len(levels):
+            continue
+        Y = cohort.loc[sample, [f'z_{factor}_{age}' for factor in batch_factors]].to_numpy(float)
+        fit = fit_batch(X, Y, cohort.loc[sample, cluster].to_numpy() if cluster else None)
+        t_crit = stats.t.ppf(0.975, fit['df'])
+
+        # Wald F-test of the interaction terms, for every outcome of the batch at once
+        terms = np.arange(1, len(levels) + 1)
+        b = fit['coef'][terms]
+        wald = (b * np.linalg.solve(fit['xtx_inv'][np.ix_(terms, terms)], b)).sum(axis=0) / fit['sigma2']
+        p_joint = stats.f.sf(wald / len(terms), len(terms), fit['df'])
+
+        for j, factor in enumerate(batch_factors):
+            for term, level in zip(terms, levels):
+                coef, se = fit['coef'][term, j], fit['se'][term, j]
+                rows.append({
+                    'Factor': factor,
+                    'IQ_Var': iq_var,
+                    'Age': age,
+                    'Stratum': stratum_key(by, level, interaction=True),
+                    'Coefficient': coef,
+                    'CI_Lower': coef - t_crit * se,
+                    'CI_Upper': coef + t_crit * se,
+                    'P_value': 2 * stats.t.sf(abs(coef / se), fit['df']),
+                    'R2': fit['r2_adj'][j],
+                    'N': fit['n'],
+                    'Missing': index.missing(f'z_{factor}_{age}'),
+                    'SE': se,
+                    'SE_HC1': fit['se_hc1'][term, j],
+                    'SE_HC3': fit['se_hc3'][term, j],
+                    'SE_Cluster': fit['se_cluster'][term, j] if cluster else np.nan,
+                    'DF': fit['df'],
+                    'N_Clusters': fit.get('n_clusters'),
+                    'P_value_Joint': p_joint[j],
+                })
+    return pd.DataFrame(rows)
+
+
+def run_stratified(cohort, by=STRATIFY_BY, iq_vars=(DEFAULT_IQ_VAR,), factors=None, cluster=None, attrition=None,
+                   index=None):
+    """Fit the grid within every level of each ``by`` variable, and the IQ x ``by`` interaction models.
+
+    Within a stratum its own variable is dropped from the covariates; each stratum is a packed
+    mask of the missingness index, so its outcomes are batched by shared estimation sample and
+    every design is factorised once for all of them, as in run_regressions.
+    """
+    index = cohort_index(cohort, index)
+    frames = []
+    for variable in by:
+        covariates = [covariate for covariate in FACTOR_COVARIATES if covariate != variable]
+        values = cohort[variable].to_numpy(float)
+        for level in np.unique(values[~np.isnan(values)]):
+            frames.append(run_regressions(cohort, iq_vars, factors, cluster, attrition, covariates, index=index,
+                                          within=np.packbits(values == level), stratum=stratum_key(variable, level)))
+        frames.append(run_interactions(cohort, variable, iq_vars, factors, cluster, index=index))
+    return pd.concat(frames, ignore_index=True)
+
+
+def run_influence(cohort, iq_vars=(DEFAULT_IQ_VAR,), factors=None, top_k=10):
+    """Influence diagnostics of every grid model: one row per observation and a per-model summary.
+
+    Observations are identified by the cohort index; the summary lists the ``top_k`` observations
+    with the largest |DFBETA| of the IQ coefficient.
+    """
+    observations, summaries = [], []
+    for iq_var, age, sample, batch_factors in estimation_batches(cohort, iq_vars, factors):
+        X, Y = batch_arrays(cohort, iq_var, age, sample, batch_factors)
+        diagnostics = influence_batch(X, Y)
+        ids = cohort.index[sample]
+        n = len(ids)
+        for j, factor in enumerate(batch_factors):
+            cooks_d, dfbeta = diagnostics['cooks_d'][:, j], diagnostics['dfbeta'][:, j]
+            dfbetas, loo_coef = diagnostics['dfbetas'][:, j], diagnostics['loo_coef'][:, j]
+            observations.append(pd.DataFrame({
+                'Factor': factor,
+                'IQ_Var': iq_var,
+                'Age': age,
+                'ID': ids,
+                'Leverage': diagnostics['leverage'],
+                'Cooks_D': cooks_d,
+                'DFBETA_IQ': dfbeta,
+                'DFBETAS_IQ': dfbetas,
+                'LOO_Coefficient': loo_coef,
+            }))
+            top = np.argsort(-np.abs(dfbeta))[:top_k]
+            summaries.append({
+                'Factor': factor,
+                'IQ_Var': iq_var,
+                'Age': age,
+                'N': n,
+                'Max_Leverage': diagnostics['leverage'].max(),
+                'Max_Cooks_D': cooks_d.max(),
+                # Conventional cut-offs: Cook's D > 4/n and |DFBETAS| > 2/sqrt(n)
+                'N_Cooks_D_Above_4_n': int((cooks_d > 4 / n).sum()),
+                'N_DFBETAS_Above_2_sqrt_n': int((np.abs(dfbetas) > 2 / np.sqrt(n)).sum()),
+                'Max_Abs_DFBETA_IQ': np.abs(dfbeta).max(),
+                'Max_Abs_DFBETAS_IQ': np.abs(dfbetas).max(),
+                'LOO_Coefficient_Min': loo_coef.min(),
+                'LOO_Coefficient_Max': loo_coef.max(),
+                'Top_IDs': ' '.join(str(id_) for id_ in ids[top]),
+                'Top_DFBETA_IQ': ' '.join(f'{value:.6f}' for value in dfbeta[top]),
+            })
+    return pd.concat(observations, ignore_index=True), pd.DataFrame(summaries)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the js_cfpwv.do regressions with OLS and robust standard errors.')
+    parser.add_argument('--data', default=COHORT_FILE, help='ALSPAC .dta extract (default: %(default)s)')
+    parser.add_argument('--iq-var', nargs='+', default=[DEFAULT_IQ_VAR],
+                        help='IQ exposures to regress on (default: %(default)s)')
+    parser.add_argument('--cluster', help='column of the extract identifying clusters (e.g. family or school)')
+    parser.add_argument('--ipw', action='store_true',
+                        help='also fit every model with inverse-probability-of-attrition weights')
+    parser.add_argument('--response-covariates', nargs='+',
+                        help='predictors of clinic attendance for the attrition weights')
+    parser.add_argument('--influence', type=int, nargs='?', const=10, metavar='TOP_K',
+                        help='also write influence diagnostics, listing the TOP_K most influential '
+                             'observations per model (default: 10)')
+    parser.add_argument('--id-column', help='column of the extract identifying participants in the diagnostics')
+    parser.add_argument('--stratify', nargs='*', choices=STRATIFY_BY, metavar='VARIABLE',
+                        help='also fit every model within each level of these variables, and the IQ x variable '
+                             f"interaction models (default: {' '.join(STRATIFY_BY)})")
+    args = parser.parse_args()
+
+    extra_columns = [column for column in (args.cluster, args.id_column) if column]
+    cohort = load_cohort(args.data, extra_columns=extra_columns)
+    if args.id_column:
+        cohort = cohort.set_index(args.id_column, drop=False)
+    attrition = None
+    if args.ipw:
+        # Imported here: attrition_weights builds its design with this module's helpers
+        from attrition_weights import RESPONSE_COVARIATES, WEIGHTS_SUMMARY_FILE, AttritionWeights
+        attrition = AttritionWeights(cohort, args.response_covariates or RESPONSE_COVARIATES)
+    index = MissingnessIndex.from_cohort(cohort)
+    results_df = run_regressions(cohort, args.iq_var, cluster=args.cluster, attrition=attrition, index=index)
+    if args.stratify is not None:
+        stratified_df = run_stratified(cohort, args.stratify or STRATIFY_BY, args.iq_var, cluster=args.cluster,
+                                       attrition=attrition, index=index)
+        results_df = pd.concat([results_df, stratified_df], ignore_index=True)
+    write_results(results_df)
+    if attrition is not None:
+        write_csv(attrition.summary(), WEIGHTS_SUMMARY_FILE, index=False)
+    if args.influence is not None:
+        observations_df, influence_df = run_influence(cohort, args.iq_var, top_k=args.influence)
+        write_parquet(observations_df, INFLUENCE_FILE, index=False)
+        write_csv(influence_df, INFLUENCE_SUMMARY_FILE, index=False)
+        print(f"Wrote influence diagnostics of {len(influence_df)} models to {INFLUENCE_SUMMARY_FILE}.")
+    flush_outputs()
+    print(f"Wrote {len(results_df)} regression results with OLS, HC1, HC3"
+          f"{' and cluster-robust' if args.cluster else ''} standard errors"
+          f"{' and attrition-weighted estimates' if attrition is not None else ''}.")
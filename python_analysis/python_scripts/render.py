@@ -0,0 +1,119 @@
+import argparse
+import fnmatch
+import os
+import pickle
+
+import matplotlib.pyplot as plt
+
+from output_sink import flush_outputs, write_bytes, write_figure
+from paths import FIGURES_DIR
+
+# Output mode for figures: 'png' (default) rasterises every figure, 'html' skips the PNGs
+# in favour of the interactive dashboard written by dashboard.py, 'both' does both
+OUTPUT_MODE = os.environ.get('CFPWV_OUTPUT_MODE', 'png').lower()
+if OUTPUT_MODE not in ('png', 'html', 'both'):
+    raise ValueError(f"CFPWV_OUTPUT_MODE must be 'png', 'html' or 'both', not {OUTPUT_MODE!r}")
+
+# Render profile: 'publication' (default) saves at the dpi/bbox requested by the script;
+# 'draft' saves at low dpi with a fixed layout and caches a figure spec so that selected
+# figures can be re-rendered for publication later with `python render.py publish <names>`
+RENDER_PROFILE = os.environ.get('CFPWV_RENDER_PROFILE', 'publication').lower()
+if RENDER_PROFILE not in ('draft', 'publication'):
+    raise ValueError(f"CFPWV_RENDER_PROFILE must be 'draft' or 'publication', not {RENDER_PROFILE!r}")
+
+# Optional restriction of the per-factor and per-age figures to the factors/ages whose
+# results changed (comma-separated lists, set by watch_logs.py for incremental re-runs)
+ONLY_FACTORS = [f for f in os.environ.get('CFPWV_ONLY_FACTORS', '').split(',') if f]
+ONLY_AGES = [int(a) for a in os.environ.get('CFPWV_ONLY_AGES', '').split(',') if a]
+
+DRAFT_DPI = 72
+DRAFT_MARGINS = {'left': 0.2, 'right': 0.95, 'bottom': 0.1, 'top': 0.9}
+SPEC_DIR = f'{FIGURES_DIR}/.specs'
+
+
+def png_enabled():
+    """Return True if the current output mode writes PNG figures."""
+    return OUTPUT_MODE in ('png', 'both')
+
+
+def figure_selected(factors=None, ages=None):
+    """Return True unless the run is restricted to other factors/ages than the figure shows."""
+    if factors is not None and ONLY_FACTORS and not set(factors) & set(ONLY_FACTORS):
+        return False
+    if ages is not None and ONLY_AGES and not {int(age) for age in ages} & set(ONLY_AGES):
+        return False
+    return True
+
+
+def finalise_layout():
+    """Lay out the current figure: tight layout for publication, fixed margins for drafts."""
+    if RENDER_PROFILE == 'draft':
+        plt.gcf().subplots_adjust(**DRAFT_MARGINS)
+    else:
+        plt.tight_layout()
+
+
+def figure_name(path):
+    """Name under which a figure spec is cached (the PNG file name without extension)."""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def cache_figure_spec(fig, path, savefig_kwargs, spec_dir=SPEC_DIR):
+    """Pickle the figure with its publication save settings for a later publish run."""
+    os.makedirs(spec_dir, exist_ok=True)
+    spec = {'figure': fig, 'path': path, 'savefig_kwargs': savefig_kwargs}
+    write_bytes(os.path.join(spec_dir, f'{figure_name(path)}.pickle'),
+                pickle.dumps(spec, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def save_figure(path, **kwargs):
+    """Save the current figure for the active profile and output mode, then close it.
+
+    ``kwargs`` are the publication settings (e.g. ``dpi=300, bbox_inches='tight'``); the
+    draft profile ignores them, skipping the extra tight-bbox draw pass. The PNG is encoded here
+    and written by the output sink (temp file + rename) while the script carries on.
+    """
+    fig = plt.gcf()
+    if RENDER_PROFILE == 'draft':
+        cache_figure_spec(fig, path, kwargs)
+        kwargs = {'dpi': DRAFT_DPI}
+    if png_enabled():
+        write_figure(fig, path, **kwargs)
+    plt.close(fig)
+
+
+def cached_figures(spec_dir=SPEC_DIR):
+    """List the names of the cached figure specs."""
+    if not os.path.isdir(spec_dir):
+        return []
+    return sorted(figure_name(f) for f in os.listdir(spec_dir) if f.endswith('.pickle'))
+
+
+def publish(patterns, spec_dir=SPEC_DIR):
+    """Re-render the cached figures matching the glob patterns with their publication settings."""
+    names = [name for name in cached_figures(spec_dir)
+             if any(fnmatch.fnmatch(name, pattern) for pattern in patterns)]
+    for name in names:
+        with open(os.path.join(spec_dir, f'{name}.pickle'), 'rb') as f:
+            spec = pickle.load(f)
+        fig = spec['figure']
+        fig.tight_layout()
+        write_figure(fig, spec['path'], **spec['savefig_kwargs'])
+        plt.close(fig)
+    return names
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Publish figures cached by a draft render.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help='list the cached figure specs')
+    publish_parser = subparsers.add_parser('publish', help='re-render selected figures at publication quality')
+    publish_parser.add_argument('patterns', nargs='+', help="figure names or glob patterns, e.g. 'age_24_*'")
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        print('\n'.join(cached_figures()))
+    else:
+        published = publish(args.patterns)
+        flush_outputs()
+        print(f"Published {len(published)} figure(s): {', '.join(published)}")
@@ -0,0 +1,217 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from string import Template
+
+import numpy as np
+
+from output_sink import write_text
+
+# Markdown report templates (one file per report, split into named blocks)
+TEMPLATES_DIR = '../templates'
+BLOCK_MARKER = re.compile(r'^<!-- block: (\w+) -->\n', re.M)
+
+
+@lru_cache(maxsize=None)
+def load_templates(report, templates_dir=TEMPLATES_DIR):
+    """Load the named blocks of ``<report>.md.tmpl``.
+
+    A block runs from its marker line to the next marker; the newline that ends
+    the block's last line is not part of the block.
+    """
+    with open(os.path.join(templates_dir, f'{report}.md.tmpl'), 'r') as f:
+        text = f.read()
+    parts = BLOCK_MARKER.split(text)
+    blocks = {}
+    for name, body in zip(parts[1::2], parts[2::2]):
+        blocks[name] = Template(body[:-1] if body.endswith('\n') else body)
+    return blocks
+
+
+def write_report(path, text):
+    """Queue a rendered report as a single buffer on the output sink (see output_sink.py)."""
+    write_text(path, text)
+
+
+def render_age_specific_findings(age_analyses, exposure):
+    """Render age_specific_findings.md for one exposure from ``[(summary, sorted_data), ...]`` produced by analyse_by_age."""
+    blocks = load_templates('age_specific_findings')
+    sections = []
+    for summary, sorted_data in age_analyses:
+        rows = ''.join(
+            blocks['row'].substitute(
+                risk_factor=row['Risk Factor'],
+                coefficient=f"{row['Coefficient']:.4f}",
+                p_value=f"{row['P-value_numeric']:.4f}",
+                significant="Yes" if row['Significant'] else "No",
+            ) + '\n'
+            for row in sorted_data.to_dict('records')
+        )
+        sections.append(blocks['age_section'].substitute(
+            age=int(summary['Age']),
+            total=summary['Total Factors Measured'],
+            significant=summary['Significant Associations'],
+            percent_significant=f"{summary['Percent Significant']:.1f}",
+            negative=summary['Negative Associations'],
+            positive=summary['Positive Associations'],
+            strongest=summary['Strongest Association'],
+            strongest_coefficient=f"{summary['Strongest Coefficient']:.4f}",
+            strongest_p_value=f"{summary['Strongest P-value']:.4f}",
+            exposure=exposure,
+            rows=rows,
+        ))
+    return blocks['report'].substitute(age_sections=''.join(sections))
+
+
+def format_statistic(value, spec):
+    """Format a trend statistic, or 'n/a' if it is missing (e.g. no early-age measurement)."""
+    return 'n/a' if np.isnan(value) else format(value, spec)
+
+
+def trend_interpretation(analysis):
+    """Return the interpretation block name for a trend analysis, or None if no interpretation applies."""
+    if analysis['Trend Significance'] != 'significant':
+        return 'interpretation_no_trend'
+    early = analysis['Early Ages Mean Coef']
+    late = analysis['Late Ages Mean Coef']
+    if analysis['Trend Direction'] == 'increasing':
+        if early < 0 and late < 0:
+            return 'interpretation_negative_weakens'
+        if early < 0 and late > 0:
+            return 'interpretation_negative_to_positive'
+        if early > 0 and late > 0:
+            return 'interpretation_positive_strengthens'
+    else:
+        if early < 0 and late < 0:
+            return 'interpretation_negative_strengthens'
+        if early > 0 and late < 0:
+            return 'interpretation_positive_to_negative'
+        if early > 0 and late > 0:
+            return 'interpretation_positive_weakens'
+    return None
+
+
+def render_cross_age_trend_findings(sorted_analyses, exposure):
+    """Render cross_age_trend_findings.md for one exposure from trend analyses already sorted by absolute slope."""
+    blocks = load_templates('cross_age_trend_findings')
+
+    sig_trends = [a for a in sorted_analyses if a['Trend Significance'] == 'significant']
+    total_trends = sum(1 for a in sorted_analyses if a['Trend Significance'] != 'insufficient data')
+    increasing = sum(1 for a in sorted_analyses if a['Trend Direction'] == 'increasing')
+    decreasing = sum(1 for a in sorted_analyses if a['Trend Direction'] == 'decreasing')
+
+    valid_early = [a['Early Ages Sig %'] for a in sorted_analyses if not np.isnan(a['Early Ages Sig %'])]
+    valid_late = [a['Late Ages Sig %'] for a in sorted_analyses if not np.isnan(a['Late Ages Sig %'])]
+    avg_early_sig = sum(valid_early) / len(valid_early) if valid_early else 0
+    avg_late_sig = sum(valid_late) / len(valid_late) if valid_late else 0
+
+    # Detailed findings by risk factor
+    sections = []
+    for analysis in sorted_analyses:
+        if analysis['Trend Significance'] == 'insufficient data':
+            sections.append(blocks['insufficient_section'].substitute(risk_factor=analysis['Risk Factor']))
+            continue
+        interpretation = trend_interpretation(analysis)
+        sections.append(blocks['trend_section'].substitute(
+            risk_factor=analysis['Risk Factor'],
+            direction=analysis['Trend Direction'],
+            significance=analysis['Trend Significance'],
+            method=analysis['Trend Method'],
+            p_value=f"{analysis['Trend P-value']:.4f}",
+            slope=f"{analysis['Trend Slope']:.6f}",
+            r_squared=format_statistic(analysis['R-squared'], '.3f'),
+            early_mean=format_statistic(analysis['Early Ages Mean Coef'], '.4f'),
+            late_mean=format_statistic(analysis['Late Ages Mean Coef'], '.4f'),
+            difference=format_statistic(analysis['Early-Late Difference'], '.4f'),
+            interpretation=blocks[interpretation].substitute(exposure=exposure) + '\n\n' if interpretation else '',
+        ))
+
+    # Summary of key findings
+    key_findings = []
+    if sig_trends:
+        items = []
+        for analysis in sig_trends:
+            strengthening = (analysis['Trend Direction'] == 'decreasing' and analysis['Early Ages Mean Coef'] < 0) or \
+                            (analysis['Trend Direction'] == 'increasing' and analysis['Early Ages Mean Coef'] > 0)
+            items.append(blocks['significant_trend_item'].substitute(
+                risk_factor=analysis['Risk Factor'],
+                change="strengthening" if strengthening else "weakening",
+                direction='negative' if analysis['Late Ages Mean Coef'] < 0 else 'positive',
+                slope=f"{analysis['Trend Slope']:.6f}",
+                p_value=f"{analysis['Trend P-value']:.4f}",
+            ) + '\n')
+        key_findings.append(blocks['significant_trends'].substitute(items=''.join(items)))
+
+    consistent_items = []
+    changing_items = []
+    for analysis in sorted_analyses:
+        if analysis['Trend Significance'] == 'insufficient data':
+            continue
+        early_sig = analysis['Early Ages Sig %']
+        late_sig = analysis['Late Ages Sig %']
+        if np.isnan(early_sig) or np.isnan(late_sig):
+            continue
+        if (early_sig + late_sig) / 2 >= 50:
+            consistent_items.append(blocks['consistent_item'].substitute(
+                risk_factor=analysis['Risk Factor'],
+                direction="negative" if analysis['Late Ages Mean Coef'] < 0 else "positive",
+            ) + '\n')
+        if (early_sig == 0 and late_sig > 0) or (early_sig > 0 and late_sig == 0):
+            changing_items.append(blocks['changing_item'].substitute(
+                risk_factor=analysis['Risk Factor'],
+                change_type="Emerging" if early_sig == 0 else "Disappearing",
+            ) + '\n')
+    if consistent_items:
+        key_findings.append(blocks['consistent_associations'].substitute(items=''.join(consistent_items)))
+    if changing_items:
+        key_findings.append(blocks['changing_associations'].substitute(items=''.join(changing_items)))
+
+    return blocks['report'].substitute(
+        exposure=exposure,
+        total_trends=total_trends,
+        significant_trends=len(sig_trends),
+        percent_significant_trends=f"{len(sig_trends) / total_trends * 100 if total_trends else 0:.1f}",
+        increasing=increasing,
+        decreasing=decreasing,
+        early_significant=f"{avg_early_sig:.1f}",
+        late_significant=f"{avg_late_sig:.1f}",
+        trend_sections=''.join(sections),
+        key_findings=''.join(key_findings),
+    )
+
+
+def render_extended_analysis_summary(sig_by_period, sig_by_category, exposure):
+    """Render extended_analysis_summary.md for one exposure from the percentage-significant series by period and category."""
+    blocks = load_templates('extended_analysis_summary')
+    return blocks['report'].substitute(
+        exposure=exposure,
+        childhood_significant=f"{sig_by_period.get('Childhood (9-12)', np.nan):.1f}",
+        early_adulthood_significant=f"{sig_by_period.get('Early Adulthood (17-24)', np.nan):.1f}",
+        anthropometric_significant=f"{sig_by_category.get('Anthropometric', np.nan):.1f}",
+        blood_pressure_significant=f"{sig_by_category.get('Blood Pressure', np.nan):.1f}",
+        glucose_significant=f"{sig_by_category.get('Glucose Metabolism', np.nan):.1f}",
+        lipid_significant=f"{sig_by_category.get('Lipid Profile', np.nan):.1f}",
+    )
+
+
+RENDERERS = {
+    'age_specific_findings': render_age_specific_findings,
+    'cross_age_trend_findings': render_cross_age_trend_findings,
+    'extended_analysis_summary': render_extended_analysis_summary,
+}
+
+
+def render_report(report, args, path):
+    """Render one report from its precomputed analysis objects and write it to ``path``."""
+    write_report(path, RENDERERS[report](*args))
+    return path
+
+
+def render_reports(jobs, max_workers=None):
+    """Render many ``(report, args, path)`` jobs (e.g. one per sensitivity spec) in a process pool."""
+    jobs = list(jobs)
+    if max_workers == 1 or len(jobs) <= 1:
+        return [render_report(*job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(render_report, *zip(*jobs), chunksize=max(1, len(jobs) // 64)))
@@ -0,0 +1,295 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from category_pooling import developmental_period, load_correlations, pool_categories
+from factor_metadata import ALL_STRATA, factor_category, risk_factors
+from paths import TABLES_DIR
+from results_store import RESULTS_DIR, SE_COLUMNS, apply_inference, check_inference, read_results
+
+# Views written by the analysis scripts (steps 7 and 8) that the service serves as they are
+VIEW_FILES = {
+    'age_summary': f'{TABLES_DIR}/age_summary.csv',
+    'trend_summary': f'{TABLES_DIR}/trend_summary.csv',
+}
+
+# Inference specs: the standard errors of the complete-case fit, or the attrition-weighted fit
+SPECS = list(SE_COLUMNS) + ['ipw']
+IPW_COLUMNS = {'Coefficient': 'Coefficient_IPW', 'SE': 'SE_IPW', 'CI_Lower': 'CI_Lower_IPW',
+               'CI_Upper': 'CI_Upper_IPW', 'P_value': 'P_value_IPW', 'N': 'N_IPW'}
+
+# Columns returned for every model, and the filters /results accepts (stratum defaults to the full cohort)
+RESPONSE_COLUMNS = ['Factor', 'IQ_Var', 'Age', 'Stratum', 'Coefficient', 'CI_Lower', 'CI_Upper', 'P_value', 'R2', 'N']
+FILTERS = {'factor': 'Factor', 'iq_var': 'IQ_Var', 'age': 'Age', 'stratum': 'Stratum'}
+ENDPOINTS = ['results', 'periods', 'categories'] + list(VIEW_FILES)
+
+# Queries whose response is kept, and how often (seconds) the store is checked for a new run
+CACHE_SIZE = 1024
+CHECK_INTERVAL = 1.0
+
+
+class QueryError(ValueError):
+    """A request the service cannot answer (reported as HTTP 400)."""
+
+
+class UnknownEndpoint(LookupError):
+    """A path the service does not serve (reported as HTTP 404)."""
+
+
+def store_fingerprint(root=RESULTS_DIR, view_files=VIEW_FILES):
+    """Modification times and sizes of every file of the store and the views; changes when a run lands."""
+    entries = []
+    for directory, _, files in os.walk(root):
+        for name in files:
+            stat = os.stat(os.path.join(directory, name))
+            entries.append((directory, name, stat.st_mtime_ns, stat.st_size))
+    for path in view_files.values():
+        if os.path.exists(path):
+            stat = os.stat(path)
+            entries.append((path, '', stat.st_mtime_ns, stat.st_size))
+    return hash(tuple(sorted(entries)))
+
+
+def records(df):
+    """JSON-ready rows (NaN as null)."""
+    return json.loads(df.to_json(orient='records'))
+
+
+def single_stratum(params):
+    """``params`` of a rollup, which must not mix the models of several strata."""
+    if ',' in params.get('stratum', ''):
+        raise QueryError('periods and categories take a single stratum')
+    return params
+
+
+class Snapshot:
+    """Results of one run with per-spec indexes (built on first use); replaced whole when a run lands."""
+
+    def __init__(self, version, results, views):
+        self.version = version
+        self.results = results
+        self.views = views
+        self.correlations = load_correlations()
+        self._specs = {}
+
+    def spec(self, spec):
+        """Results under one inference spec and a position index per filter column."""
+        if spec not in SPECS:
+            raise QueryError(f"spec must be one of {', '.join(SPECS)}, not {spec!r}")
+        if spec not in self._specs:
+            df = self.results
+            # A spec the run did not compute is an error, not an empty result
+            column = 'Coefficient_IPW' if spec == 'ipw' else SE_COLUMNS.get(spec)
+            if spec != 'ols' and len(df) and df[column].isna().all():
+                if spec == 'ipw':
+                    raise QueryError('ipw estimates are missing from the results; run regression_engine.py '
+                                     'with --ipw to compute them')
+                try:
+                    check_inference(df, spec)
+                except ValueError as error:
+                    raise QueryError(str(error)) from None
+            if spec == 'ipw':
+                df = df.dropna(subset=['Coefficient_IPW']).drop(columns=list(IPW_COLUMNS))
+                df = df.rename(columns={ipw: column for column, ipw in IPW_COLUMNS.items()})
+            elif spec != 'ols':
+                df = apply_inference(df.dropna(subset=[SE_COLUMNS[spec]]), spec)
+            df = df[RESPONSE_COLUMNS].reset_index(drop=True)
+            index = {column: df.groupby(column).indices for column in FILTERS.values()}
+            self._specs[spec] = (df, index)
+        return self._specs[spec]
+
+    def select(self, params):
+        """Rows matching every given filter (comma-separated values), intersecting the indexes."""
+        df, index = self.spec(params.get('spec', 'ols'))
+        params = {'stratum': ALL_STRATA, **params}
+        positions = None
+        for name, column in FILTERS.items():
+            if name not in params:
+                continue
+            matches = []
+            for value in params[name].split(','):
+                try:
+                    key = int(value) if column == 'Age' else value
+                except ValueError:
+                    raise QueryError(f'{name} must be an integer, not {value!r}')
+                matches.append(index[column].get(key, np.array([], dtype=int)))
+            found = np.concatenate(matches)
+            positions = found if positions is None else np.intersect1d(positions, found)
+        return df if positions is None else df.iloc[np.sort(positions)]
+
+    def results_view(self, params):
+        """Coefficient, CI, p-value, R2 and N of every matching model."""
+        return records(self.select(params))
+
+    def periods_view(self, params):
+        """Per factor and developmental period: number of ages, mean coefficient, share significant."""
+        df = self.select(single_stratum(params)).assign(Developmental_Period=lambda d: developmental_period(d['Age']),
+                                        Significant=lambda d: d['P_value'] < 0.05)
+        rollup = df.groupby(['IQ_Var', 'Factor', 'Developmental_Period'], observed=True).agg(
+            Number_of_Measurements=('Coefficient', 'size'),
+            Mean_Coefficient=('Coefficient', 'mean'),
+            Proportion_Significant=('Significant', 'mean'),
+        ).reset_index()
+        rollup['Risk Factor'] = rollup['Factor'].map(lambda factor: risk_factors.get(factor, factor))
+        rollup['Proportion_Significant'] *= 100
+        return records(rollup.astype({'Developmental_Period': str}))
+
+    def categories_view(self, params):
+        """GLS-pooled effect per exposure, risk category and developmental period (category_pooling.py)."""
+        df = self.select(single_stratum(params))
+        df = df[df['Factor'].isin(list(factor_category))]
+        if df.empty:
+            return []
+        pooled = pool_categories(df, self.correlations)
+        return records(pooled.astype({'Risk_Category': str, 'Developmental_Period': str}))
+
+    def file_view(self, name, params):
+        """A view written by an analysis script, filtered on any of its columns."""
+        if name not in self.views:
+            raise LookupError(f'the {name} view has not been written yet')
+        df = self.views[name]
+        for column, value in params.items():
+            if column not in df.columns:
+                raise QueryError(f'{name} has no column {column!r}')
+            df = df[df[column].astype(str).isin(value.split(','))]
+        return records(df)
+
+    def answer(self, endpoint, params):
+        if endpoint == 'results':
+            return self.results_view(params)
+        if endpoint == 'periods':
+            return self.periods_view(params)
+        if endpoint == 'categories':
+            return self.categories_view(params)
+        return self.file_view(endpoint, params)
+
+
+class ResultsIndex:
+    """The current snapshot of the results store and an LRU cache of encoded responses.
+
+    The store is re-read when its fingerprint changes (checked at most every ``check_interval``
+    seconds). Each run gets a new snapshot and version, and the cache is keyed by version, so a
+    response never outlives the run it was computed from; the old entries are dropped at once.
+    """
+
+    def __init__(self, root=RESULTS_DIR, view_files=VIEW_FILES, cache_size=CACHE_SIZE,
+                 check_interval=CHECK_INTERVAL):
+        self.root = root
+        self.view_files = view_files
+        self.cache_size = cache_size
+        self.check_interval = check_interval
+        self.snapshot = None
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._fingerprint = None
+        self._checked = 0
+        self.refresh(force=True)
+
+    def refresh(self, force=False):
+        """Load a new snapshot if a run has landed since the last check."""
+        if not force and time.monotonic() - self._checked < self.check_interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._checked < self.check_interval:
+                return
+            self._checked = now
+            fingerprint = store_fingerprint(self.root, self.view_files)
+            if fingerprint == self._fingerprint and not force:
+                return
+            results = read_results(self.root).dropna(subset=['Coefficient'])
+            results['Age'] = results['Age'].astype(int)
+            views = {name: pd.read_csv(path) for name, path in self.view_files.items() if os.path.exists(path)}
+            version = self.snapshot.version + 1 if self.snapshot else 1
+            self.snapshot = Snapshot(version, results, views)
+            self._cache.clear()
+            self._fingerprint = fingerprint
+
+    def query(self, endpoint, params):
+        """Encoded JSON response of an endpoint, from the cache when the same query was answered before."""
+        if endpoint not in ENDPOINTS:
+            raise UnknownEndpoint(endpoint)
+        self.refresh()
+        snapshot = self.snapshot
+        key = (snapshot.version, endpoint, tuple(sorted(params.items())))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        body = json.dumps({'version': snapshot.version, 'rows': snapshot.answer(endpoint, params)},
+                          separators=(',', ':')).encode()
+        with self._lock:
+            if snapshot is self.snapshot:
+                self._cache[key] = body
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return body
+
+
+class ResultsHandler(BaseHTTPRequestHandler):
+    """GET /<endpoint>?<filters>, e.g. /results?factor=bmi&age=24&spec=hc3 or /categories?iq_var=total_iq_8."""
+
+    index = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        endpoint = url.path.strip('/')
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            self.reply(200, self.index.query(endpoint, params))
+        except QueryError as error:
+            self.reply(400, json.dumps({'error': str(error)}).encode())
+        except UnknownEndpoint:
+            self.reply(404, json.dumps({'error': f"unknown endpoint {endpoint!r}; use one of {', '.join(ENDPOINTS)}"}).encode())
+        except LookupError as error:
+            self.reply(404, json.dumps({'error': str(error)}).encode())
+        except Exception as error:
+            self.reply(500, json.dumps({'error': f'{type(error).__name__}: {error}'}).encode())
+
+    def reply(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ResultsServer(ThreadingHTTPServer):
+    """One thread per connection; a deep accept backlog absorbs bursts of dashboard requests."""
+
+    daemon_threads = True
+    request_queue_size = 512
+
+
+def make_server(host='127.0.0.1', port=8765, root=RESULTS_DIR):
+    """Server answering queries on the results store at ``root``."""
+    handler = type('Handler', (ResultsHandler,), {'index': ResultsIndex(root)})
+    return ResultsServer((host, port), handler)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the results dataset as JSON over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=8765, help='port (default: %(default)s)')
+    parser.add_argument('--root', default=RESULTS_DIR, help='results dataset (default: %(default)s)')
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.root)
+    print(f"Serving {args.root} on http://{args.host}:{args.port}/ (results, periods, categories, "
+          f"{', '.join(VIEW_FILES)}); Ctrl-C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
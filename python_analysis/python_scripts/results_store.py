@@ -0,0 +1,248 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scipy import stats
+
+from factor_metadata import ALL_STRATA, STRATUM, risk_factors, exposure_title
+from output_sink import FSYNC_POLICY, fsync_path, replace_directory, temp_path
+from paths import TABLES_DIR
+from shrinkage import ESTIMATES, shrink_estimates
+
+# Partitioned Parquet dataset holding every regression result (one row per model); point
+# CFPWV_RESULTS_DIR at another dataset (e.g. the pooled imputations) to report on it instead
+RESULTS_DIR = os.environ.get('CFPWV_RESULTS_DIR', f'{TABLES_DIR}/results')
+PARTITION_COLS = ['Factor', 'IQ_Var']
+
+# Standard errors behind the CIs and p-values the scripts report: 'ols' (default, as in the
+# Stata logs), 'hc1', 'hc3' or 'cluster' (the robust ones are written by regression_engine.py)
+INFERENCE = os.environ.get('CFPWV_SE', 'ols').lower()
+SE_COLUMNS = {'ols': 'SE', 'hc1': 'SE_HC1', 'hc3': 'SE_HC3', 'cluster': 'SE_Cluster'}
+if INFERENCE not in SE_COLUMNS:
+    raise ValueError(f"CFPWV_SE must be one of {', '.join(SE_COLUMNS)}, not {INFERENCE!r}")
+
+# Column order and types of the results dataset
+RESULT_SCHEMA = pa.schema([
+    ('Factor', pa.string()),
+    ('IQ_Var', pa.string()),
+    ('Age', pa.int16()),
+    ('Stratum', pa.string()),
+    ('Quantile', pa.float64()),
+    ('Coefficient', pa.float64()),
+    ('CI_Lower', pa.float64()),
+    ('CI_Upper', pa.float64()),
+    ('P_value', pa.float64()),
+    ('R2', pa.float64()),
+    ('N', pa.int32()),
+    ('Missing', pa.int32()),
+    ('SE', pa.float64()),
+    ('SE_HC1', pa.float64()),
+    ('SE_HC3', pa.float64()),
+    ('SE_Cluster', pa.float64()),
+    ('DF', pa.int32()),
+    ('N_Clusters', pa.int32()),
+    ('FMI', pa.float64()),
+    ('Coefficient_IPW', pa.float64()),
+    ('SE_IPW', pa.float64()),
+    ('CI_Lower_IPW', pa.float64()),
+    ('CI_Upper_IPW', pa.float64()),
+    ('P_value_IPW', pa.float64()),
+    ('N_IPW', pa.int32()),
+    ('P_value_Joint', pa.float64()),
+])
+INT_COLUMNS = ['N', 'Missing', 'DF', 'N_Clusters', 'N_IPW']
+
+
+def write_results(results_df, root=RESULTS_DIR, compression='zstd'):
+    """Write a long results frame to the partitioned Parquet dataset, replacing its partitions (atomically each).
+
+    Columns the frame does not have (e.g. the robust SEs of results parsed from Stata logs) are written as nulls,
+    rows without a stratum are the whole-cohort models and rows without a quantile the mean (OLS) models.
+    """
+    columns = [field.name for field in RESULT_SCHEMA]
+    df = results_df.reindex(columns=columns)
+    df['Stratum'] = df['Stratum'].fillna(ALL_STRATA)
+    df = df.sort_values(PARTITION_COLS + ['Stratum', 'Quantile', 'Age']).reset_index(drop=True)
+    for col in INT_COLUMNS:
+        df[col] = df[col].astype('float64').astype('Int32')
+    for col in SE_COLUMNS.values():
+        df[col] = df[col].astype('float64')
+    table = pa.Table.from_pandas(df, schema=RESULT_SCHEMA, preserve_index=False)
+
+    # Stage the partitions in a hidden directory of the dataset (ignored by readers), then swap
+    # each one in whole, so a killed write never leaves a partition deleted or half-written
+    staging = temp_path(os.path.join(root, 'partitions'))
+    try:
+        pq.write_to_dataset(
+            table,
+            root_path=staging,
+            partition_cols=PARTITION_COLS,
+            compression=compression,
+            write_statistics=True,
+        )
+        fsync = FSYNC_POLICY != 'none'
+        for factor, iq_var in df[PARTITION_COLS].drop_duplicates().itertuples(index=False):
+            partition = os.path.join(f'Factor={factor}', f'IQ_Var={iq_var}')
+            if fsync:
+                for name in os.listdir(os.path.join(staging, partition)):
+                    fsync_path(os.path.join(staging, partition, name))
+            replace_directory(os.path.join(staging, partition), os.path.join(root, partition), fsync)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def upsert_results(rows_df, root=RESULTS_DIR):
+    """Insert or replace individual result rows, rewriting only the partitions they touch."""
+    keys = ['Factor', 'IQ_Var', 'Age', 'Stratum', 'Quantile']
+    rows_df = rows_df.reindex(columns=rows_df.columns.union(keys, sort=False)).fillna({'Stratum': ALL_STRATA})
+    rows_df = rows_df.drop_duplicates(keys, keep='last')
+    partitions = rows_df[PARTITION_COLS].drop_duplicates()
+    existing = []
+    if os.path.isdir(root):
+        for factor, iq_var in partitions.itertuples(index=False):
+            existing.append(read_results(root, factors=[factor], iq_vars=[iq_var], quantiles='all'))
+    if existing:
+        existing_df = pd.concat(existing, ignore_index=True)
+        replaced = existing_df.set_index(keys).index.isin(rows_df.set_index(keys).index)
+        rows_df = pd.concat([existing_df[~replaced], rows_df], ignore_index=True)
+    write_results(rows_df, root)
+
+
+def clear_results(root=RESULTS_DIR):
+    """Remove the results dataset so that it can be rebuilt from scratch."""
+    if os.path.isdir(root):
+        shutil.rmtree(root)
+
+
+def read_results(root=RESULTS_DIR, factors=None, iq_vars=None, ages=None, columns=None, strata=None, quantiles=None):
+    """Read the results dataset, pushing factor/IQ/age predicates down to the Parquet reader.
+
+    For example ``read_results(ages=[24])`` only loads the age 24 rows and
+    ``read_results(factors=['chol', 'hdl', 'ldl', 'trig'])`` only opens the lipid partitions.
+    Every stratum is returned unless ``strata`` selects some (e.g. ``[ALL_STRATA]``). Only the mean
+    (OLS) models are returned unless ``quantiles`` lists the quantile regression models to read
+    instead (e.g. ``[0.5, 0.9]``), or is ``'all'`` for every model.
+    """
+    filters = []
+    if factors is not None:
+        filters.append(('Factor', 'in', list(factors)))
+    if iq_vars is not None:
+        filters.append(('IQ_Var', 'in', list(iq_vars)))
+    if ages is not None:
+        filters.append(('Age', 'in', [int(age) for age in ages]))
+
+    drop_columns = []
+    if columns is not None:
+        filtered = ['Stratum', 'Quantile'] if strata is not None else ['Quantile']
+        drop_columns = [column for column in filtered if column not in columns]
+        columns = list(columns) + drop_columns
+
+    # Read with the current schema: files written before a column was added get it as nulls
+    table = pq.read_table(root, schema=RESULT_SCHEMA, columns=columns, filters=filters or None,
+                          partitioning='hive')
+    df = table.to_pandas()
+    for col in PARTITION_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype(str)
+    if 'Stratum' in df.columns:
+        # Datasets written before the stratified models hold whole-cohort models only
+        df['Stratum'] = df['Stratum'].fillna(ALL_STRATA)
+        if strata is not None:
+            df = df[df['Stratum'].isin(list(strata))].reset_index(drop=True)
+    elif strata is not None and ALL_STRATA not in strata:
+        df = df.iloc[0:0]
+    if 'Quantile' in df.columns and quantiles != 'all':
+        selected = df['Quantile'].isna() if quantiles is None else df['Quantile'].round(6).isin(np.round(quantiles, 6))
+        df = df[selected].reset_index(drop=True)
+    elif quantiles not in (None, 'all'):
+        df = df.iloc[0:0]
+    return df.drop(columns=drop_columns)
+
+
+def significance_stars(p_value):
+    """Return the conventional significance stars for a p-value."""
+    return "***" if p_value < 0.001 else "**" if p_value < 0.01 else "*" if p_value < 0.05 else ""
+
+
+def check_inference(df, inference):
+    """Raise ValueError if the ``inference`` standard errors are missing for some results of ``df``."""
+    if df[SE_COLUMNS[inference]].isna().any():
+        raise ValueError(f"{inference} standard errors are missing for some results; "
+                         "run regression_engine.py (with --cluster for 'cluster') to compute them")
+
+
+def apply_inference(df, inference):
+    """Recompute the CIs and p-values of a results frame from the chosen standard errors."""
+    check_inference(df, inference)
+    se = df[SE_COLUMNS[inference]]
+    dof = (df['N_Clusters'] - 1 if inference == 'cluster' else df['DF']).astype(float)
+    t_crit = stats.t.ppf(0.975, dof)
+    df = df.copy()
+    df['CI_Lower'] = df['Coefficient'] - t_crit * se
+    df['CI_Upper'] = df['Coefficient'] + t_crit * se
+    df['P_value'] = 2 * stats.t.sf((df['Coefficient'] / se).abs(), dof)
+    return df
+
+
+def load_summary(root=RESULTS_DIR, inference=None, stratum=None, estimates=None, **filters):
+    """Load the results in the layout used by the analysis scripts (one row per estimated model).
+
+    CIs and p-values use the standard errors selected by ``inference`` (default: CFPWV_SE), and
+    the models are those of ``stratum`` (default: CFPWV_STRATUM, i.e. the whole cohort). The
+    empirical-Bayes shrunken estimates of the loaded cells are added as *_EB columns, and with
+    ``estimates`` = 'eb' (default: CFPWV_ESTIMATES) they replace the coefficients, CIs and p-values.
+    """
+    df = read_results(root, strata=[stratum or STRATUM], **filters)
+
+    # Remove rows with missing coefficients (NO_DATA cells)
+    df = df.dropna(subset=['Coefficient'])
+
+    inference = inference or INFERENCE
+    if inference != 'ols':
+        df = apply_inference(df, inference)
+
+    # Shrink every coefficient towards the factor x age grid of its exposure
+    df = df.join(shrink_estimates(df))
+    if (estimates or ESTIMATES) == 'eb':
+        df = df.assign(Coefficient=df['Coefficient_EB'], CI_Lower=df['CI_Lower_EB'], CI_Upper=df['CI_Upper_EB'],
+                       P_value=df['P_value_EB'])
+
+    summary_df = pd.DataFrame({
+        'Factor': df['Factor'],
+        'IQ_Var': df['IQ_Var'],
+        'Exposure': df['IQ_Var'].map(exposure_title),
+        'Risk Factor': df['Factor'].map(lambda factor: risk_factors.get(factor, factor)),
+        'Age': df['Age'].astype(int),
+        'Coefficient': df['Coefficient'],
+        'CI_Lower': df['CI_Lower'],
+        'CI_Upper': df['CI_Upper'],
+        'P-value_numeric': df['P_value'],
+        'R²': df['R2'],
+        'Sample Size': df['N'].astype(float),
+        'Coefficient_EB': df['Coefficient_EB'],
+        'CI_Lower_EB': df['CI_Lower_EB'],
+        'CI_Upper_EB': df['CI_Upper_EB'],
+        'Shrinkage': df['Shrinkage'],
+    })
+
+    summary_df['Significant'] = summary_df['P-value_numeric'] < 0.05
+    summary_df['Coefficient (95% CI)'] = [
+        f"{coef:.4f} ({lower:.4f} to {upper:.4f}){significance_stars(p)}"
+        for coef, lower, upper, p in zip(summary_df['Coefficient'], summary_df['CI_Lower'],
+                                         summary_df['CI_Upper'], summary_df['P-value_numeric'])
+    ]
+    summary_df['P-value'] = summary_df['P-value_numeric'].map(lambda p: f"{p:.4f}")
+
+    summary_df = summary_df.sort_values(['IQ_Var', 'Risk Factor', 'Age']).reset_index(drop=True)
+    return summary_df
+
+
+def compare_exposures(df, index, values):
+    """Lay the per-exposure results side by side, one ``<value>_<IQ_Var>`` column per exposure."""
+    values = [values] if isinstance(values, str) else list(values)
+    wide = df.pivot_table(index=index, columns='IQ_Var', values=values, aggfunc='first', observed=True)
+    wide.columns = [f'{value}_{iq_var}' for value, iq_var in wide.columns]
+    return wide.reset_index()
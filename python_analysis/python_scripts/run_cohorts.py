@@ -0,0 +1,168 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from factor_metadata import ALL_STRATA
+from output_sink import flush_outputs, write_csv, write_parquet
+from paths import COHORTS_DIR, check_cohort, cohort_root, data_file, docs_dir, figures_dir, tables_dir
+from results_store import INFERENCE, SE_COLUMNS, read_results
+
+# Cross-cohort outputs: the typed results of every shard (with a Cohort column) and their meta-analysis
+CROSS_COHORT_RESULTS_FILE = os.path.join(COHORTS_DIR, 'cross_cohort_results.parquet')
+CROSS_COHORT_SUMMARY_FILE = os.path.join(COHORTS_DIR, 'cross_cohort_summary.csv')
+
+# BLAS thread settings pinned to 1 in every shard (the shards are the parallelism) unless already set
+THREAD_SETTINGS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']
+
+# Models are pooled across cohorts by these keys
+MODEL_KEYS = ['Factor', 'IQ_Var', 'Age']
+
+
+def parse_cohort(spec):
+    """``NAME`` or ``NAME=EXTRACT`` -> (name, extract); the default extract is the cohort's data/<name>.dta."""
+    name, _, extract = spec.partition('=')
+    return check_cohort(name), extract or data_file(name)
+
+
+def shard_results_dir(cohort):
+    """Results dataset of a shard (results_store.RESULTS_DIR as seen by the shard)."""
+    return os.path.join(tables_dir(cohort), 'results')
+
+
+def shard_env(cohort, extract):
+    """Environment of a shard's processes: its cohort and extract, and one BLAS thread."""
+    env = {name: value for name, value in os.environ.items() if name != 'CFPWV_RESULTS_DIR'}
+    env['CFPWV_COHORT'] = cohort
+    env['CFPWV_COHORT_DATA'] = extract
+    for name in THREAD_SETTINGS:
+        env.setdefault(name, '1')
+    return env
+
+
+def run_shard(cohort, extract, engine_args=(), resume=False):
+    """Fit and report one cohort in its own namespace; returns (cohort, failed step or None, seconds).
+
+    The shard runs regression_engine.py, then the checkpointed reporting steps (run_pipeline.py),
+    as subprocesses with the shard's environment. Their output goes to run.log in the namespace.
+    With ``resume`` a shard whose results dataset exists is not re-fitted, and run_pipeline.py
+    skips the steps that are up to date.
+    """
+    for directory in (tables_dir(cohort), figures_dir(cohort), docs_dir(cohort)):
+        os.makedirs(directory, exist_ok=True)
+    steps = []
+    if not (resume and os.path.isdir(shard_results_dir(cohort))):
+        steps.append(['regression_engine.py'] + list(engine_args))
+    steps.append(['run_pipeline.py'] + (['--resume'] if resume else []))
+
+    env = shard_env(cohort, extract)
+    start = time.time()
+    with open(os.path.join(cohort_root(cohort), 'run.log'), 'a') as log:
+        for step in steps:
+            log.write(f"$ {' '.join(step)}\n")
+            log.flush()
+            result = subprocess.run([sys.executable] + step, env=env, stdout=log, stderr=subprocess.STDOUT)
+            if result.returncode != 0:
+                return cohort, step[0], time.time() - start
+    return cohort, None, time.time() - start
+
+
+def run_shards(cohorts, engine_args=(), resume=False, max_workers=None):
+    """Run every shard, ``max_workers`` at a time (default: one per core); returns the failed cohorts.
+
+    Each shard is a chain of subprocesses, so a thread per running shard is enough to keep
+    ``max_workers`` processes busy.
+    """
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        futures = [executor.submit(run_shard, cohort, extract, engine_args, resume)
+                   for cohort, extract in cohorts.items()]
+        for future in as_completed(futures):
+            cohort, step, seconds = future.result()
+            if step is None:
+                print(f"{cohort}: done in {seconds:.0f}s")
+            else:
+                print(f"{cohort}: {step} failed after {seconds:.0f}s; see {os.path.join(cohort_root(cohort), 'run.log')}")
+                failed.append(cohort)
+    return failed
+
+
+def cross_cohort_results(cohorts):
+    """Whole-cohort results of every shard from their results datasets, with a Cohort column."""
+    frames = []
+    for cohort in cohorts:
+        root = shard_results_dir(cohort)
+        if os.path.isdir(root):
+            frames.append(read_results(root, strata=[ALL_STRATA]).assign(Cohort=cohort))
+    if not frames:
+        raise FileNotFoundError(f"no shard results under {COHORTS_DIR}; run the shards first")
+    return pd.concat(frames, ignore_index=True)
+
+
+def meta_analyse(results_df, inference=None):
+    """Fixed-effect (inverse-variance) pooled IQ coefficient of every model across cohorts.
+
+    Heterogeneity between the cohorts is given by Cochran's Q (and its p-value) and I².
+    The standard errors are those selected by ``inference`` (default: CFPWV_SE).
+    """
+    se_column = SE_COLUMNS[inference or INFERENCE]
+    df = results_df.dropna(subset=['Coefficient', se_column])
+    df = df.assign(Weight=1 / df[se_column] ** 2, Weighted=df['Coefficient'] / df[se_column] ** 2)
+    grouped = df.groupby(MODEL_KEYS)
+    summary_df = grouped.agg(Cohorts=('Cohort', 'nunique'), N=('N', 'sum'),
+                             Weight=('Weight', 'sum'), Weighted=('Weighted', 'sum')).reset_index()
+    summary_df['Coefficient'] = summary_df['Weighted'] / summary_df['Weight']
+    summary_df['SE'] = 1 / np.sqrt(summary_df['Weight'])
+    summary_df['CI_Lower'] = summary_df['Coefficient'] - stats.norm.ppf(0.975) * summary_df['SE']
+    summary_df['CI_Upper'] = summary_df['Coefficient'] + stats.norm.ppf(0.975) * summary_df['SE']
+    summary_df['P_value'] = 2 * stats.norm.sf((summary_df['Coefficient'] / summary_df['SE']).abs())
+
+    pooled = df.merge(summary_df[MODEL_KEYS + ['Coefficient']], on=MODEL_KEYS, suffixes=('', '_Pooled'))
+    pooled['Q'] = pooled['Weight'] * (pooled['Coefficient'] - pooled['Coefficient_Pooled']) ** 2
+    summary_df = summary_df.merge(pooled.groupby(MODEL_KEYS)['Q'].sum().reset_index(), on=MODEL_KEYS)
+    dof = summary_df['Cohorts'] - 1
+    summary_df['P_value_Q'] = np.where(dof > 0, stats.chi2.sf(summary_df['Q'], dof.clip(lower=1)), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        summary_df['I2'] = np.where(summary_df['Q'] > 0, ((summary_df['Q'] - dof) / summary_df['Q']).clip(lower=0), 0.0)
+    summary_df.loc[dof == 0, 'I2'] = np.nan
+    return summary_df.drop(columns=['Weight', 'Weighted']).sort_values(MODEL_KEYS).reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Run the pipeline on several cohorts in parallel, then meta-analyse their results. '
+                    'Other arguments are passed to regression_engine.py in every shard.')
+    parser.add_argument('--cohort', action='append', required=True, metavar='NAME[=EXTRACT]',
+                        help=f'cohort to run, repeatable (default extract: {COHORTS_DIR}/NAME/data/NAME.dta)')
+    parser.add_argument('--workers', type=int, help='shards run at a time (default: one per core)')
+    parser.add_argument('--resume', action='store_true',
+                        help='keep the fits of shards that have results and resume their reporting steps')
+    parser.add_argument('--summary-only', action='store_true',
+                        help='only meta-analyse the results of the shards already run')
+    args, engine_args = parser.parse_known_args()
+
+    try:
+        cohorts = dict(parse_cohort(spec) for spec in args.cohort)
+    except ValueError as error:
+        parser.error(str(error))
+    failed = []
+    if not args.summary_only:
+        missing = [extract for extract in cohorts.values() if not os.path.exists(extract)]
+        if missing:
+            parser.error(f"extract not found: {', '.join(missing)}")
+        failed = run_shards(cohorts, engine_args, args.resume, args.workers)
+
+    results_df = cross_cohort_results(cohorts)
+    summary_df = meta_analyse(results_df)
+    write_parquet(results_df, CROSS_COHORT_RESULTS_FILE, index=False)
+    write_csv(summary_df, CROSS_COHORT_SUMMARY_FILE, index=False)
+    flush_outputs()
+    print(f"Pooled {len(summary_df)} models across {results_df['Cohort'].nunique()} cohorts: "
+          f"{CROSS_COHORT_SUMMARY_FILE} ({CROSS_COHORT_RESULTS_FILE})")
+    sys.exit(1 if failed else 0)
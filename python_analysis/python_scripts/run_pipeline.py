@@ -0,0 +1,75 @@
+import argparse
+import glob
+import os
+import subprocess
+import sys
+import time
+
+from checkpoint import LEDGER_FILE, OUTPUT_DIRS, Ledger, clean_partial, fingerprint, modified_since
+from paths import TABLES_DIR
+from render import OUTPUT_MODE
+from results_store import RESULTS_DIR
+
+# Steps 7-12 in order, each with the files it reads besides the results dataset
+STAGES = {
+    'age_specific_analysis.py': [],
+    'cross_age_trend_analysis.py': [f'{TABLES_DIR}/longitudinal_trends.csv'],
+    'exposure_plots.py': [],
+    'extended_analysis_cfpwv.py': [f'{TABLES_DIR}/estimate_correlations.csv'],
+    'additional_visualisations.py': [],
+    'dashboard.py': [],
+}
+
+# Code every stage runs (any change re-runs the stages) besides the stage script itself
+SHARED_INPUTS = sorted(glob.glob('*.py')) + ['../templates']
+
+
+def stage_inputs(script, extra_inputs):
+    """Digest of everything a stage's outputs depend on: data, code, templates and CFPWV_* settings."""
+    settings = {name: value for name, value in os.environ.items() if name.startswith('CFPWV_')}
+    return fingerprint([RESULTS_DIR] + extra_inputs + SHARED_INPUTS, {'script': script, 'settings': settings})
+
+
+def pipeline_stages():
+    """Stages of the current output mode (the dashboard only in html/both mode, as watch_logs.py)."""
+    return {script: inputs for script, inputs in STAGES.items()
+            if script != 'dashboard.py' or OUTPUT_MODE in ('html', 'both')}
+
+
+def run_pipeline(resume=False, ledger_path=LEDGER_FILE):
+    """Run every stage, recording each one in the ledger as soon as it succeeds; returns the failed stage or None.
+
+    With ``resume`` the interrupted writes (of the results dataset too) are cleaned up first, and
+    stages that completed on the same inputs with their outputs intact are skipped. Otherwise the
+    ledger is reset and everything is re-run.
+    """
+    ledger = Ledger(ledger_path)
+    if resume:
+        for path in clean_partial(OUTPUT_DIRS + [RESULTS_DIR]):
+            print(f"  removed partial file {path}")
+    else:
+        ledger.reset()
+    for script, extra_inputs in pipeline_stages().items():
+        inputs = stage_inputs(script, extra_inputs)
+        if resume and ledger.completed(script, inputs):
+            print(f"{script}: up to date, skipped")
+            continue
+        print(f"{script}: running")
+        start = time.time_ns()
+        result = subprocess.run([sys.executable, script])
+        if result.returncode != 0:
+            print(f"{script} failed with exit code {result.returncode}; fix it and re-run with --resume")
+            return script
+        ledger.record(script, inputs, modified_since(start))
+    return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the analysis and reporting steps (7-12) with checkpoints.')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the steps that already completed on the same inputs and clean up partial files')
+    parser.add_argument('--ledger', default=LEDGER_FILE, help='checkpoint ledger (default: %(default)s)')
+    args = parser.parse_args()
+
+    failed = run_pipeline(args.resume, args.ledger)
+    sys.exit(1 if failed else 0)
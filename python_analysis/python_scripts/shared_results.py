@@ -0,0 +1,193 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# Layout of a shared results block:
+#   [8-byte little-endian header length][JSON schema header][padding][column 0][padding][column 1]...
+# Every column is a fixed-width numpy array; string columns are stored as int32 category
+# codes with their categories listed in the header.
+HEADER_LEN = struct.Struct('<Q')
+ALIGNMENT = 64
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class SharedResults:
+    """Typed results columns held in shared memory (or a memory-mapped file) for worker processes.
+
+    The creating process calls ``SharedResults.create(df)`` and hands ``handle`` to the
+    workers; each worker calls ``SharedResults.attach(handle)`` once and then reads the
+    columns as zero-copy numpy views, so only slice indices need to be sent per task.
+    """
+
+    def __init__(self, buffer, mapping, path=None):
+        self._buffer = buffer
+        self._mapping = mapping
+        self._path = path
+        (length,) = HEADER_LEN.unpack_from(buffer, 0)
+        self.header = json.loads(bytes(buffer[HEADER_LEN.size:HEADER_LEN.size + length]))
+        self.nrows = self.header['nrows']
+        data_start = _align(HEADER_LEN.size + length)
+        self.columns = {}
+        for col in self.header['columns']:
+            self.columns[col['name']] = np.ndarray(
+                (self.nrows,), dtype=np.dtype(col['dtype']), buffer=buffer,
+                offset=data_start + col['offset']
+            )
+
+    @property
+    def handle(self):
+        """Picklable reference that workers pass to ``attach``."""
+        if self._path is not None:
+            return ('mmap', self._path)
+        return ('shm', self._mapping.name)
+
+    @staticmethod
+    def _encode(df):
+        """Convert the frame to fixed-width arrays and build the schema header."""
+        arrays = {}
+        header = {'nrows': len(df), 'columns': [], 'categories': {}}
+        offset = 0
+        for name in df.columns:
+            values = df[name]
+            if values.dtype == object or isinstance(values.dtype, (pd.CategoricalDtype, pd.StringDtype)):
+                codes, categories = pd.factorize(values.astype(str), sort=True)
+                array = codes.astype(np.int32)
+                header['categories'][name] = [str(category) for category in categories]
+            elif values.dtype == bool:
+                array = values.to_numpy(dtype=np.bool_)
+            else:
+                array = values.to_numpy(dtype=np.float64, na_value=np.nan)
+            arrays[name] = array
+            # Column offsets are relative to the (aligned) end of the header
+            header['columns'].append({'name': str(name), 'dtype': array.dtype.str, 'offset': offset})
+            offset = _align(offset + array.nbytes)
+
+        header_bytes = json.dumps(header).encode()
+        data_start = _align(HEADER_LEN.size + len(header_bytes))
+        return arrays, header_bytes, data_start, data_start + offset
+
+    @staticmethod
+    def _write(buffer, arrays, header_bytes, data_start):
+        HEADER_LEN.pack_into(buffer, 0, len(header_bytes))
+        buffer[HEADER_LEN.size:HEADER_LEN.size + len(header_bytes)] = header_bytes
+        for col in json.loads(header_bytes)['columns']:
+            array = arrays[col['name']]
+            target = np.ndarray(array.shape, dtype=array.dtype, buffer=buffer,
+                                offset=data_start + col['offset'])
+            target[:] = array
+
+    @classmethod
+    def create(cls, df, path=None):
+        """Pack the frame into a new shared-memory block, or into a memory-mapped file at ``path``."""
+        arrays, header_bytes, data_start, size = cls._encode(df.reset_index(drop=True))
+        if path is None:
+            shm = shared_memory.SharedMemory(create=True, size=size)
+            cls._write(shm.buf, arrays, header_bytes, data_start)
+            return cls(shm.buf, shm)
+
+        with open(path, 'wb') as f:
+            f.truncate(size)
+        with open(path, 'r+b') as f:
+            mapped = mmap.mmap(f.fileno(), size)
+        cls._write(mapped, arrays, header_bytes, data_start)
+        mapped.flush()
+        return cls(mapped, mapped, path=path)
+
+    @classmethod
+    def attach(cls, handle):
+        """Attach to a block created by another process without copying the columns."""
+        kind, name = handle
+        if kind == 'mmap':
+            with open(name, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return cls(mapped, mapped, path=name)
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            shm = shared_memory.SharedMemory(name=name)
+        return cls(shm.buf, shm)
+
+    def column(self, name, rows=None):
+        """Return a column (or a slice of it), decoding category codes back to strings."""
+        values = self.columns[name] if rows is None else self.columns[name][rows]
+        categories = self.header['categories'].get(name)
+        if categories is not None:
+            return np.asarray(categories, dtype=object)[values]
+        return values
+
+    def frame(self, rows=None, columns=None):
+        """Materialise the requested rows as a DataFrame (only the slice is copied)."""
+        names = columns if columns is not None else list(self.columns)
+        return pd.DataFrame({name: self.column(name, rows) for name in names})
+
+    def close(self):
+        """Drop the numpy views and close this process's mapping."""
+        self.columns = {}
+        self._buffer = None
+        self._mapping.close()
+
+    def unlink(self):
+        """Free the block (creating process only)."""
+        if self._path is not None:
+            os.remove(self._path)
+        else:
+            self._mapping.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        self.unlink()
+
+
+def group_slices(df, by):
+    """Sort the frame by ``by`` and return it with ``{key: slice(start, stop)}`` for each group."""
+    by = [by] if isinstance(by, str) else list(by)
+    sorted_df = df.sort_values(by, kind='stable').reset_index(drop=True)
+    slices = {}
+    for key, index in sorted_df.groupby(by, sort=False).indices.items():
+        # Plain Python keys keep the task payload small and readable
+        key = tuple(k.item() if isinstance(k, np.generic) else k for k in key) if isinstance(key, tuple) \
+            else (key.item() if isinstance(key, np.generic) else key)
+        slices[key] = slice(int(index[0]), int(index[-1]) + 1)
+    return sorted_df, slices
+
+
+# Worker-side state: each worker process attaches once and reuses the views for every task
+_worker_results = None
+
+
+def _attach_worker(handle):
+    global _worker_results
+    _worker_results = SharedResults.attach(handle)
+
+
+def _run_task(func, key, rows):
+    return key, func(_worker_results, key, rows)
+
+
+def map_slices(func, shared, slices, max_workers=None):
+    """Run ``func(shared_results, key, rows)`` for every slice in a process pool.
+
+    Only the key and the slice are pickled per task; the workers read the rows
+    directly from the shared block. ``func`` must be a module-level function.
+    """
+    results = {}
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach_worker,
+                             initargs=(shared.handle,)) as executor:
+        futures = [executor.submit(_run_task, func, key, rows) for key, rows in slices.items()]
+        for future in futures:
+            key, value = future.result()
+            results[key] = value
+    return results
@@ -0,0 +1,154 @@
+import os
+import re
+
+import pandas as pd
+
+from paths import LOG_DIR
+
+# Lines of a js_cfpwv.do regression block that carry the numbers we keep
+CREATED_RE = re.compile(r'^z_(?P<var>\w+?)_(?P<age>\d+) created(?: with (?P<missing>[\d,]+) missing values)?')
+REGRESS_RE = re.compile(r'^Regression on: \[regress z_(?P<var>\w+?)_(?P<age>\d+) z_(?P<iq>\w+) ')
+NOBS_RE = re.compile(r'Number of obs\s*=\s*(?P<n>[\d,]+)')
+ADJ_R2_RE = re.compile(r'Adj R-squared\s*=\s*(?P<r2>-?[\d.]+)')
+SUMMARY_RE = re.compile(r'^Regression results summary:.*?z_IQ_at:\s*(?P<iq>\S+)\s*,\s*Exposure:\s*\S*?\((?P<factor>\w+)\)'
+                        r'\s*,\s*Age:\s*(?P<age>\d+)')
+NUMBER = r'(-?(?:\d+)?\.?\d+(?:e[-+]?\d+)?)'
+
+
+def iq_var_name(value):
+    """Map the do-file's z_IQ_at value (e.g. '8') to the IQ variable name (e.g. 'total_iq_8')."""
+    return f'total_iq_{value}' if value.isdigit() else value
+
+
+def coefficient_row(line, iq_var):
+    """Parse the exposure row of the regress table: coefficient, se, t, p, lower and upper CI."""
+    match = re.match(rf'^\s*z_{re.escape(iq_var)}\s*\|' + r'\s+'.join([''] + [NUMBER] * 6), line)
+    if match is None:
+        return None
+    return [float(value) for value in match.groups()]
+
+
+class RegressionBlockParser:
+    """Incrementally parse js_cfpwv.do log lines into one result row per completed regression.
+
+    A block is complete once its "Regression results summary" line has been read,
+    so rows can be emitted while Stata is still writing the rest of the log.
+    """
+
+    def __init__(self):
+        self.missing = {}
+        self._reset()
+
+    def _reset(self):
+        self.current = {}
+
+    def feed(self, line):
+        """Consume one log line, returning a completed result row or None."""
+        line = line.rstrip('\r\n')
+
+        match = CREATED_RE.match(line)
+        if match:
+            missing = match.group('missing')
+            self.missing[(match.group('var'), int(match.group('age')))] = int(missing.replace(',', '')) if missing else 0
+            return None
+
+        match = REGRESS_RE.match(line)
+        if match:
+            self.current = {'var': match.group('var'), 'age': int(match.group('age')), 'iq': match.group('iq')}
+            return None
+        if not self.current:
+            return None
+
+        match = NOBS_RE.search(line)
+        if match:
+            self.current['N'] = int(match.group('n').replace(',', ''))
+        match = ADJ_R2_RE.search(line)
+        if match:
+            self.current['R2'] = float(match.group('r2'))
+        if 'coef' not in self.current:
+            values = coefficient_row(line, self.current['iq'])
+            if values is not None:
+                self.current['coef'] = values
+
+        match = SUMMARY_RE.match(line)
+        if match:
+            block = self.current
+            self._reset()
+            if 'coef' not in block:
+                return None
+            coef, se, _, p_value, ci_lower, ci_upper = block['coef']
+            return {
+                'Factor': match.group('factor'),
+                'IQ_Var': iq_var_name(match.group('iq')),
+                'Age': int(match.group('age')),
+                'Coefficient': coef,
+                'CI_Lower': ci_lower,
+                'CI_Upper': ci_upper,
+                'P_value': p_value,
+                'R2': block.get('R2'),
+                'N': block.get('N'),
+                'Missing': self.missing.get((block['var'], block['age'])),
+                'SE': se,
+            }
+        return None
+
+
+def parse_log(path):
+    """Parse a complete Stata log file into a DataFrame of result rows."""
+    parser = RegressionBlockParser()
+    rows = []
+    with open(path, 'r', errors='replace') as f:
+        for line in f:
+            row = parser.feed(line)
+            if row is not None:
+                rows.append(row)
+    return pd.DataFrame(rows)
+
+
+class LogFollower:
+    """Follow a log file that is still being written, parsing only the newly appended lines."""
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.partial = b''
+        self.parser = RegressionBlockParser()
+
+    def poll(self):
+        """Return the result rows of the regression blocks completed since the last poll."""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return []
+        if size < self.offset:
+            # `log using ..., replace` truncated the file: start over
+            self.offset = 0
+            self.partial = b''
+            self.parser = RegressionBlockParser()
+        if size == self.offset:
+            return []
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            chunk = f.read(size - self.offset)
+        self.offset = size
+
+        lines = (self.partial + chunk).split(b'\n')
+        # The last element is an incomplete line (or b'') that is kept for the next poll
+        self.partial = lines.pop()
+        rows = []
+        for line in lines:
+            row = self.parser.feed(line.decode('utf-8', errors='replace'))
+            if row is not None:
+                rows.append(row)
+        return rows
+
+
+if __name__ == '__main__':
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description='Parse js_cfpwv.do log files into result rows.')
+    parser.add_argument('logs', nargs='*', default=sorted(glob.glob(f'{LOG_DIR}/*.log')))
+    args = parser.parse_args()
+    print(pd.concat([parse_log(path) for path in args.logs], ignore_index=True).to_string())
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_allclose
+from scipy import stats
+
+from category_pooling import ACROSS_WAVE_CORRELATION, SAME_WAVE_CORRELATION, pool_categories
+
+Z_95 = stats.norm.ppf(0.975)
+
+
+def summary(seed=0):
+    """Lipid coefficients in childhood (two ages, so a mix of same- and across-wave pairs) and a lone BMI one."""
+    rng = np.random.default_rng(seed)
+    cells = [('chol', 9), ('chol', 11), ('hdl', 9), ('hdl', 11), ('trig', 11), ('bmi', 9)]
+    coef = rng.normal(0.05, 0.05, size=len(cells))
+    se = rng.uniform(0.02, 0.05, size=len(cells))
+    return pd.DataFrame({'IQ_Var': 'iq8', 'Factor': [factor for factor, _ in cells], 'Age': [age for _, age in cells],
+                         'Coefficient': coef, 'CI_Lower': coef - Z_95 * se, 'CI_Upper': coef + Z_95 * se})
+
+
+def gls(b, se, R):
+    V = R * np.outer(se, se)
+    V_inv = np.linalg.inv(V)
+    ones = np.ones(len(b))
+    information = ones @ V_inv @ ones
+    theta = ones @ V_inv @ b / information
+    return theta, 1 / np.sqrt(information), (b - theta) @ V_inv @ (b - theta)
+
+
+def test_pool_categories_matches_gls():
+    summary_df = summary()
+    correlations = pd.DataFrame({'Factor_A': ['chol'], 'Age_A': [9], 'Factor_B': ['hdl'], 'Age_B': [9],
+                                 'Estimate_Correlation': [0.6]})
+    for estimated in (None, correlations):
+        pooled = pool_categories(summary_df, estimated).set_index('Risk_Category')
+
+        lipids = summary_df[summary_df['Factor'] != 'bmi']
+        ages = lipids['Age'].to_numpy()
+        R = np.where(ages[:, None] == ages[None, :], SAME_WAVE_CORRELATION, ACROSS_WAVE_CORRELATION)
+        np.fill_diagonal(R, 1)
+        if estimated is not None:
+            R[0, 2] = R[2, 0] = 0.6
+        se = (lipids['CI_Upper'] - lipids['CI_Lower']).to_numpy() / (2 * Z_95)
+        theta, theta_se, q = gls(lipids['Coefficient'].to_numpy(), se, R)
+
+        row = pooled.loc['Lipid Profile']
+        assert_allclose([row['Pooled_Coefficient'], row['Pooled_SE'], row['Q']], [theta, theta_se, q], rtol=1e-10)
+        assert row['Number_of_Measurements'] == len(lipids)
+        assert_allclose(row['I2'], max(q - (len(lipids) - 1), 0) / q * 100, rtol=1e-10)
+
+        lone = pooled.loc['Anthropometric']
+        bmi = summary_df[summary_df['Factor'] == 'bmi'].iloc[0]
+        assert_allclose(lone['Pooled_Coefficient'], bmi['Coefficient'], rtol=1e-12)
+        assert_allclose(lone['Pooled_SE'], (bmi['CI_Upper'] - bmi['CI_Lower']) / (2 * Z_95), rtol=1e-12)
+        assert np.isnan(lone['Q'])
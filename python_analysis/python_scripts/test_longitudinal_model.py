@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+from numpy.testing import assert_allclose
+from scipy import optimize
+
+from longitudinal_model import ProfiledREML, mixed_design
+
+
+def simulated(participants=60, waves=(9, 11, 13, 15), seed=0):
+    """Long data with a random intercept and age slope per participant, some visits missing."""
+    rng = np.random.default_rng(seed)
+    ids = np.repeat(np.arange(participants), len(waves))
+    wave = np.tile(waves, participants)
+    z_iq = rng.normal(size=participants)[ids]
+    time = wave + rng.uniform(-0.5, 0.5, size=len(ids)) - 9
+    intercept, slope = rng.normal(size=(2, participants)) * [[0.8], [0.15]]
+    y = (0.2 * z_iq + 0.05 * time - 0.02 * z_iq * time + intercept[ids] + slope[ids] * time
+         + rng.normal(scale=0.5, size=len(ids)))
+    long_df = pd.DataFrame({'id': ids, 'wave': wave, 'time': time, 'y': y, 'z_iq': z_iq,
+                            'sex': rng.integers(1, 3, size=participants)[ids],
+                            'ses': rng.integers(1, 4, size=participants)[ids]})
+    return long_df.sample(frac=0.85, random_state=seed).sort_values(['id', 'wave'], ignore_index=True)
+
+
+def dense_deviance(X, Z, y, L):
+    """REML deviance profiled over beta and s2, with the dense marginal covariance ``s2 (Z Lam Lam' Z' + I)``
+    and the per-participant factor ``L`` of ``Lam``."""
+    n, p = X.shape
+    Lam = np.kron(np.eye(Z.shape[1] // len(L)), L)
+    ZLam = Z.toarray() @ Lam
+    H = ZLam @ ZLam.T + np.eye(n)
+    H_inv_X = np.linalg.solve(H, X)
+    beta = np.linalg.solve(X.T @ H_inv_X, H_inv_X.T @ y)
+    r = y - X @ beta
+    dof = n - p
+    deviance = (np.linalg.slogdet(H)[1] + np.linalg.slogdet(X.T @ H_inv_X)[1]
+                + dof * (1 + np.log(2 * np.pi * (r @ np.linalg.solve(H, r)) / dof)))
+    return deviance, beta
+
+
+@pytest.mark.parametrize('random_slope', [True, False])
+def test_deviance_matches_dense_reml(random_slope):
+    long_df = simulated()
+    X, Z, n_re = mixed_design(long_df, random_slope)
+    y = long_df['y'].to_numpy()
+    model = ProfiledREML(X, Z, y, n_re)
+    rng = np.random.default_rng(1)
+    for theta in [np.full(len(model.tril[0]), 0.5), np.abs(rng.normal(size=len(model.tril[0]))),
+                  np.where(model.diagonal, 0.0, 0.3)]:
+        deviance, beta = dense_deviance(X, Z, y, model.relative_factor(theta))
+        assert_allclose(model.deviance(theta), deviance, rtol=1e-10)
+        assert_allclose(model.solve(theta)['beta'], beta, rtol=1e-8, atol=1e-10)
+
+
+def test_fit_reaches_dense_reml_optimum():
+    long_df = simulated(seed=2)
+    X, Z, n_re = mixed_design(long_df)
+    y = long_df['y'].to_numpy()
+    model = ProfiledREML(X, Z, y, n_re)
+    fit = model.fit()
+    bounds = [(0, None) if diagonal else (None, None) for diagonal in model.diagonal]
+    reference = optimize.minimize(lambda theta: dense_deviance(X, Z, y, model.relative_factor(theta))[0],
+                                  np.eye(n_re)[model.tril], method='L-BFGS-B', bounds=bounds,
+                                  options={'ftol': 1e-14, 'gtol': 1e-8})
+    assert fit['converged']
+    assert fit['deviance'] <= reference.fun + 1e-6
+    assert_allclose(fit['beta'], dense_deviance(X, Z, y, model.relative_factor(reference.x))[1], atol=1e-4)
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_allclose
+from scipy import stats
+
+from multiple_imputation import pool_rubin
+
+
+def imputed_results(m=5, seed=0):
+    """Per-imputation results of two models, one row per model and imputation."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for factor, age, coef in [('bmi', 9, 0.1), ('cfpwv', 17, -0.05)]:
+        for imputation in range(m):
+            se = rng.uniform(0.02, 0.04)
+            rows.append({'Factor': factor, 'IQ_Var': 'iq8', 'Age': age, 'Imputation': imputation,
+                         'Coefficient': coef + rng.normal(scale=0.02), 'SE': se, 'SE_HC1': 1.1 * se,
+                         'SE_HC3': 1.2 * se, 'SE_Cluster': 1.3 * se, 'R2': rng.uniform(0.05, 0.1),
+                         'N': 800, 'DF': 792, 'N_Clusters': 40})
+    return pd.DataFrame(rows)
+
+
+def test_pool_rubin_matches_rubins_rules():
+    results_df = imputed_results()
+    pooled = pool_rubin(results_df).set_index(['Factor', 'Age'])
+    for (factor, age), draws in results_df.groupby(['Factor', 'Age']):
+        m = len(draws)
+        estimate = draws['Coefficient'].mean()
+        between = draws['Coefficient'].var(ddof=1)
+        total = (draws['SE'] ** 2).mean() + (1 + 1 / m) * between
+        # Barnard and Rubin (1999) degrees of freedom
+        lam = (1 + 1 / m) * between / total
+        df_com = draws['DF'].iloc[0]
+        df_observed = (df_com + 1) / (df_com + 3) * df_com * (1 - lam)
+        dof = 1 / (lam ** 2 / (m - 1) + 1 / df_observed)
+        t_crit = stats.t.ppf(0.975, dof)
+
+        row = pooled.loc[(factor, age)]
+        assert_allclose(row['Coefficient'], estimate, rtol=1e-12)
+        assert_allclose(row['SE'], np.sqrt(total), rtol=1e-12)
+        assert_allclose(row['SE_Cluster'], np.sqrt((draws['SE_Cluster'] ** 2).mean() + (1 + 1 / m) * between),
+                        rtol=1e-12)
+        assert_allclose([row['CI_Lower'], row['CI_Upper']], estimate + np.array([-1, 1]) * t_crit * np.sqrt(total),
+                        rtol=1e-12)
+        assert_allclose(row['P_value'], 2 * stats.t.sf(abs(estimate) / np.sqrt(total), dof), rtol=1e-10)
+        assert row['DF'] == round(dof)
+        assert_allclose(row['FMI'], (lam + 2 / (dof + 3)) / (1 + 2 / (dof + 3)), rtol=1e-12)
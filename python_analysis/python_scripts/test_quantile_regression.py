@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+from scipy import optimize
+
+from quantile_regression import check_loss, fit_quantiles, frisch_newton
+
+
+def simulated(n=500, p=4, k=2, seed=0):
+    """IQ first and a constant last (as design_matrix), skewed heteroskedastic outcomes."""
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([rng.normal(size=(n, p - 1)), np.ones(n)])
+    Y = X @ rng.normal(size=(p, k)) + rng.standard_exponential(size=(n, k)) * (1 + 0.5 * np.abs(X[:, :1]))
+    return X, Y
+
+
+def linprog_quantile(X, y, tau):
+    """Reference fit: min tau 1'u + (1 - tau) 1'v subject to X b + u - v = y, u, v >= 0."""
+    n, p = X.shape
+    c = np.concatenate([np.zeros(p), np.full(n, tau), np.full(n, 1 - tau)])
+    A = np.hstack([X, np.eye(n), -np.eye(n)])
+    bounds = [(None, None)] * p + [(0, None)] * (2 * n)
+    result = optimize.linprog(c, A_eq=A, b_eq=y, bounds=bounds, method='highs')
+    assert result.status == 0
+    return result.x[:p]
+
+
+@pytest.mark.parametrize('tau', [0.1, 0.5, 0.9])
+def test_frisch_newton_matches_linear_program(tau):
+    X, Y = simulated()
+    coef, _ = frisch_newton(np.broadcast_to(X, (Y.shape[1],) + X.shape), Y.T, tau)
+    for j in range(Y.shape[1]):
+        reference = linprog_quantile(X, Y[:, j], tau)
+        assert_allclose(coef[j], reference, atol=1e-6)
+        assert_allclose(check_loss(Y[:, j] - X @ coef[j], tau), check_loss(Y[:, j] - X @ reference, tau),
+                        rtol=1e-9)
+
+
+def test_warm_started_quantiles_match_linear_program():
+    X, Y = simulated(seed=1)
+    quantiles = [0.25, 0.5, 0.75]
+    coef, _, _, _ = fit_quantiles(X, Y, quantiles)
+    for i, tau in enumerate(quantiles):
+        for j in range(Y.shape[1]):
+            assert_allclose(coef[i, j], linprog_quantile(X, Y[:, j], tau)[0], atol=1e-6)
@@ -0,0 +1,76 @@
+import numpy as np
+from numpy.testing import assert_allclose
+
+from regression_engine import fit_batch, influence_batch
+
+
+def simulated(n=80, p=4, k=3, seed=0):
+    """Design with a constant last (as design_matrix), heteroskedastic outcomes and 16 clusters."""
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([rng.normal(size=(n, p - 1)), np.ones(n)])
+    Y = X @ rng.normal(size=(p, k)) + rng.normal(size=(n, k)) * (1 + np.abs(X[:, :1]))
+    clusters = rng.integers(0, 16, size=n)
+    return X, Y, clusters
+
+
+def sandwich(X, meat):
+    bread = np.linalg.inv(X.T @ X)
+    return bread @ meat @ bread
+
+
+def test_fit_batch_matches_per_outcome_formulas():
+    X, Y, clusters = simulated()
+    n, p = X.shape
+    fit = fit_batch(X, Y, clusters=clusters)
+    leverage = np.diag(X @ np.linalg.inv(X.T @ X) @ X.T)
+    groups = np.unique(clusters)
+    for j in range(Y.shape[1]):
+        b = np.linalg.lstsq(X, Y[:, j], rcond=None)[0]
+        e = Y[:, j] - X @ b
+        s2 = e @ e / (n - p)
+        ols = s2 * np.linalg.inv(X.T @ X)
+        hc1 = sandwich(X, X.T @ (X * e[:, None] ** 2)) * n / (n - p)
+        hc3 = sandwich(X, X.T @ (X * (e / (1 - leverage))[:, None] ** 2))
+        scores = np.array([X[clusters == g].T @ e[clusters == g] for g in groups])
+        cluster = sandwich(X, scores.T @ scores) * len(groups) / (len(groups) - 1) * (n - 1) / (n - p)
+
+        assert_allclose(fit['coef'][:, j], b, rtol=1e-10)
+        assert_allclose(fit['sigma2'][j], s2, rtol=1e-10)
+        assert_allclose(fit['se'][:, j], np.sqrt(np.diag(ols)), rtol=1e-10)
+        assert_allclose(fit['se_hc1'][:, j], np.sqrt(np.diag(hc1)), rtol=1e-10)
+        assert_allclose(fit['se_hc3'][:, j], np.sqrt(np.diag(hc3)), rtol=1e-10)
+        assert_allclose(fit['se_cluster'][:, j], np.sqrt(np.diag(cluster)), rtol=1e-10)
+    assert fit['n_clusters'] == len(groups)
+
+
+def test_fit_batch_weighted_matches_pweight_sandwich():
+    X, Y, _ = simulated(seed=1)
+    n, p = X.shape
+    w = np.random.default_rng(1).uniform(0.5, 3, size=n)
+    fit = fit_batch(X, Y, weights=w)
+    bread = np.linalg.inv(X.T @ (X * w[:, None]))
+    for j in range(Y.shape[1]):
+        b = bread @ X.T @ (w * Y[:, j])
+        e = Y[:, j] - X @ b
+        hc1 = bread @ (X.T @ (X * (w * e)[:, None] ** 2)) @ bread * n / (n - p)
+        assert_allclose(fit['coef'][:, j], b, rtol=1e-10)
+        assert_allclose(fit['se_hc1'][:, j], np.sqrt(np.diag(hc1)), rtol=1e-10)
+
+
+def test_influence_batch_matches_refits_without_each_observation():
+    X, Y, _ = simulated(n=40, seed=2)
+    n, p = X.shape
+    influence = influence_batch(X, Y)
+    b = np.linalg.lstsq(X, Y, rcond=None)[0]
+    s2 = ((Y - X @ b) ** 2).sum(axis=0) / (n - p)
+    xtx_inv_00 = np.linalg.inv(X.T @ X)[0, 0]
+    for i in range(n):
+        keep = np.arange(n) != i
+        b_i = np.linalg.lstsq(X[keep], Y[keep], rcond=None)[0]
+        s2_i = ((Y[keep] - X[keep] @ b_i) ** 2).sum(axis=0) / (n - 1 - p)
+        cooks_d = np.einsum('pk,pq,qk->k', b - b_i, X.T @ X, b - b_i) / (p * s2)
+
+        assert_allclose(influence['loo_coef'][i], b_i[0], rtol=1e-9)
+        assert_allclose(influence['dfbeta'][i], b[0] - b_i[0], rtol=1e-8, atol=1e-12)
+        assert_allclose(influence['dfbetas'][i], (b[0] - b_i[0]) / np.sqrt(s2_i * xtx_inv_00), rtol=1e-8, atol=1e-12)
+        assert_allclose(influence['cooks_d'][i], cooks_d, rtol=1e-8)
@@ -0,0 +1,225 @@
+import argparse
+import os
+from itertools import combinations_with_replacement
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from cohort_data import COHORT_FILE, load_cohort
+from factor_metadata import DEFAULT_IQ_VAR, exposure_suffix, exposure_title, outcome_ages, risk_factors
+from output_sink import flush_outputs, write_csv
+from paths import FIGURES_DIR, TABLES_DIR
+from regression_engine import FACTOR_COVARIATES, indicator_columns
+from render import figure_selected, finalise_layout, save_figure
+
+# Fit statistics of every candidate model, and the IQ association along age under the best one
+TRAJECTORY_MODELS_FILE = f'{TABLES_DIR}/trajectory_models.csv'
+TRAJECTORY_CURVES_FILE = f'{TABLES_DIR}/trajectory_curves.csv'
+
+# Fractional polynomial powers (0 is log), candidate breakpoints (years) and ages the curves are evaluated at
+FP_POWERS = (-2, -1, -0.5, 0, 0.5, 1, 2, 3)
+BREAKPOINT_STEP = 0.5
+CURVE_STEP = 0.25
+
+
+def fp_term(age, power):
+    """Fractional polynomial term ``age**power`` (``log(age)`` for power 0)."""
+    return np.log(age) if power == 0 else age ** power
+
+
+def natural_spline_basis(age, knots):
+    """Non-constant columns of the natural cubic spline with ``knots`` (truncated power form)."""
+    def d(k):
+        return (np.clip(age - knots[k], 0, None) ** 3 - np.clip(age - knots[-1], 0, None) ** 3) / (knots[-1] - knots[k])
+    return np.column_stack([age] + [d(k) - d(len(knots) - 2) for k in range(len(knots) - 2)])
+
+
+def candidate_models(waves, knots):
+    """Every candidate age trajectory for a set of measurement waves.
+
+    Returns ``{(model, spec): (basis, extra_df)}`` where ``basis(age)`` gives the non-constant
+    columns and ``extra_df`` counts the parameters chosen by search (breakpoint, FP powers).
+    With W waves only bases of at most W - 1 columns are identifiable.
+    """
+    models = {('linear', ''): (lambda age: age[:, None], 0)}
+    max_columns = len(waves) - 1
+    if max_columns >= 2:
+        models[('natural_spline', 'knots=' + ' '.join(f'{knot:.1f}' for knot in knots))] = (
+            lambda age: natural_spline_basis(age, knots), 0)
+        for breakpoint in np.arange(min(waves) + 1, max(waves), BREAKPOINT_STEP):
+            models[('piecewise', f'break={breakpoint:g}')] = (
+                lambda age, c=breakpoint: np.column_stack([age, np.clip(age - c, 0, None)]), 1)
+    for power in FP_POWERS:
+        models[('fp1', f'p={power:g}')] = (lambda age, p=power: fp_term(age, p)[:, None], 1)
+    if max_columns >= 2:
+        for p1, p2 in combinations_with_replacement(FP_POWERS, 2):
+            # Repeated powers use age**p and age**p * log(age)
+            models[('fp2', f'p={p1:g},{p2:g}')] = (
+                lambda age, p1=p1, p2=p2: np.column_stack(
+                    [fp_term(age, p1), fp_term(age, p2) * (np.log(age) if p1 == p2 else 1)]), 2)
+    return models
+
+
+def wave_grid(cohort, waves, factors, iq_var_list):
+    """Participants x waves grid shared by every factor measured at ``waves``.
+
+    ``age`` is the age at the clinic in years (the nominal wave age when it was not recorded);
+    factor columns hold the z-scored outcome of that wave (NaN if not measured).
+    """
+    frames = []
+    for wave in waves:
+        frames.append(pd.DataFrame({
+            'id': cohort.index,
+            'wave': wave,
+            'age': (cohort[f'age_{wave}'] / 12).fillna(wave),
+            **{covariate: cohort[covariate] for covariate in FACTOR_COVARIATES},
+            **{iq_var: cohort[f'z_{iq_var}'] for iq_var in iq_var_list},
+            **{factor: cohort[f'z_{factor}_{wave}'] for factor in factors},
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def trajectory_design(basis, z_iq, covariates):
+    """Constant, age basis, IQ, IQ x age basis, then the covariate indicators."""
+    return np.column_stack([np.ones(len(z_iq)), basis, z_iq, z_iq[:, None] * basis] + covariates)
+
+
+def residual_ss(X, Y):
+    """Residual sums of squares of every column of ``Y`` on ``X`` from one QR factorisation."""
+    Q, _ = np.linalg.qr(X)
+    return (Y ** 2).sum(axis=0) - ((Q.T @ Y) ** 2).sum(axis=0)
+
+
+def iq_trajectory(X, y, ids, basis_columns, curve_basis):
+    """IQ association along age and its participant-clustered 95% CI for one outcome."""
+    XtX_inv = np.linalg.inv(X.T @ X)
+    beta = XtX_inv @ X.T @ y
+    scores = pd.DataFrame(X * (y - X @ beta)[:, None]).groupby(ids).sum().to_numpy()
+    n, p = X.shape
+    n_clusters = len(scores)
+    cov = XtX_inv @ scores.T @ scores @ XtX_inv * n_clusters / (n_clusters - 1) * (n - 1) / (n - p)
+
+    iq = 1 + basis_columns
+    index = [iq] + list(range(iq + 1, iq + 1 + basis_columns))
+    gradient = np.column_stack([np.ones(len(curve_basis)), curve_basis])
+    theta = gradient @ beta[index]
+    se = np.sqrt(np.einsum('ij,jk,ik->i', gradient, cov[np.ix_(index, index)], gradient))
+    t_crit = stats.t.ppf(0.975, n_clusters - 1)
+    return theta, theta - t_crit * se, theta + t_crit * se
+
+
+def fit_trajectories(cohort, iq_var_list=(DEFAULT_IQ_VAR,), factors=None):
+    """Compare the candidate trajectories of every factor and exposure by AIC.
+
+    Factors are grouped by their set of waves; the grid, the knots and the age bases of all
+    candidate models are computed once per wave set and shared by every factor and exposure.
+    Factors whose samples coincide are fitted together in one solve per candidate.
+    """
+    factors = list(outcome_ages) if factors is None else factors
+    wave_sets = {}
+    for factor in factors:
+        wave_sets.setdefault(tuple(outcome_ages[factor]), []).append(factor)
+
+    fits, curves = [], []
+    for waves, wave_factors in wave_sets.items():
+        grid = wave_grid(cohort, waves, wave_factors, iq_var_list)
+        age = grid['age'].to_numpy(float)
+        knots = np.quantile(age, np.linspace(0, 1, len(waves)))
+        models = candidate_models(waves, knots)
+        bases = {key: basis(age) for key, (basis, _) in models.items()}
+        curve_ages = np.arange(min(waves), max(waves) + CURVE_STEP / 2, CURVE_STEP)
+
+        for iq_var in iq_var_list:
+            complete = grid[[iq_var] + FACTOR_COVARIATES].notna().all(axis=1).to_numpy()
+            batches = {}
+            for factor in wave_factors:
+                sample = complete & grid[factor].notna().to_numpy()
+                batches.setdefault(np.packbits(sample).tobytes(), (sample, []))[1].append(factor)
+
+            for sample, batch_factors in batches.values():
+                z_iq = grid.loc[sample, iq_var].to_numpy(float)
+                covariates = [column for covariate in FACTOR_COVARIATES
+                              for column in indicator_columns(grid.loc[sample, covariate].to_numpy())]
+                Y = grid.loc[sample, batch_factors].to_numpy(float)
+                n, n_participants = len(Y), grid.loc[sample, 'id'].nunique()
+
+                batch_fits = []
+                for (model, spec), basis in bases.items():
+                    X = trajectory_design(basis[sample], z_iq, covariates)
+                    rss = residual_ss(X, Y)
+                    k = X.shape[1] + models[(model, spec)][1]
+                    for j, factor in enumerate(batch_factors):
+                        batch_fits.append({
+                            'Factor': factor, 'IQ_Var': iq_var, 'Model': model, 'Spec': spec,
+                            'N_Obs': n, 'N_Participants': n_participants,
+                            'Parameters': k, 'RSS': rss[j], 'AIC': n * np.log(rss[j] / n) + 2 * k,
+                        })
+                batch_df = pd.DataFrame(batch_fits)
+                fits.append(batch_df)
+
+                # IQ association along age under the best model of each factor
+                for factor, factor_fits in batch_df.groupby('Factor', sort=False):
+                    best = factor_fits.loc[factor_fits['AIC'].idxmin()]
+                    basis_fn = models[(best['Model'], best['Spec'])][0]
+                    basis = bases[(best['Model'], best['Spec'])][sample]
+                    X = trajectory_design(basis, z_iq, covariates)
+                    theta, lower, upper = iq_trajectory(
+                        X, grid.loc[sample, factor].to_numpy(float), grid.loc[sample, 'id'].to_numpy(),
+                        basis.shape[1], basis_fn(curve_ages))
+                    curves.append(pd.DataFrame({
+                        'Factor': factor, 'IQ_Var': iq_var, 'Model': best['Model'], 'Spec': best['Spec'],
+                        'Age': curve_ages, 'IQ_Association': theta, 'CI_Lower': lower, 'CI_Upper': upper,
+                    }))
+
+    fits_df = pd.concat(fits, ignore_index=True)
+    fits_df['Delta_AIC'] = fits_df['AIC'] - fits_df.groupby(['Factor', 'IQ_Var'])['AIC'].transform('min')
+    # Best specification within each model family, and the overall best model
+    fits_df['Best_In_Family'] = fits_df['AIC'] == fits_df.groupby(['Factor', 'IQ_Var', 'Model'])['AIC'].transform('min')
+    fits_df['Best'] = fits_df['Delta_AIC'] == 0
+    return fits_df, pd.concat(curves, ignore_index=True)
+
+
+def plot_trajectories(curves_df, iq_var):
+    """IQ association along age under the best model of every factor, one panel per factor."""
+    factors = list(curves_df['Factor'].unique())
+    columns = 4
+    rows = -(-len(factors) // columns)
+    fig, axes = plt.subplots(rows, columns, figsize=(5 * columns, 4 * rows), sharex=True, squeeze=False)
+    for ax, factor in zip(axes.flat, factors):
+        curve = curves_df[curves_df['Factor'] == factor]
+        ax.plot(curve['Age'], curve['IQ_Association'], color='#2ca02c', lw=2)
+        ax.fill_between(curve['Age'], curve['CI_Lower'], curve['CI_Upper'], color='#2ca02c', alpha=0.2)
+        ax.axhline(y=0, color='#7f7f7f', linestyle='--', alpha=0.6)
+        model = curve['Model'].iloc[0] + (f" ({curve['Spec'].iloc[0]})" if curve['Spec'].iloc[0] else '')
+        ax.set_title(f"{risk_factors.get(factor, factor)}\n{model}", fontsize=11)
+        ax.grid(True, alpha=0.3)
+    for ax in axes.flat[len(factors):]:
+        ax.set_visible(False)
+    fig.supxlabel('Age (years)', fontsize=14)
+    fig.supylabel('Standardised Coefficient', fontsize=14)
+    fig.suptitle(f'Best-Fitting Age Trajectories of the Association with {exposure_title(iq_var)}', fontsize=16)
+    finalise_layout()
+    save_figure(f'{FIGURES_DIR}/trajectory_models{exposure_suffix(iq_var)}.png', dpi=300, bbox_inches='tight')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare nonlinear age trajectories of the IQ associations by AIC.')
+    parser.add_argument('--data', default=COHORT_FILE, help='ALSPAC .dta extract (default: %(default)s)')
+    parser.add_argument('--iq-var', nargs='+', default=[DEFAULT_IQ_VAR],
+                        help='IQ exposures (default: %(default)s)')
+    parser.add_argument('--factors', nargs='+', choices=list(outcome_ages), help='risk factors (default: all)')
+    args = parser.parse_args()
+
+    os.makedirs(FIGURES_DIR, exist_ok=True)
+    fits_df, curves_df = fit_trajectories(load_cohort(args.data), args.iq_var, args.factors)
+    write_csv(fits_df, TRAJECTORY_MODELS_FILE, index=False)
+    write_csv(curves_df, TRAJECTORY_CURVES_FILE, index=False)
+    for iq_var, exposure_curves in curves_df.groupby('IQ_Var'):
+        if figure_selected(factors=exposure_curves['Factor'].unique()):
+            plot_trajectories(exposure_curves, iq_var)
+    flush_outputs()
+    best = fits_df[fits_df['Best']]
+    print(f"Compared {len(fits_df)} trajectory fits; best models: "
+          + ', '.join(f"{factor} ({iq_var}): {model}" for factor, iq_var, model in best[['Factor', 'IQ_Var', 'Model']].itertuples(index=False)))
@@ -0,0 +1,84 @@
+import argparse
+import glob
+import os
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+from paths import LOG_DIR
+from render import OUTPUT_MODE
+from results_store import upsert_results
+from stata_log_parser import LogFollower
+
+# Downstream scripts re-run after new results land (the aggregate tables are always rebuilt,
+# the per-factor and per-age figures only for the factors/ages that changed)
+DOWNSTREAM_SCRIPTS = [
+    'age_specific_analysis.py',
+    'cross_age_trend_analysis.py',
+    'extended_analysis_cfpwv.py',
+    'exposure_plots.py',
+    'additional_visualisations.py',
+]
+
+
+def rerun_downstream(rows_df):
+    """Re-run the downstream scripts restricted to the factors and ages in ``rows_df``."""
+    env = dict(os.environ)
+    env['CFPWV_ONLY_FACTORS'] = ','.join(sorted(rows_df['Factor'].unique()))
+    env['CFPWV_ONLY_AGES'] = ','.join(str(age) for age in sorted(rows_df['Age'].unique()))
+    scripts = list(DOWNSTREAM_SCRIPTS)
+    if OUTPUT_MODE in ('html', 'both'):
+        scripts.append('dashboard.py')
+    for script in scripts:
+        result = subprocess.run([sys.executable, script], env=env)
+        if result.returncode != 0:
+            print(f"  {script} failed with exit code {result.returncode}; continuing to watch")
+
+
+def watch(log_dir, interval, once=False, rerun=True):
+    """Tail the Stata logs and ingest each regression block as soon as it completes."""
+    followers = {}
+    while True:
+        for path in sorted(glob.glob(os.path.join(log_dir, '*.log'))):
+            if path not in followers:
+                followers[path] = LogFollower(path)
+
+        rows = []
+        for path, follower in followers.items():
+            new_rows = follower.poll()
+            for row in new_rows:
+                print(f"  {os.path.basename(path)}: {row['Factor']} age {row['Age']} "
+                      f"(coefficient = {row['Coefficient']:.4f})")
+            rows.extend(new_rows)
+
+        if rows:
+            rows_df = pd.DataFrame(rows)
+            upsert_results(rows_df)
+            print(f"Ingested {len(rows_df)} regression block(s).")
+            if rerun:
+                rerun_downstream(rows_df)
+
+        if once:
+            return
+        time.sleep(interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Watch the Stata logs and update the results incrementally.')
+    parser.add_argument('--log-dir', default=LOG_DIR,
+                        help='directory of the js_cfpwv_<exposure>.log files (default: %(default)s)')
+    parser.add_argument('--interval', type=float, default=2.0,
+                        help='seconds between polls (default: %(default)s)')
+    parser.add_argument('--once', action='store_true',
+                        help='ingest what is in the logs now and exit')
+    parser.add_argument('--no-rerun', action='store_true',
+                        help='only update the results dataset, without re-running downstream scripts')
+    args = parser.parse_args()
+
+    print(f"Watching {args.log_dir} for completed regression blocks (Ctrl-C to stop).")
+    try:
+        watch(args.log_dir, args.interval, once=args.once, rerun=not args.no_rerun)
+    except KeyboardInterrupt:
+        pass